@@ -2,45 +2,26 @@ from pysc2.agents import base_agent
 from pysc2.env import sc2_env, run_loop
 from pysc2.lib import actions, features, units
 from absl import app
-import numpy as np
-import pandas as pd
 import random
-
-class QLearningTable:
-
-    def __init__(self, actions, learning_rate=0.01, discount_factor=0.9):
-        self.actions = actions
-        self.learning_rate = learning_rate
-        self.discount_factor = discount_factor
-        self.q_table = pd.DataFrame(columns=self.actions, dtype=np.float64)
-
-    def check_if_state_exists(self, state):
-
-        if state not in self.q_table.index:
-            self.q_table = self.q_table.append(pd.Series([0] * len(self.actions),
-                                                         index=self.q_table.columns,
-                                                         name=state))
-
-    def choose_action(self, obs, epsilon = 0.9):
-        self.check_if_state_exists(obs)
-        if np.random.uniform() < epsilon:
-            state_action = self.q_table.loc[obs, :]
-            action = np.random.choice(state_action[state_action == np.max(state_action)].index) #TODO understand why index
-        else:
-            action = np.random.choice(self.actions)
-        return action
-
-    def learn(self, prev_state, action, reward, state):
-
-        self.check_if_state_exists(state)
-        q_predict = self.q_table.loc[prev_state, action]
-        if state != 'terminal':
-            q_estimate = reward + self.discount_factor * self.q_table.loc[state, :].max()
-        else:
-            q_estimate = reward
-
-        self.q_table.loc[prev_state, action] += self.learning_rate * (q_estimate - q_predict)
-
+from q_table import QLearningTable
+from state_encoding import PROTOSS_STATE_ENCODER
+from state_features import PROTOSS_STATE_FEATURES
+from unit_index import UnitIndex
+
+MINERAL_FIELD_TYPES = [
+    units.Neutral.BattleStationMineralField,
+    units.Neutral.BattleStationMineralField750,
+    units.Neutral.LabMineralField,
+    units.Neutral.LabMineralField750,
+    units.Neutral.MineralField,
+    units.Neutral.MineralField750,
+    units.Neutral.PurifierMineralField,
+    units.Neutral.PurifierMineralField750,
+    units.Neutral.PurifierRichMineralField,
+    units.Neutral.PurifierRichMineralField750,
+    units.Neutral.RichMineralField,
+    units.Neutral.RichMineralField750
+]
 
 class ProtossAgent(base_agent.BaseAgent):
 
@@ -56,9 +37,12 @@ class ProtossAgent(base_agent.BaseAgent):
         self.actions = ["build_assimilator"]
         self.pylon_coords = []
         # self.pylon_index = 0
+        self.unit_index = None
+        self.unit_index_obs = None
 
     def step(self, obs):
         super(ProtossAgent, self).step(obs)
+        self.get_unit_index(obs)
 
         if obs.first():
             nexus = self.get_my_units_by_type(obs, units.Protoss.Nexus)[0]
@@ -69,46 +53,32 @@ class ProtossAgent(base_agent.BaseAgent):
 
     # -----------------UTILITY----------------
 
-    def get_my_units_by_type(self, obs, unit_type):
+    def get_unit_index(self, obs):
+        if self.unit_index_obs is not obs:
+            self.unit_index = UnitIndex(obs.observation.raw_units)
+            self.unit_index_obs = obs
+        return self.unit_index
 
-        return [unit for unit in obs.observation.raw_units if unit.unit_type == unit_type and
-                unit.alliance == features.PlayerRelative.SELF]
+    def get_my_units_by_type(self, obs, unit_type):
+        return self.get_unit_index(obs).units(features.PlayerRelative.SELF, unit_type)
 
     def get_my_completed_units_by_type(self, obs, unit_type):
-        return [unit for unit in obs.observation.raw_units
-                if unit.unit_type == unit_type and
-                unit.build_progress == 100 and
-                unit.alliance == features.PlayerRelative.SELF]
+        return self.get_unit_index(obs).units(features.PlayerRelative.SELF, unit_type, completed=True)
 
     def get_enemy_units_by_type(self, obs, unit_type):
-        return [unit for unit in obs.observation.raw_units
-                if unit.unit_type == unit_type
-                and unit.alliance == features.PlayerRelative.ENEMY]
+        return self.get_unit_index(obs).units(features.PlayerRelative.ENEMY, unit_type)
 
     def get_enemy_completed_units_by_type(self, obs, unit_type):
-        return [unit for unit in obs.observation.raw_units
-                if unit.unit_type == unit_type
-                and unit.build_progress == 100
-                and unit.alliance == features.PlayerRelative.ENEMY]
+        return self.get_unit_index(obs).units(features.PlayerRelative.ENEMY, unit_type, completed=True)
 
-    def get_distances(self, obs, units, xy):
-        units_xy = [(unit.x, unit.y) for unit in units]
-        return np.linalg.norm(np.array(units_xy) - np.array(xy), axis=1)
+    def get_neutral_units_by_types(self, obs, unit_types):
+        return self.get_unit_index(obs).units_of_types(features.PlayerRelative.NEUTRAL, unit_types)
 
-    def select_build_worker(self, obs, x, y):
-
-        probes = self.get_my_completed_units_by_type(obs, units.Protoss.Probe)
+    def get_closest(self, obs, alliance, unit_types, xy, completed=None):
+        return self.get_unit_index(obs).closest(alliance, unit_types, xy, completed)
 
-        if probes:
-            distances_to_point = self.get_distances(obs, probes, (x, y))
-            min_index = np.argmin(distances_to_point)
-            print("min_index shape: " + str(min_index.shape))
-            # if min_index.shape :
-            probe = np.random.choice(probes[min_index])
-            # else:
-            probe = probes[min_index]
-            return probe
-        return None
+    def select_build_worker(self, obs, x, y):
+        return self.get_closest(obs, features.PlayerRelative.SELF, units.Protoss.Probe, (x, y), completed=True)
 
 
     # -----------------ACTIONS----------------
@@ -129,7 +99,10 @@ class ProtossAgent(base_agent.BaseAgent):
     def harvest_gas(self, obs):
 
         probes = self.get_my_units_by_type(obs, units.Protoss.Probe)
-        nexus = self.get_my_units_by_type(obs, units.Protoss.Nexus)[0]
+        nexuses = self.get_my_units_by_type(obs, units.Protoss.Nexus)
+        if not probes or not nexuses:
+            return actions.RAW_FUNCTIONS.no_op()
+        nexus = nexuses[0]
         idle_probes = [probe for probe in probes if probe.order_length == 0]
         extra_workers = (nexus.assigned_harvesters > nexus.ideal_harvesters)
         assimilators = self.get_my_completed_units_by_type(obs, units.Protoss.Assimilator)
@@ -148,14 +121,16 @@ class ProtossAgent(base_agent.BaseAgent):
 
     def build_assimilator(self, obs):
 
-        geysers = [unit for unit in obs.observation.raw_units if unit.unit_type in [units.Neutral.VespeneGeyser]]
-        nexus = self.get_my_units_by_type(obs, units.Protoss.Nexus)[0]
-        distances = self.get_distances(obs, geysers, (nexus.x, nexus.y))
-        geyser = geysers[np.argmin(distances)]
+        geysers = self.get_neutral_units_by_types(obs, [units.Neutral.VespeneGeyser])
+        nexuses = self.get_my_units_by_type(obs, units.Protoss.Nexus)
+        if not geysers or not nexuses:
+            return actions.RAW_FUNCTIONS.no_op()
+        nexus = nexuses[0]
+        geyser = self.get_closest(obs, features.PlayerRelative.NEUTRAL, units.Neutral.VespeneGeyser, (nexus.x, nexus.y))
 
         probe = self.select_build_worker(obs, geyser.x, geyser.y)
 
-        if obs.observation.player.minerals >= 75 and probe:
+        if obs.observation.player.minerals >= 75 and probe is not None:
             return actions.RAW_FUNCTIONS.Build_Assimilator_unit("now", probe.tag, geyser.tag)
 
         return actions.RAW_FUNCTIONS.no_op()
@@ -165,24 +140,10 @@ class ProtossAgent(base_agent.BaseAgent):
         probes = self.get_my_units_by_type(obs, units.Protoss.Probe)
         idle_probes = [probe for probe in probes if probe.order_length == 0]
         if idle_probes:
-            mineral_patches = [unit for unit in obs.observation.raw_units
-                               if unit.unit_type in [
-                                   units.Neutral.BattleStationMineralField,
-                                   units.Neutral.BattleStationMineralField750,
-                                   units.Neutral.LabMineralField,
-                                   units.Neutral.LabMineralField750,
-                                   units.Neutral.MineralField,
-                                   units.Neutral.MineralField750,
-                                   units.Neutral.PurifierMineralField,
-                                   units.Neutral.PurifierMineralField750,
-                                   units.Neutral.PurifierRichMineralField,
-                                   units.Neutral.PurifierRichMineralField750,
-                                   units.Neutral.RichMineralField,
-                                   units.Neutral.RichMineralField750
-                               ]]
             probe = random.choice(idle_probes)
-            distances = self.get_distances(obs, mineral_patches, (probe.x, probe.y))
-            patch = mineral_patches[np.argmin(distances)]
+            patch = self.get_closest(obs, features.PlayerRelative.NEUTRAL, MINERAL_FIELD_TYPES, (probe.x, probe.y))
+            if patch is None:
+                return actions.RAW_FUNCTIONS.no_op()
             return actions.RAW_FUNCTIONS.Harvest_Gather_unit("now", probe.tag, patch.tag)
         return actions.RAW_FUNCTIONS.no_op()
 
@@ -199,8 +160,7 @@ class ProtossAgent(base_agent.BaseAgent):
         if obs.observation.player.minerals >= 100 and probes and pylons_active < 3:
             pylon_xy = self.pylon_coords[pylons_active]
 
-            distances = self.get_distances(obs, probes, pylon_xy)
-            probey = probes[np.argmin(distances)]
+            probey = self.get_closest(obs, features.PlayerRelative.SELF, units.Protoss.Probe, pylon_xy)
             return actions.RAW_FUNCTIONS.Build_Pylon_pt("now", probey.tag, pylon_xy)
         return actions.RAW_FUNCTIONS.no_op()
 
@@ -212,8 +172,7 @@ class ProtossAgent(base_agent.BaseAgent):
         if (len(completed_pylons) > 0 and len(gateways) == 0 and obs.observation.player.minerals >= 150 and len(
                 probes) > 0):
             gateway_xy = (22, 21) if self.base_top_left else (35, 45)
-            distances = self.get_distances(obs, probes, gateway_xy)
-            probe = probes[np.argmin(distances)]
+            probe = self.get_closest(obs, features.PlayerRelative.SELF, units.Protoss.Probe, gateway_xy)
             return actions.RAW_FUNCTIONS.Build_Gateway_pt("now", probe.tag, gateway_xy)
         return actions.RAW_FUNCTIONS.no_op()
 
@@ -232,8 +191,7 @@ class ProtossAgent(base_agent.BaseAgent):
         zealots = self.get_my_units_by_type(obs, units.Protoss.Zealot)
         if len(zealots) > 0:
             attack_xy = (38, 44) if self.base_top_left else (19, 23)
-            distances = self.get_distances(obs, zealots, attack_xy)
-            zealot = zealots[np.argmax(distances)]
+            zealot = self.get_unit_index(obs).farthest(features.PlayerRelative.SELF, units.Protoss.Zealot, attack_xy)
             x_offset = random.randint(-4, 4)
             y_offset = random.randint(-4, 4)
             return actions.RAW_FUNCTIONS.Attack_pt("now", zealot.tag,
@@ -245,12 +203,14 @@ class rlAgent(ProtossAgent):
 
     def __init__(self):
         super(rlAgent, self).__init__()
+        self.state_encoder = PROTOSS_STATE_ENCODER
+        self.state_features = PROTOSS_STATE_FEATURES
         self.q_table = QLearningTable(self.actions)
         self.new_game()
 
     def step(self,obs):
         super(rlAgent, self).step(obs)
-        state = str(self.get_state(obs))
+        state = self.state_encoder.encode(self.get_state(obs))
         action = self.q_table.choose_action(state)
         if self.previous_action is not None:
             self.q_table.learn(self.previous_state, self.previous_action,
@@ -271,54 +231,7 @@ class rlAgent(ProtossAgent):
 
 
     def get_state(self, obs):
-
-        probes = self.get_my_units_by_type(obs, units.Protoss.Probe)
-        idle_probes = [probe for probe in probes if probe.order_length == 0]
-        nexuses = self.get_my_units_by_type(obs, units.Protoss.Nexus)
-
-        pylons = self.get_my_units_by_type(obs, units.Protoss.Pylon)
-        completed_pylons = self.get_my_completed_units_by_type(obs, units.Protoss.Pylon)
-
-        gateways = self.get_my_units_by_type(obs, units.Protoss.Gateway)
-        completed_gateways = self.get_my_completed_units_by_type(obs, units.Protoss.Gateway)
-
-        zealots = self.get_my_units_by_type(obs, units.Protoss.Zealot)
-        queued_zealots = (completed_gateways[0].order_length if len(completed_gateways) > 0 else 0)
-        free_supply = (obs.observation.player.food_cap - obs.observation.player.food_used)
-
-        can_afford_pylon_or_zealot = obs.observation.player.minerals >= 100
-        can_afford_gateway = obs.observation.player.minerals >= 150
-
-        enemy_probes = self.get_enemy_units_by_type(obs, units.Protoss.Probe)
-        enemy_nexuses = self.get_enemy_units_by_type(obs, units.Protoss.Nexus)
-
-        enemy_pylons = self.get_enemy_units_by_type(obs, units.Protoss.Pylon)
-        enemy_completed_pylons = self.get_enemy_completed_units_by_type(obs, units.Protoss.Pylon)
-
-        enemy_gateways = self.get_enemy_units_by_type(obs, units.Protoss.Gateway)
-        enemy_completed_gateways = self.get_enemy_completed_units_by_type(obs, units.Protoss.Gateway)
-
-        enemy_zealots = self.get_enemy_units_by_type(obs, units.Protoss.Zealot)
-
-        return (len(nexuses),
-                len(probes),
-                len(idle_probes),
-                len(pylons),
-                len(completed_pylons),
-                len(gateways),
-                len(completed_gateways),
-                len(zealots),
-                queued_zealots,
-                free_supply,
-                can_afford_pylon_or_zealot,
-                can_afford_gateway,
-                len(enemy_nexuses),
-                len(enemy_probes),
-                len(enemy_pylons),
-                len(enemy_completed_pylons),
-                len(enemy_gateways),
-                len(enemy_completed_gateways),
-                len(enemy_zealots))
+        return self.state_features.extract(obs)
 
 
 
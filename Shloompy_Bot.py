@@ -8,6 +8,18 @@ from sc2.ids.unit_typeid import UnitTypeId
 from sc2.ids.ability_id import AbilityId
 from sc2.ids.upgrade_id import UpgradeId
 import numpy as np
+import os
+import sys
+from step_profiler import StepProfiler, NULL_PROFILER
+from step_scheduler import StepScheduler, Subsystem, CRITICAL
+from unit_groups import UnitGroupCache
+from placement_planner import PlacementPlanner
+from warp_in import WarpInPool
+from army_ledger import ArmyLedger
+from order_diff import OrderFilter
+from command_batcher import CommandBatcher
+from map_analysis import MapAnalysis
+from build_order import BuildOrder
 
 FULL_SATURATION = 22
 
@@ -16,33 +28,93 @@ DESIRED_IMMORTAL_RATIO = 0.25
 DESIRED_ZEALOT_RATIO = 0.4
 DESIRED_STALKER_RATIO = 0.1
 MAX_PROBES = 70
+PLACEMENT_STEP = 4
+# workers closest to a build site considered by select_build_worker
+BUILD_WORKER_CANDIDATES = 8
+BUILD_ORDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_orders', 'gateway_archon.json')
 
-class Shloompy(sc2.BotAI):
+class Shloompy(BotAI):
 
-    def __init__(self):
+    def __init__(self, profiler=None, build_order=BUILD_ORDER):
         super(Shloompy)
         self.army_gather_point = None
         self.rally_updated = False
+        self.profiler = profiler or NULL_PROFILER
+        self.map_analysis = MapAnalysis(self)
+        self.groups = UnitGroupCache(self)
+        self.placement = PlacementPlanner(self)
+        self.warp_in = WarpInPool(self, self.placement)
+        self.army = ArmyLedger(self)
+        self.orders = OrderFilter()
+        self.batcher = CommandBatcher(measure=profiler is not None)
+        self.build_order = BuildOrder.from_file(self, build_order,
+                                                placements={'slot': self.build_in_slot, 'expansion': self.build_expansion},
+                                                conditions={'saturated': self.saturated})
+        self.scheduler = self.make_scheduler()
+
+    def make_scheduler(self):
+        '''
+        Declares how often each subsystem runs (in game seconds) and which ones give way when a step runs long.
+        Probes and pylons can't wait, research and build order decisions only need to change every few seconds.
+        :return: a StepScheduler over the on_step subsystems
+        '''
+        return StepScheduler([
+            Subsystem('distribute_workers', self.distribute_workers, cadence=1.0, priority=1, budget_ms=3.0),
+            Subsystem('build_probes', self.build_probes, cadence=0.0, priority=CRITICAL, budget_ms=1.0),
+            Subsystem('build_pylons', self.build_pylons, cadence=0.5, priority=CRITICAL, budget_ms=2.0),
+            Subsystem('build_assimilators', self.build_assimilators, cadence=2.0, priority=2, budget_ms=2.0),
+            Subsystem('follow_build', self.follow_build, cadence=1.0, priority=2, budget_ms=5.0),
+            Subsystem('train_army', self.train_army, cadence=0.5, priority=1, budget_ms=5.0),
+            Subsystem('research', self.research, cadence=5.0, priority=3, budget_ms=1.0),
+            Subsystem('move_army', self.move_army, cadence=0.0, priority=1, budget_ms=3.0),
+        ], profiler=self.profiler)
 
 
     async def on_step(self, iteration: int):
         '''
         A step is when the agent makes a decision. The plan is to follow a certain build order, expand when needed and
         get a large chunk of zealots, archons and immortals and attack the enemy main base.
+        Each subsystem runs at its own cadence through self.scheduler (see make_scheduler), and the commands they
+        give are regrouped by self.batcher so identical orders go out as one multi-unit action.
         :param iteration:
         :return:
         '''
-        if iteration == 0:
-            self.army_gather_point = self.main_base_ramp.protoss_wall_pylon
+        with self.profiler.phase('on_step'):
+            if iteration == 0:
+                self.army_gather_point = self.map_analysis.wall_pylon
+
+            await self.scheduler.run(self.time)
+            self.batcher.apply(self)
+
+    async def on_start(self):
+        self.map_analysis.start()
+        self.placement.start()
+
+    async def on_building_construction_started(self, unit):
+        self.placement.add_structure(unit)
+
+    async def on_building_construction_complete(self, unit):
+        self.placement.add_anchor(unit)
 
-        await self.distribute_workers()
-        await self.build_probes()
-        await self.build_pylons()
-        await self.build_assimilators()
-        await self.follow_build()
-        await self.train_army()
-        await self.research()
-        await self.move_army()
+    async def on_unit_created(self, unit):
+        self.army.on_unit_created(unit)
+
+    async def on_unit_type_changed(self, unit, previous_type):
+        self.army.on_unit_type_changed(unit, previous_type)
+
+    async def on_unit_destroyed(self, unit_tag):
+        self.placement.remove_structure(unit_tag)
+        self.army.on_unit_destroyed(unit_tag)
+        self.orders.forget(unit_tag)
+        # python-sc2 only passes the tag, a structure as last seen is still in the previous step's structure map
+        structure = self._structures_previous_map.get(unit_tag)
+        if structure is not None:
+            self.build_order.reopen(structure.type_id)
+
+    async def on_end(self, game_result):
+        self.profiler.end_game()
+        if self.batcher.measure:
+            print('command batching:', self.batcher.summary())
 
 
     ###########ACTIONS###########
@@ -69,20 +141,20 @@ class Shloompy(sc2.BotAI):
         #Build 1 pylon if we're under 60 supply
         if self.supply_used <= 60 and self.supply_left < 3:
 
-            if self.already_pending(UnitTypeId.PYLON) == 0 and self.can_afford(UnitTypeId.PYLON):
+            if self.groups.pending(UnitTypeId.PYLON) == 0 and self.can_afford(UnitTypeId.PYLON):
 
                 for nexus in self.townhalls:
 
-                    await self.build(UnitTypeId.PYLON, near= nexus.position.towards(self.game_info.map_center, np.random.choice(10)))
+                    await self.build_in_slot(UnitTypeId.PYLON, nexus)
 
         #If we're over 60 supply we can build 2 pylons at the same time
         elif self.supply_used > 60 and self.supply_left < 7:
 
-            if self.already_pending(UnitTypeId.PYLON) < 2 and self.can_afford(UnitTypeId.PYLON):
+            if self.groups.pending(UnitTypeId.PYLON) < 2 and self.can_afford(UnitTypeId.PYLON):
 
                 for nexus in self.townhalls:
 
-                    await self.build(UnitTypeId.PYLON, near= nexus.position.towards(self.game_info.map_center, np.random.choice(10)))
+                    await self.build_in_slot(UnitTypeId.PYLON, nexus)
 
     async def build_assimilators(self):
         '''
@@ -90,16 +162,19 @@ class Shloompy(sc2.BotAI):
         :return:
         '''
 
-        if (self.structures(UnitTypeId.GATEWAY).amount == 1 and not self.gas_buildings) or \
-                (self.structures(UnitTypeId.GATEWAY).amount == 2):
+        if (self.groups.structures(UnitTypeId.GATEWAY).amount == 1 and not self.gas_buildings) or \
+                (self.groups.structures(UnitTypeId.GATEWAY).amount == 2):
             for nexus in self.townhalls.ready:
-                geyser = self.vespene_geyser.closer_than(15,nexus).random
+                geysers = self.groups.spatial('vespene_geyser').closer_than(15, nexus.position)
+                if not geysers:
+                    continue
+                geyser = geysers.random
 
                 if self.can_afford(UnitTypeId.ASSIMILATOR):
                     worker = self.select_build_worker(geyser.position)
                     if worker is None:
                         break
-                    if not self.gas_buildings or not self.gas_buildings.closer_than(1, geyser):
+                    if not self.groups.spatial('gas_buildings').closer_than(1, geyser.position):
                         worker.build(UnitTypeId.ASSIMILATOR, geyser)
                         worker.stop(queue=True)
 
@@ -107,108 +182,71 @@ class Shloompy(sc2.BotAI):
 
     async def follow_build(self):
         '''
-        Follows a scripted build order:
+        Follows the build order in self.build_order (build_orders/gateway_archon.json by default):
 
-        Pylon
         Gateway
         Cybernetics Core
         Gateway
         Expansion at Natural
         Robotics Facility
         Twilight Council
-        Forge
+        Forge x2
         Gateway x2
         Templar Archives
+        Expansions up to 4 bases
         Gateway x12
         :return:
         '''
+        await self.build_order.step()
 
-        STEP = 4
-
-        if self.structures(UnitTypeId.PYLON).ready:
-            pylon = self.structures(UnitTypeId.PYLON).ready.random
-
-            #build cybernetics core if first gate is completed
-            if self.already_pending(UnitTypeId.GATEWAY) == 1 and not self.structures(UnitTypeId.CYBERNETICSCORE):
-                if self.can_afford(UnitTypeId.CYBERNETICSCORE) and not self.already_pending(UnitTypeId.CYBERNETICSCORE):
-                    await self.build(UnitTypeId.CYBERNETICSCORE, near= pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
-
-            else:
-
-                #build gateways up to 2
-                if (self.can_afford(UnitTypeId.GATEWAY) and
-                self.structures(UnitTypeId.GATEWAY).amount + self.already_pending(UnitTypeId.GATEWAY) < 2):
-
-                    await self.build(UnitTypeId.GATEWAY, near=pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
-                    # await self.set_rally_points()
-
-
-
-                #expand
-                if (self.can_afford(UnitTypeId.NEXUS)
-                    and self.structures(UnitTypeId.CYBERNETICSCORE)
-                    and self.workers.amount > self.townhalls.amount * FULL_SATURATION - 6
-                    and self.structures(UnitTypeId.NEXUS).amount < 4):
-
-                    #Set army_gather_point to the natural ramp in order to defend the base
-                    first_nexus = self.townhalls.first
-                    natural_ramp = sorted(self.game_info.map_ramps, key= lambda ramp: ramp.top_center.distance_to(first_nexus))
-                    self.army_gather_point = natural_ramp[1].top_center
-                    await self.expand_now()
-
-
-                #build robo facility
-                elif (self.can_afford(UnitTypeId.ROBOTICSFACILITY)
-                    and self.structures(UnitTypeId.WARPGATE).amount + self.structures(UnitTypeId.GATEWAY).amount < 3
-                    and not self.structures(UnitTypeId.ROBOTICSFACILITY)
-                    and not self.already_pending(UnitTypeId.ROBOTICSFACILITY)
-                    and self.structures(UnitTypeId.NEXUS).amount > 1):
-
-                    await self.build(UnitTypeId.ROBOTICSFACILITY, near= pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
-                    #todo set robo rally point?
-
-
-                #build twilight council
-                elif (self.can_afford(UnitTypeId.TWILIGHTCOUNCIL)
-                    and self.structures(UnitTypeId.ROBOTICSFACILITY).ready
-                    and not self.structures(UnitTypeId.TWILIGHTCOUNCIL)
-                    and not self.already_pending(UnitTypeId.TWILIGHTCOUNCIL)):
+    def saturated(self):
+        return self.workers.amount > self.townhalls.amount * FULL_SATURATION - 6
 
-                    await self.build(UnitTypeId.TWILIGHTCOUNCIL,near= pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
-
-                #build forge
-                elif (self.can_afford(UnitTypeId.FORGE)
-                    and (self.structures(UnitTypeId.TWILIGHTCOUNCIL).ready or self.already_pending(UnitTypeId.TWILIGHTCOUNCIL))
-                    and self.structures(UnitTypeId.FORGE).amount < 2
-                    and self.already_pending(UnitTypeId.FORGE) < 2):
-
-                    await self.build(UnitTypeId.FORGE, near= pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
-
-                #add 2 more gates
-                elif (self.can_afford(UnitTypeId.GATEWAY) and
-                        self.structures(UnitTypeId.WARPGATE).amount + self.structures(UnitTypeId.GATEWAY).amount < 4
-                        and self.structures(UnitTypeId.FORGE).ready):
-
-                    await self.build(UnitTypeId.GATEWAY, near=pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
-
-
-                #build templar archives
-                elif (self.can_afford(UnitTypeId.TEMPLARARCHIVE)
-                      and self.structures(UnitTypeId.TWILIGHTCOUNCIL).ready
-                      and not self.structures(UnitTypeId.TEMPLARARCHIVE)
-                      and not self.already_pending(UnitTypeId.TEMPLARARCHIVE)):
-
-                    await self.build(UnitTypeId.TEMPLARARCHIVE,
-                                     near=pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
-
-                #go to 12 gates
-                elif (self.structures(UnitTypeId.TEMPLARARCHIVE).ready
-                    and self.can_afford(UnitTypeId.GATEWAY)
-                    and self.structures(UnitTypeId.WARPGATE).amount + self.structures(UnitTypeId.GATEWAY).amount < 12
-                    and self.structures(UnitTypeId.NEXUS).amount > 2):
-
-                    await self.build(UnitTypeId.GATEWAY, near=pylon.position.towards(self.game_info.map_center, np.random.choice(3)),placement_step= STEP)
+    async def build_expansion(self, building):
+        '''
+        Expands to the closest free base and sets army_gather_point to the natural ramp in order to defend it.
+        '''
+        self.army_gather_point = self.map_analysis.natural_ramp
+        await self.expand_now(building, location=self.map_analysis.next_expansion())
 
+    async def build_in_slot(self, building, townhall=None):
+        '''
+        Builds on a free slot of the placement planner, so no placement query is sent to the engine. Falls back to
+        self.build near a random pylon when the planner has no slot left.
+        :param building: UnitTypeId of the structure
+        :param townhall: for pylons, the nexus to build next to
+        :return:
+        '''
+        position = self.placement.take(building, townhall)
+        if position is not None:
+            worker = self.select_build_worker(position)
+            if worker is None:
+                self.placement.release(position, building)
+                return
+            worker.build(building, position)
+        elif building == UnitTypeId.PYLON:
+            near = (townhall or self.townhalls.random).position
+            await self.build(building, near=near.towards(self.game_info.map_center, np.random.choice(10)))
+        elif self.groups.ready(UnitTypeId.PYLON):
+            pylon = self.groups.ready(UnitTypeId.PYLON).random
+            await self.build(building, near=pylon.position.towards(self.game_info.map_center, np.random.choice(3)),
+                             placement_step=PLACEMENT_STEP)
+
+    def select_build_worker(self, pos, force=False):
+        '''
+        Like BotAI.select_build_worker, but only the workers closest to pos are looked at, through the per-step
+        worker grid. Idle workers are preferred over gathering ones at about the same distance.
+        :return: a worker free to build, or a random worker if force is set, None otherwise
+        '''
+        workers = self.groups.spatial('workers')
+        candidates = workers.nearest(pos, BUILD_WORKER_CANDIDATES)
+        for worker in sorted(candidates, key=lambda worker: not worker.is_idle):
+            if worker.tag in self.unit_tags_received_action or not (worker.is_gathering or worker.is_idle):
+                continue
+            if not worker.orders or (len(worker.orders) == 1 and worker.orders[0].ability.id in
+                                     {AbilityId.MOVE, AbilityId.HARVEST_GATHER}):
+                return worker
+        return workers.units.random if force and workers.units else None
 
     # async def set_rally_points(self):
     #
@@ -229,9 +267,9 @@ class Shloompy(sc2.BotAI):
         Builds units until Warpgate research is done
         :return:
         '''
-        for gw in self.structures(UnitTypeId.GATEWAY).ready.idle:
+        for gw in self.groups.idle(UnitTypeId.GATEWAY):
 
-            if self.can_afford(UnitTypeId.SENTRY) and (self.units(UnitTypeId.STALKER).amount > 1 or self.already_pending(UnitTypeId.STALKER)) and self.units(UnitTypeId.SENTRY).amount == 0:
+            if self.can_afford(UnitTypeId.SENTRY) and (self.army.count(UnitTypeId.STALKER) > 1 or self.groups.pending(UnitTypeId.STALKER)) and self.army.count(UnitTypeId.SENTRY) == 0:
                     gw.train(UnitTypeId.SENTRY)
 
             elif self.can_afford(UnitTypeId.STALKER):
@@ -252,11 +290,11 @@ class Shloompy(sc2.BotAI):
 
         :return:
         '''
-        if self.already_pending_upgrade(UpgradeId.WARPGATERESEARCH) > 0:
+        if self.groups.pending_upgrade(UpgradeId.WARPGATERESEARCH) > 0:
             return
         else:
             if self.can_afford(AbilityId.RESEARCH_WARPGATE):
-                ccs = self.structures(UnitTypeId.CYBERNETICSCORE).ready
+                ccs = self.groups.ready(UnitTypeId.CYBERNETICSCORE)
                 for cc in ccs:
                     cc.research(UpgradeId.WARPGATERESEARCH)
 
@@ -265,12 +303,12 @@ class Shloompy(sc2.BotAI):
 
         :return:
         '''
-        tcs = self.structures(UnitTypeId.TWILIGHTCOUNCIL).ready
+        tcs = self.groups.ready(UnitTypeId.TWILIGHTCOUNCIL)
         for tc in tcs:
-            if self.can_afford(AbilityId.RESEARCH_CHARGE) and not self.already_pending_upgrade(UpgradeId.CHARGE):
+            if self.can_afford(AbilityId.RESEARCH_CHARGE) and not self.groups.pending_upgrade(UpgradeId.CHARGE):
                 tc.research(UpgradeId.CHARGE)
 
-            elif self.already_pending_upgrade(UpgradeId.CHARGE) == 1 and self.can_afford(AbilityId.RESEARCH_BLINK):
+            elif self.groups.pending_upgrade(UpgradeId.CHARGE) == 1 and self.can_afford(AbilityId.RESEARCH_BLINK):
                 tc.research(UpgradeId.BLINKTECH)
 
     async def forge_research(self):
@@ -278,16 +316,16 @@ class Shloompy(sc2.BotAI):
         Upgrades ground weapons first, then ground armor.
         :return:
         '''
-        forges = self.structures(UnitTypeId.FORGE).ready
+        forges = self.groups.ready(UnitTypeId.FORGE)
         if not forges:
             return
-        w1 = self.already_pending_upgrade(UpgradeId.PROTOSSGROUNDWEAPONSLEVEL1)
-        w2 = self.already_pending_upgrade(UpgradeId.PROTOSSGROUNDWEAPONSLEVEL2)
-        w3 = self.already_pending_upgrade(UpgradeId.PROTOSSGROUNDWEAPONSLEVEL3)
+        w1 = self.groups.pending_upgrade(UpgradeId.PROTOSSGROUNDWEAPONSLEVEL1)
+        w2 = self.groups.pending_upgrade(UpgradeId.PROTOSSGROUNDWEAPONSLEVEL2)
+        w3 = self.groups.pending_upgrade(UpgradeId.PROTOSSGROUNDWEAPONSLEVEL3)
 
-        a1 = self.already_pending_upgrade(UpgradeId.PROTOSSGROUNDARMORSLEVEL1)
-        a2 = self.already_pending_upgrade(UpgradeId.PROTOSSGROUNDARMORSLEVEL2)
-        a3 = self.already_pending_upgrade(UpgradeId.PROTOSSGROUNDARMORSLEVEL3)
+        a1 = self.groups.pending_upgrade(UpgradeId.PROTOSSGROUNDARMORSLEVEL1)
+        a2 = self.groups.pending_upgrade(UpgradeId.PROTOSSGROUNDARMORSLEVEL2)
+        a3 = self.groups.pending_upgrade(UpgradeId.PROTOSSGROUNDARMORSLEVEL3)
 
         for forge in forges:
             if forge.is_idle:
@@ -327,57 +365,34 @@ class Shloompy(sc2.BotAI):
                     else:
                         return
 
-    async def select_warp_in_pylon(self):
-        """
-        selects the outermost nexus and finds a pylon closest to it
-        :return: the selected pylon Unit ID
-        """
-        last_nexus = self.townhalls[-1]
-        pylons = sorted(self.structures(UnitTypeId.PYLON).ready, key= lambda py: py.distance_to(last_nexus))
-        if pylons:
-            return pylons[0]
-
-        return None
-
     async def warp_in_unit(self, AID, UID):
         """
-
+        Warps UID in from every warpgate that can, at free points of the pylons closest to the outermost nexus.
+        Abilities of all warpgates come from one batched query per step (see WarpInPool).
         :param AID: Ability ID of warping in the unit (for warpgate)
         :param UID: Unit ID (for warp in command)
         :return:
         """
-
-        for warpgate in self.structures(UnitTypeId.WARPGATE).ready:
-            abilities = await self.get_available_abilities(warpgate)
-
-            if AID in abilities:
-                pylon = await self.select_warp_in_pylon()
-                if pylon is None:
-                    return
-                pos = pylon.position.random_on_distance(4)
-                placement = await self.find_placement(AID, pos, placement_step= 1)
-                if placement is None:
-                    print("Can't find warp in placement")
-                    return
-                warpgate.warp_in(UID, placement)
+        warpgates = await self.warp_in.ready_warpgates(AID)
+        points = self.warp_in.take_points(len(warpgates))
+        if len(points) < len(warpgates):
+            print("Can't find warp in placement")
+        for warpgate, point in zip(warpgates, points):
+            warpgate.warp_in(UID, point)
+            self.warp_in.use(warpgate)
 
     async def evaluate_army_composition(self):
         '''
         Evaluates how much of each unit we have in the army. The agent builds units according to a predetermined
         army composition ( A ratio of Immortals, Archons, Zealots, Stalkers)
+        Reads the ArmyLedger kept by the unit lifecycle hooks, so the army isn't rescanned.
         :return:
         '''
-        army = self.units.not_structure.exclude_type(UnitTypeId.PROBE)
-        army_size = army.amount
-        archon_size = army(UnitTypeId.ARCHON).ready.amount
-        immortal_size = army(UnitTypeId.IMMORTAL).amount
-        zealot_size = army(UnitTypeId.ZEALOT).amount
-        stalker_size = army(UnitTypeId.STALKER).amount
-
-        archon_ratio = 0 if archon_size == 0 else archon_size / army_size
-        immortal_ratio = 0 if immortal_size == 0 else immortal_size / army_size
-        zealot_ratio = 0 if zealot_size == 0 else zealot_size / army_size
-        stalker_ratio = 0 if stalker_size == 0 else stalker_size / army_size
+        army = self.army
+        archon_ratio = army.ratio(UnitTypeId.ARCHON)
+        immortal_ratio = army.ratio(UnitTypeId.IMMORTAL)
+        zealot_ratio = army.ratio(UnitTypeId.ZEALOT)
+        stalker_ratio = army.ratio(UnitTypeId.STALKER)
         # print("army size " + str(army_size) + ", archons " + str(archon_size) + ", immorties " + str(immortal_size) + ", zealotbois " + str(zealot_size) + ", stalkers " + str(stalker_size))
         return [archon_ratio, stalker_ratio, zealot_ratio, immortal_ratio]
 
@@ -388,66 +403,71 @@ class Shloompy(sc2.BotAI):
         :return:
         '''
 
-        if self.structures(UnitTypeId.GATEWAY).ready.idle:
+        if self.groups.idle(UnitTypeId.GATEWAY):
             await self.build_starter_units()
 
-        templars = self.units(UnitTypeId.HIGHTEMPLAR)
+        templars = self.groups.units(UnitTypeId.HIGHTEMPLAR)
         for ht in templars:
             ht(AbilityId.MORPH_ARCHON)
 
         archon_ratio, stalker_ratio, zealot_ratio, immortal_ratio = await self.evaluate_army_composition()
 
-        if self.can_afford(UnitTypeId.OBSERVER) and self.already_pending(UnitTypeId.OBSERVER) == 0 and self.units(UnitTypeId.OBSERVER).amount == 0:
-            if self.structures(UnitTypeId.ROBOTICSFACILITY).ready.idle:
-                self.structures(UnitTypeId.ROBOTICSFACILITY).random.train(UnitTypeId.OBSERVER)
+        if self.can_afford(UnitTypeId.OBSERVER) and self.groups.pending(UnitTypeId.OBSERVER) == 0 and self.army.count(UnitTypeId.OBSERVER) == 0:
+            if self.groups.idle(UnitTypeId.ROBOTICSFACILITY):
+                self.groups.structures(UnitTypeId.ROBOTICSFACILITY).random.train(UnitTypeId.OBSERVER)
 
         if immortal_ratio < DESIRED_IMMORTAL_RATIO:
-            if self.structures(UnitTypeId.ROBOTICSFACILITY).ready:
-                for rf in self.structures(UnitTypeId.ROBOTICSFACILITY).idle:
+            if self.groups.ready(UnitTypeId.ROBOTICSFACILITY):
+                for rf in self.groups.idle(UnitTypeId.ROBOTICSFACILITY):
                     if self.can_afford(UnitTypeId.IMMORTAL):
                         rf.train(UnitTypeId.IMMORTAL)
 
         if  archon_ratio < DESIRED_ARCHON_RATIO:
 
-            if self.structures(UnitTypeId.WARPGATE).ready.idle:
+            if self.groups.idle(UnitTypeId.WARPGATE):
                 if self.can_afford(UnitTypeId.HIGHTEMPLAR):
                     await self.warp_in_unit(AbilityId.WARPGATETRAIN_HIGHTEMPLAR, UnitTypeId.HIGHTEMPLAR)
 
-        if stalker_ratio < DESIRED_STALKER_RATIO or not self.structures(UnitTypeId.ROBOTICSFACILITY):
+        if stalker_ratio < DESIRED_STALKER_RATIO or not self.groups.structures(UnitTypeId.ROBOTICSFACILITY):
             if self.can_afford(UnitTypeId.STALKER):
                 await self.warp_in_unit(AbilityId.WARPGATETRAIN_STALKER, UnitTypeId.STALKER)
 
         if zealot_ratio < DESIRED_ZEALOT_RATIO:
-            if self.can_afford(UnitTypeId.ZEALOT) and self.already_pending_upgrade(UpgradeId.CHARGE) == 1:
+            if self.can_afford(UnitTypeId.ZEALOT) and self.groups.pending_upgrade(UpgradeId.CHARGE) == 1:
                 await self.warp_in_unit(AbilityId.WARPGATETRAIN_ZEALOT, UnitTypeId.ZEALOT)
 
 
     async def move_army(self):
         '''
         A simple army management function. If army supply < 80 we move all units to the army_gather_point. Otherwise we
-        attack the enemy position
+        attack the enemy position. Commands go through self.orders, so units already doing the same thing are skipped.
         :return:
         '''
-        army = self.units.not_structure.exclude_type(UnitTypeId.PROBE)
+        army = self.groups.army()
 
         if self.supply_army > 80:
             for unit in army:
                 if unit.type_id == UnitTypeId.HIGHTEMPLAR:
-                    unit(AbilityId.MORPH_ARCHON)
+                    self.orders.issue(unit, AbilityId.MORPH_ARCHON)
                 else:
-                    unit.attack(self.enemy_start_locations[0])
+                    self.orders.issue(unit, AbilityId.ATTACK, self.enemy_start_locations[0])
 
         else:
             if int(self.time) % 12 == 0:
 
                 for unit in army:
-                    unit.move(self.army_gather_point)
+                    self.orders.issue(unit, AbilityId.MOVE, self.army_gather_point)
 
-def main():
+def main(profile=False):
+    '''
+    :param profile: write per-game on_step phase timings and a Chrome trace to ./profiles
+    '''
+    profiler = StepProfiler('Shloompy', 'profiles', trace=True) if profile else None
     sc2.run_game(
         sc2.maps.get("AbyssalReefLE"),
-        [Bot(sc2.Race.Protoss, Shloompy()), Computer(sc2.Race.Terran, sc2.Difficulty.Hard)],
+        [Bot(sc2.Race.Protoss, Shloompy(profiler)), Computer(sc2.Race.Terran, sc2.Difficulty.Hard)],
         realtime=False
     )
 
-main()
+if __name__ == "__main__":
+    main(profile="--profile" in sys.argv[1:])
@@ -0,0 +1,55 @@
+from sc2.ids.unit_typeid import UnitTypeId
+
+
+class ArmyLedger:
+    '''
+    Incremental count and supply of the bot's army (every own non-structure unit except probes), kept up to date
+    by python-sc2's unit lifecycle hooks in O(1) per event instead of rescanning the army every step.
+    A High Templar that starts morphing into an Archon is counted as an Archon from on_unit_type_changed on;
+    its merge partner leaves through on_unit_destroyed.
+    '''
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.types = {}
+        self.counts = {}
+        self.size = 0
+        self.supply = 0.0
+
+    def _is_army(self, unit):
+        return not unit.is_structure and unit.type_id != UnitTypeId.PROBE
+
+    def _add(self, tag, type_id):
+        self.types[tag] = type_id
+        self.counts[type_id] = self.counts.get(type_id, 0) + 1
+        self.size += 1
+        self.supply += self.bot.calculate_supply_cost(type_id)
+
+    def _remove(self, tag):
+        type_id = self.types.pop(tag)
+        self.counts[type_id] -= 1
+        self.size -= 1
+        self.supply -= self.bot.calculate_supply_cost(type_id)
+
+    def on_unit_created(self, unit):
+        if unit.tag not in self.types and self._is_army(unit):
+            self._add(unit.tag, unit.type_id)
+
+    def on_unit_destroyed(self, unit_tag):
+        if unit_tag in self.types:
+            self._remove(unit_tag)
+
+    def on_unit_type_changed(self, unit, previous_type):
+        if unit.tag in self.types:
+            self._remove(unit.tag)
+        if self._is_army(unit):
+            self._add(unit.tag, unit.type_id)
+
+    def count(self, type_id):
+        return self.counts.get(type_id, 0)
+
+    def ratio(self, type_id):
+        '''
+        :return: share of type_id in the army by unit count, 0 for an empty army
+        '''
+        return self.counts.get(type_id, 0) / self.size if self.size else 0
@@ -0,0 +1,361 @@
+from pysc2.env import environment
+from pysc2.lib import actions, units
+from absl import app, flags
+from collections import namedtuple
+import asyncio
+import json
+import lzma
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from fake_sc2_env import FakeSC2Env, SELF, ENEMY
+from q_table import QLearningTable
+import pysc2_bot
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer("benchmark_steps", 2000, "Timed calls per benchmark.")
+flags.DEFINE_integer("benchmark_alloc_steps", 300, "Calls per benchmark traced for allocations.")
+flags.DEFINE_integer("benchmark_growth_states", 200000, "New states inserted by the Q-table growth benchmark.")
+flags.DEFINE_integer("benchmark_seed", 0, "Seed for the synthetic observations and the agents.")
+flags.DEFINE_string("benchmark_output", None, "JSON file for the results, printed to stdout when unset.")
+flags.DEFINE_integer("benchmark_army_size", 160, "Units given army-wide orders by the command batching benchmark.")
+flags.DEFINE_list("shloompy_observations", [],
+                  "Recorded python-sc2 observations to run Shloompy.on_step on: lzma pickles of "
+                  "(ResponseData, ResponseGameInfo, ResponseObservation), the format of python-sc2's test data. "
+                  "Shloompy runs on the synthetic scenarios when unset.")
+
+# units per side on top of the fake env's starting nexus and 12 probes, the late game is 200 supply
+Scenario = namedtuple('Scenario', ['name', 'probes', 'zealots', 'stalkers', 'pylons', 'gateways'])
+SCENARIOS = [
+    Scenario('early', 16, 2, 0, 1, 1),
+    Scenario('mid', 40, 10, 10, 6, 4),
+    Scenario('late', 70, 30, 35, 14, 10),
+]
+OBSERVATIONS_PER_SCENARIO = 32
+WARMUP_STEPS = 50
+
+
+def scenario_env(scenario, seed=0):
+    '''
+    :return: a reset FakeSC2Env with the scenario's units added to both sides
+    '''
+    env = FakeSC2Env(seed=seed)
+    env.reset()
+    for alliance in (SELF, ENEMY):
+        nexus = env.sides[alliance].nexuses[0]
+        extra = [(units.Protoss.Probe, scenario.probes - 12, 3), (units.Protoss.Zealot, scenario.zealots, 6),
+                 (units.Protoss.Stalker, scenario.stalkers, 6), (units.Protoss.Pylon, scenario.pylons, 8),
+                 (units.Protoss.Gateway, scenario.gateways, 10)]
+        for unit_type, amount, distance in extra:
+            for _ in range(max(amount, 0)):
+                env.add_unit(unit_type, alliance, env.near(nexus, distance))
+    return env
+
+
+def synthetic_observations(scenario, count=OBSERVATIONS_PER_SCENARIO, seed=0):
+    '''
+    Records `count` consecutive timesteps of the scenario's env, so agents see slowly changing states instead of
+    one frozen observation.
+    :return: list of TimeSteps, the first one of step type FIRST
+    '''
+    env = scenario_env(scenario, seed)
+    observations = [env.timesteps(environment.StepType.FIRST, 0)[0]]
+    while len(observations) < count:
+        timestep = env.step([actions.RAW_FUNCTIONS.no_op()])[0]
+        if timestep.last():
+            break
+        observations.append(timestep)
+    return observations
+
+
+def latency_stats(seconds):
+    micros = np.asarray(seconds) * 1e6
+    return {'calls': len(micros),
+            'p50_us': float(np.percentile(micros, 50)),
+            'p99_us': float(np.percentile(micros, 99)),
+            'mean_us': float(micros.mean()),
+            'max_us': float(micros.max())}
+
+
+def measure(step, steps, alloc_steps, prepare=None):
+    '''
+    Times step(i) for i in range(steps), then reruns alloc_steps calls under tracemalloc. prepare(i), when given,
+    runs before every call outside the timed region.
+    :return: dict of latency percentiles in microseconds and per-call allocation stats
+    '''
+    def call(i):
+        if prepare is not None:
+            prepare(i)
+        start = time.perf_counter()
+        step(i)
+        return time.perf_counter() - start
+
+    for i in range(WARMUP_STEPS):
+        call(i)
+    result = latency_stats([call(WARMUP_STEPS + i) for i in range(steps)])
+
+    # peak is the largest amount of memory allocated at once inside the call, retained is what it kept
+    peaks = np.zeros(alloc_steps)
+    retained = np.zeros(alloc_steps)
+    blocks = np.zeros(alloc_steps)
+    tracemalloc.start()
+    try:
+        for i in range(alloc_steps):
+            if prepare is not None:
+                prepare(i)
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            before_blocks = sys.getallocatedblocks()
+            step(i)
+            current, peak = tracemalloc.get_traced_memory()
+            blocks[i] = sys.getallocatedblocks() - before_blocks
+            peaks[i] = peak - before
+            retained[i] = current - before
+    finally:
+        tracemalloc.stop()
+    if alloc_steps:
+        result.update({'peak_alloc_bytes_p50': float(np.percentile(peaks, 50)),
+                       'peak_alloc_bytes_p99': float(np.percentile(peaks, 99)),
+                       'retained_bytes_mean': float(retained.mean()),
+                       'retained_blocks_mean': float(blocks.mean())})
+    return result
+
+
+def benchmark_agent(name, agent, observations, steps, alloc_steps):
+    agent.setup(FakeSC2Env().observation_spec(), FakeSC2Env().action_spec())
+    agent.reset()
+    agent.step(observations[0])
+    mid = observations[1:] or observations
+
+    def step(i):
+        agent.step(mid[i % len(mid)])
+
+    result = measure(step, steps, alloc_steps)
+    result.update({'benchmark': name, 'raw_units': int(np.mean([len(obs.observation.raw_units) for obs in mid]))})
+    return result
+
+
+def benchmark_env(steps, seed=0, enemy_attack_loop=13440):
+    '''
+    Steps FakeSC2Env on no_op alone, starting the next game whenever one ends, to time the environment without an
+    agent. An earlier enemy_attack_loop puts more of the steps into fights.
+    '''
+    env = FakeSC2Env(seed=seed, enemy_attack_loop=enemy_attack_loop)
+    env.reset()
+    no_op = [actions.RAW_FUNCTIONS.no_op()]
+
+    def step(i):
+        if env.step(no_op)[0].last():
+            env.reset()
+
+    result = measure(step, steps, 0)
+    result.update({'benchmark': 'FakeSC2Env.step', 'enemy_attack_loop': enemy_attack_loop,
+                   'steps_per_second': 1e6 / result['mean_us']})
+    return result
+
+
+def benchmark_q_table(states, steps, alloc_steps):
+    actions_list = pysc2_bot.ProtossAgent().actions
+    table = QLearningTable(actions_list)
+    for state in states:
+        table.check_if_state_exists(state)
+
+    def choose(i):
+        table.choose_action(states[i % len(states)])
+
+    def learn(i):
+        table.learn(states[i % len(states)], actions_list[i % len(actions_list)], 0.0,
+                    states[(i + 1) % len(states)])
+
+    results = []
+    for name, step in (('QLearningTable.choose_action', choose), ('QLearningTable.learn', learn)):
+        result = measure(step, steps, alloc_steps)
+        result.update({'benchmark': name, 'states': len(table)})
+        results.append(result)
+    return results
+
+
+def benchmark_q_table_growth(new_states, seed=0):
+    '''
+    Inserts new_states unseen states into an empty table, timing every insert, so the cost of the geometric
+    regrowth shows up in p99/max and in grow_seconds.
+    '''
+    table = QLearningTable(pysc2_bot.ProtossAgent().actions)
+    keys = np.random.RandomState(seed).permutation(new_states).tolist()
+    seconds = np.zeros(new_states)
+    grew = np.zeros(new_states, dtype=bool)
+    for i, key in enumerate(keys):
+        capacity = table.capacity
+        start = time.perf_counter()
+        table.check_if_state_exists(key)
+        seconds[i] = time.perf_counter() - start
+        grew[i] = table.capacity != capacity
+    result = latency_stats(seconds)
+    result.update({'benchmark': 'QLearningTable.check_if_state_exists (new states)',
+                   'states': len(table),
+                   'capacity': table.capacity,
+                   'grows': int(grew.sum()),
+                   'grow_seconds': float(seconds[grew].sum()),
+                   'total_seconds': float(seconds.sum()),
+                   'table_bytes': int(table.q_values.nbytes)})
+    return result
+
+
+def load_recording(path):
+    '''
+    :return: (ResponseData, ResponseGameInfo, ResponseObservation) responses from an lzma pickle
+    '''
+    with lzma.open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def benchmark_shloompy(name, recorded, steps, alloc_steps):
+    '''
+    Starts Shloompy on a recorded observation with an OfflineClient, on_start included, then times on_step. Every
+    call gets a fresh GameState with an advanced game loop, so python-sc2's once-per-frame caches are rebuilt like
+    in a real game.
+    :param recorded: (game data, game info, observation) responses, see load_recording and offline_sc2.recording
+    '''
+    from sc2.game_state import GameState
+    from Shloompy_Bot import Shloompy
+    import offline_sc2
+
+    unused_game_data, raw_game_info, raw_observation = recorded
+    bot = Shloompy()
+    # the map analysis is part of on_start, not of what's measured, and shouldn't leave cache files behind
+    bot.map_analysis.cache_dir = None
+    loop = asyncio.new_event_loop()
+
+    def prepare(i):
+        raw_observation.observation.game_loop += 1
+        bot._prepare_step(state=GameState(raw_observation), proto_game_info=raw_game_info)
+        bot.actions.clear()
+        bot.unit_tags_received_action.clear()
+
+    def step(i):
+        loop.run_until_complete(bot.on_step(i))
+
+    try:
+        offline_sc2.start_bot(bot, recorded, loop)
+        prepare(0)
+        step(0)
+        result = measure(lambda i: step(i + 1), steps, alloc_steps, prepare)
+    finally:
+        loop.close()
+    result.update({'benchmark': 'Shloompy.on_step', 'observation': name,
+                   'units': len(bot.all_units), 'supply_used': bot.supply_used})
+    return result
+
+
+def benchmark_command_batching(army_size, steps, seed=0):
+    '''
+    Orders an army the way Shloompy.move_army does, one unit at a time: High Templar (every fourth unit) morph
+    into Archons, everybody else attack-moves to one point. Compares what python-sc2 sends for those commands
+    as given and after CommandBatcher.regroup.
+    '''
+    from types import SimpleNamespace
+    from s2clientprotocol import common_pb2, raw_pb2
+    from sc2.ids.ability_id import AbilityId
+    from sc2.ids.unit_typeid import UnitTypeId
+    from sc2.position import Point2
+    from sc2.unit import Unit
+    from sc2.unit_command import UnitCommand
+    from command_batcher import CommandBatcher
+
+    rng = np.random.RandomState(seed)
+    bot = SimpleNamespace(state=SimpleNamespace(game_loop=0))
+    units = []
+    for i in range(army_size):
+        type_id = UnitTypeId.HIGHTEMPLAR if i % 4 == 3 else UnitTypeId.ZEALOT
+        x, y = rng.uniform(20, 60, 2)
+        units.append(Unit(raw_pb2.Unit(tag=i + 1, unit_type=type_id.value, owner=1, alliance=1,
+                                       pos=common_pb2.Point(x=x, y=y)), bot))
+    target = Point2((150.5, 140.5))
+    commands = [UnitCommand(AbilityId.MORPH_ARCHON, unit) if unit.type_id == UnitTypeId.HIGHTEMPLAR
+                else UnitCommand(AbilityId.ATTACK, unit, target) for unit in units]
+
+    batcher = CommandBatcher()
+    seconds = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        regrouped = batcher.regroup(commands)
+        seconds.append(time.perf_counter() - start)
+    before = batcher.action_stats(commands)
+    after = batcher.action_stats(regrouped)
+    result = latency_stats(seconds)
+    result.update({'benchmark': 'CommandBatcher.regroup', 'army_size': army_size, 'commands': len(commands),
+                   'actions': {'before': before[0], 'after': after[0]},
+                   'request_bytes': {'before': before[1], 'after': after[1]}})
+    return result
+
+
+def revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(steps, alloc_steps, growth_states, shloompy_observations=(), seed=0, army_size=160):
+    '''
+    :return: a JSON-serializable dict with environment info and one entry per benchmark
+    '''
+    results = []
+    states = []
+    for scenario in SCENARIOS:
+        observations = synthetic_observations(scenario, seed=seed)
+        for name, factory in (('RandomAgent.step', pysc2_bot.RandomAgent), ('rlAgent.step', pysc2_bot.rlAgent)):
+            random.seed(seed)
+            np.random.seed(seed)
+            agent = factory()
+            result = benchmark_agent(name, agent, observations, steps, alloc_steps)
+            result['scenario'] = scenario.name
+            results.append(result)
+            if isinstance(agent, pysc2_bot.rlAgent):
+                states.extend(agent.q_table.state_keys)
+    for enemy_attack_loop in (13440, 4800):
+        results.append(benchmark_env(steps, seed, enemy_attack_loop))
+    results.extend(benchmark_q_table(states, steps, alloc_steps))
+    results.append(benchmark_q_table_growth(growth_states, seed))
+    try:
+        # the command batching and Shloompy benchmarks need python-sc2
+        import offline_sc2
+    except ImportError:
+        offline_sc2 = None
+    if offline_sc2 is not None:
+        results.append(benchmark_command_batching(army_size, steps, seed))
+        if shloompy_observations:
+            recordings = [(path, load_recording(path)) for path in shloompy_observations]
+        else:
+            recordings = [(scenario.name, offline_sc2.recording(scenario_env(scenario, seed)))
+                          for scenario in SCENARIOS]
+        for name, recorded in recordings:
+            results.append(benchmark_shloompy(name, recorded, steps, alloc_steps))
+
+    return {'revision': revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'steps': steps,
+            'results': results}
+
+
+def main(unused_argv):
+    report = run_benchmarks(FLAGS.benchmark_steps, FLAGS.benchmark_alloc_steps, FLAGS.benchmark_growth_states,
+                            FLAGS.shloompy_observations, FLAGS.benchmark_seed, FLAGS.benchmark_army_size)
+    text = json.dumps(report, indent=2)
+    if FLAGS.benchmark_output:
+        with open(FLAGS.benchmark_output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    app.run(main)
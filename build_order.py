@@ -0,0 +1,157 @@
+from sc2.ids.unit_typeid import UnitTypeId
+import json
+
+# structures that count towards the same build step, gateways turn into warpgates once the research is done
+EQUIVALENTS = {
+    UnitTypeId.GATEWAY: (UnitTypeId.WARPGATE,),
+}
+DEFAULT_PLACEMENT = 'slot'
+
+
+class BuildStep:
+    '''
+    One line of a build order: have count structures of item (started ones included) once the steps in after are
+    done, the ready / started structures are there and the condition holds, placed by the named placement policy.
+    '''
+
+    def __init__(self, index, id, item, count=1, after=None, ready=None, started=None, condition=None,
+                 placement=DEFAULT_PLACEMENT):
+        self.index = index
+        self.id = id
+        self.item = item
+        self.count = count
+        self.after = after
+        self.ready = ready or {}
+        self.started = started or {}
+        self.condition = condition
+        self.placement = placement
+        self.done = False
+        self.unlocked = False
+        self.waiting = 0
+        self.successors = []
+
+
+class BuildOrder:
+    '''
+    Follows a declarative build order. The steps are compiled into a dependency graph once: a step becomes
+    eligible when every step in its after list is done (by default the step before it), and only eligible steps
+    are evaluated on a step of the game. A finished step is never checked again, so the cost of a decision depends
+    on how many steps can run side by side, not on the length of the build.
+    Build orders are JSON files (see build_orders/), with unit names as in UnitTypeId:
+    {"requires": {"ready": {"PYLON": 1}},
+     "steps": [{"id": "gateway", "item": "GATEWAY", "count": 2, "after": [], "ready": {"PYLON": 1},
+                "started": {}, "condition": null, "placement": "slot"}, ...]}
+    Top level requires apply to every step, only id and item are mandatory in a step.
+    '''
+
+    def __init__(self, bot, steps, placements, conditions=None):
+        '''
+        :param steps: list of step dicts as in a build order file
+        :param placements: placement policy name -> coroutine function taking the UnitTypeId to build
+        :param conditions: condition name -> function returning True when steps with that condition may build
+        '''
+        self.bot = bot
+        self.placements = placements
+        self.conditions = conditions or {}
+        self.steps = []
+        self.by_id = {}
+        self.compile(steps)
+        self.frontier = [step for step in self.steps if not step.waiting]
+        self.cursor = 0
+
+    @classmethod
+    def from_file(cls, bot, path, placements, conditions=None):
+        with open(path) as f:
+            data = json.load(f)
+        requires = data.get('requires', {})
+        steps = []
+        for step in data['steps']:
+            step = dict(step)
+            for state in ('ready', 'started'):
+                step[state] = dict(requires.get(state, {}), **step.get(state, {}))
+            steps.append(step)
+        return cls(bot, steps, placements, conditions)
+
+    def compile(self, steps):
+        '''
+        Resolves unit names and builds the dependency edges. A step can only come after steps listed before it,
+        so the graph never has cycles.
+        '''
+        for index, spec in enumerate(steps):
+            after = spec.get('after', [self.steps[-1].id] if self.steps else [])
+            step = BuildStep(index, **dict(spec, item=UnitTypeId[spec['item']], after=after or [],
+                                           ready={UnitTypeId[name]: n for name, n in spec.get('ready', {}).items()},
+                                           started={UnitTypeId[name]: n for name, n in spec.get('started', {}).items()}))
+            if step.id in self.by_id:
+                raise ValueError('duplicate build step id %s' % step.id)
+            if step.placement not in self.placements:
+                raise ValueError('build step %s has unknown placement %s' % (step.id, step.placement))
+            if step.condition is not None and step.condition not in self.conditions:
+                raise ValueError('build step %s has unknown condition %s' % (step.id, step.condition))
+            for before in step.after:
+                if before not in self.by_id:
+                    raise ValueError('build step %s comes after %s, which is not an earlier step' % (step.id, before))
+                self.by_id[before].successors.append(step)
+            step.waiting = len(step.after)
+            self.steps.append(step)
+            self.by_id[step.id] = step
+
+    # -----------------STATE----------------
+
+    def progress(self, type_id):
+        '''
+        :return: ready structures of type_id (and its equivalents) plus the ones started or on their way
+        '''
+        groups = self.bot.groups
+        return (groups.ready(type_id).amount + groups.pending(type_id)
+                + sum(groups.structures(other).amount for other in EQUIVALENTS.get(type_id, ())))
+
+    def eligible(self, step):
+        groups = self.bot.groups
+        if any(groups.ready(type_id).amount < n for type_id, n in step.ready.items()):
+            return False
+        if any(self.progress(type_id) < n for type_id, n in step.started.items()):
+            return False
+        return step.condition is None or self.conditions[step.condition]()
+
+    def finish(self, step):
+        step.done = True
+        self.frontier.remove(step)
+        if not step.unlocked:
+            step.unlocked = True
+            for successor in step.successors:
+                successor.waiting -= 1
+                if not successor.waiting:
+                    self.frontier.append(successor)
+        self.frontier.sort(key=lambda step: step.index)
+        while self.cursor < len(self.steps) and self.steps[self.cursor].done:
+            self.cursor += 1
+
+    def reopen(self, type_id):
+        '''
+        Call when a structure of type_id is destroyed, finished steps building it are evaluated again until they
+        are back at their count. Steps after them stay unlocked.
+        '''
+        for step in self.steps:
+            if step.done and (step.item == type_id or type_id in EQUIVALENTS.get(step.item, ())):
+                step.done = False
+                self.frontier.append(step)
+                self.cursor = min(self.cursor, step.index)
+        self.frontier.sort(key=lambda step: step.index)
+
+    @property
+    def finished(self):
+        return self.cursor == len(self.steps)
+
+    # -----------------STEP----------------
+
+    async def step(self):
+        '''
+        Evaluates the eligible steps in build order, finishing the ones that reached their count and building for
+        the others when their prerequisites hold and the bot can afford it.
+        '''
+        for step in list(self.frontier):
+            if self.progress(step.item) >= step.count:
+                self.finish(step)
+            elif self.eligible(step) and self.bot.can_afford(step.item):
+                await self.placements[step.placement](step.item)
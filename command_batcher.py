@@ -0,0 +1,82 @@
+from s2clientprotocol import sc2api_pb2 as sc_pb
+from sc2.action import combine_actions
+
+
+class CommandBatcher:
+    '''
+    Last stage of a python-sc2 bot's step. python-sc2 merges identical (ability, target, queue) commands into one
+    multi-unit action, but only when they are adjacent in bot.actions, so an army order interleaved with other
+    commands (Archon morphs between attack-moves, one unit at a time) still goes out as one action per unit.
+    apply() regroups bot.actions so identical commands sit together. Commands of different units are independent,
+    so only a unit's own commands have to keep their order: units that got several commands this step keep them in
+    sequence at the end of the list.
+    '''
+
+    def __init__(self, measure=False):
+        self.measure = measure
+        self.steps = 0
+        self.commands = 0
+        self.actions_before = 0
+        self.actions_after = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    @staticmethod
+    def group_key(command):
+        target = command.target
+        return command.ability, getattr(target, 'tag', target), command.queue
+
+    def regroup(self, commands):
+        '''
+        :param commands: UnitCommands in the order they were given
+        :return: the same commands with identical (ability, target, queue) ones next to each other
+        '''
+        per_unit = {}
+        for command in commands:
+            per_unit[command.unit.tag] = per_unit.get(command.unit.tag, 0) + 1
+        groups = {}
+        sequenced = []
+        for command in commands:
+            if per_unit[command.unit.tag] > 1:
+                sequenced.append(command)
+            else:
+                groups.setdefault(self.group_key(command), []).append(command)
+        return [command for group in groups.values() for command in group] + sequenced
+
+    @staticmethod
+    def action_stats(commands):
+        '''
+        :return: (actions, bytes) of the RequestAction python-sc2 sends for commands
+        '''
+        actions = [sc_pb.Action(action_raw=action) for action in combine_actions(commands)]
+        return len(actions), sc_pb.RequestAction(actions=actions).ByteSize()
+
+    def apply(self, bot):
+        '''
+        Call at the end of on_step, regroups bot.actions in place before python-sc2 sends them.
+        '''
+        commands = bot.actions
+        if len(commands) < 2:
+            return
+        regrouped = self.regroup(commands)
+        if self.measure:
+            before, after = self.action_stats(commands), self.action_stats(regrouped)
+            self.steps += 1
+            self.commands += len(commands)
+            self.actions_before += before[0]
+            self.actions_after += after[0]
+            self.bytes_before += before[1]
+            self.bytes_after += after[1]
+        commands[:] = regrouped
+
+    def summary(self):
+        '''
+        :return: dict of the measured commands, actions and request bytes per step, before and after regrouping
+        '''
+        steps = max(self.steps, 1)
+        return {
+            'steps': self.steps,
+            'commands_per_step': self.commands / steps,
+            'actions_per_step': (self.actions_before / steps, self.actions_after / steps),
+            'bytes_per_step': (self.bytes_before / steps, self.bytes_after / steps),
+        }
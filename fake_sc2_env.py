@@ -0,0 +1,590 @@
+from collections import namedtuple
+from pysc2.env import environment
+from pysc2.lib import actions, features, named_array, units
+import numpy as np
+
+SELF = int(features.PlayerRelative.SELF)
+NEUTRAL = int(features.PlayerRelative.NEUTRAL)
+ENEMY = int(features.PlayerRelative.ENEMY)
+LOOPS_PER_SECOND = 22.4
+
+# plain int column indexes, attribute lookups on the FeatureUnit enum are too slow for the step loop
+UNIT_TYPE, ALLIANCE, HEALTH, SHIELD, BUILD_PROGRESS, OWNER, X, Y, RADIUS, DISPLAY_TYPE, ORDER_LENGTH, TAG = (
+    int(features.FeatureUnit[name]) for name in ('unit_type', 'alliance', 'health', 'shield', 'build_progress', 'owner',
+                                                 'x', 'y', 'radius', 'display_type', 'order_length', 'tag'))
+MINERAL_CONTENTS, VESPENE_CONTENTS, ASSIGNED_HARVESTERS, IDEAL_HARVESTERS = (
+    int(features.FeatureUnit[name]) for name in ('mineral_contents', 'vespene_contents', 'assigned_harvesters',
+                                                 'ideal_harvesters'))
+# columns of the per-unit stats matrix
+DPS, RANGE, SPEED, BUILD_RATE = range(4)
+
+# cost, supply and build time are SC2 values (build time in game loops), dps/speed are per game loop
+UnitData = namedtuple('UnitData', ['minerals', 'vespene', 'supply', 'build_loops', 'health', 'shield', 'dps', 'range',
+                                   'speed', 'radius'])
+UNIT_DATA = {
+    units.Protoss.Nexus: UnitData(400, 0, 0, 1590, 1000, 1000, 0, 0, 0, 2.75),
+    units.Protoss.Probe: UnitData(50, 0, 1, 272, 20, 20, 0, 0, 3.94 / LOOPS_PER_SECOND, 0.375),
+    units.Protoss.Pylon: UnitData(100, 0, 0, 400, 200, 200, 0, 0, 0, 1.0),
+    units.Protoss.Gateway: UnitData(150, 0, 0, 1040, 500, 500, 0, 0, 0, 1.8125),
+    units.Protoss.CyberneticsCore: UnitData(150, 0, 0, 800, 550, 550, 0, 0, 0, 1.8125),
+    units.Protoss.Assimilator: UnitData(75, 0, 0, 480, 450, 450, 0, 0, 0, 1.8125),
+    units.Protoss.Zealot: UnitData(100, 0, 2, 608, 100, 50, 18.6 / LOOPS_PER_SECOND, 0.1,
+                                   3.15 / LOOPS_PER_SECOND, 0.5),
+    units.Protoss.Stalker: UnitData(125, 50, 2, 672, 80, 80, 9.7 / LOOPS_PER_SECOND, 6,
+                                    4.13 / LOOPS_PER_SECOND, 0.625),
+    units.Neutral.MineralField: UnitData(0, 0, 0, 0, 10000, 0, 0, 0, 0, 1.0),
+    units.Neutral.VespeneGeyser: UnitData(0, 0, 0, 0, 10000, 0, 0, 0, 0, 1.8125),
+}
+ARMY_TYPES = {units.Protoss.Zealot, units.Protoss.Stalker}
+STRUCTURE_TYPES = {units.Protoss.Nexus, units.Protoss.Pylon, units.Protoss.Gateway, units.Protoss.CyberneticsCore,
+                   units.Protoss.Assimilator}
+PRODUCTION = {
+    'Train_Probe_quick': (units.Protoss.Probe, units.Protoss.Nexus, None),
+    'Train_Zealot_quick': (units.Protoss.Zealot, units.Protoss.Gateway, None),
+    'Train_Stalker_quick': (units.Protoss.Stalker, units.Protoss.Gateway, units.Protoss.CyberneticsCore),
+}
+CONSTRUCTION = {
+    'Build_Pylon_pt': (units.Protoss.Pylon, None),
+    'Build_Gateway_pt': (units.Protoss.Gateway, units.Protoss.Pylon),
+    'Build_CyberneticsCore_pt': (units.Protoss.CyberneticsCore, units.Protoss.Gateway),
+}
+
+MINERAL_RATE = 55 / 60 / LOOPS_PER_SECOND
+GAS_RATE = 61 / 60 / LOOPS_PER_SECOND
+MINERAL_SATURATION = 16
+GAS_SATURATION = 3
+ACQUIRE_RANGE = 7
+# farthest center distance at which a unit can acquire a target: the acquire range plus both radii
+ACQUIRE_REACH = ACQUIRE_RANGE + max(UNIT_DATA[unit_type].radius for unit_type in ARMY_TYPES) + max(
+    data.radius for data in UNIT_DATA.values())
+PYLON_POWER_RADIUS = 6.5
+SUPPLY_PER_NEXUS = 15
+SUPPLY_PER_PYLON = 8
+MAX_SUPPLY = 200
+MAX_ORDERS = 5
+
+# top-left start of a Simple64-like 64x64 raw map, the bottom-right start is its point reflection
+TOP_LEFT_NEXUS = (19, 23)
+TOP_LEFT_MINERALS = [(12, 19), (13, 20), (12, 21), (13, 22), (12, 24), (13, 25), (12, 26), (13, 27)]
+TOP_LEFT_GEYSERS = [(16, 16), (14, 30)]
+REFLECT = (57, 67)
+
+RAW_UNIT_NAMES = named_array.NamedNumpyArray(np.zeros((1, len(features.FeatureUnit))),
+                                             [None, features.FeatureUnit])._index_names
+PLAYER_NAMES = named_array.NamedNumpyArray(np.zeros(len(features.Player)), features.Player)._index_names
+
+
+def reflect(xy, top_left):
+    return xy if top_left else (REFLECT[0] - xy[0], REFLECT[1] - xy[1])
+
+
+def named(values, index_names):
+    # same result as NamedNumpyArray(values, names) without re-validating the names every step
+    array = values.view(named_array.NamedNumpyArray)
+    array._index_names = index_names
+    return array
+
+
+class Side:
+    '''
+    Running totals for one player, updated as units appear, finish and die so a step never recounts units.
+    '''
+
+    def __init__(self):
+        self.minerals = 50.0
+        self.vespene = 0.0
+        self.workers = 0
+        self.army = 0
+        self.queued_supply = 0
+        self.supply_cap = 0
+        self.structures = 0
+        self.mineral_workers = 0
+        self.nexuses = []
+        self.gateways = []
+        self.assimilators = []
+        self.completed = {}
+
+    @property
+    def food_used(self):
+        return self.workers + 2 * self.army + self.queued_supply
+
+    def can_afford(self, data):
+        return self.minerals >= data.minerals and self.vespene >= data.vespene
+
+
+class FakeSC2Env:
+    '''
+    Headless stand-in for a 1v1 RAW-interface SC2Env against a very easy scripted opponent. It implements the
+    run_loop interface and produces raw_units / player observations shaped like pysc2's, driven by a small
+    economy, production and combat model, so agents can be profiled and trained without the game binary.
+
+    Only the RAW functions the pysc2 agents use are simulated (Build_*, Train_*_quick, Harvest_Gather_unit,
+    Attack_pt); anything else is treated as no_op. Workers build from where they stand and combat is
+    nearest-target dps, which is plenty for exercising agent code paths, not for evaluating strategies.
+    '''
+
+    def __init__(self, step_mul=48, max_game_loops=22400, enemy_attack_loop=13440, seed=None, capacity=256):
+        self.step_mul = step_mul
+        self.max_game_loops = max_game_loops
+        self.enemy_attack_loop = enemy_attack_loop
+        self.initial_capacity = capacity
+        self.random = np.random.RandomState(seed)
+        self.handlers = {}
+        for name in PRODUCTION:
+            self.handlers[int(actions.RAW_FUNCTIONS[name].id)] = (self.train, name)
+        for name in CONSTRUCTION:
+            self.handlers[int(actions.RAW_FUNCTIONS[name].id)] = (self.construct, name)
+        self.handlers[int(actions.RAW_FUNCTIONS.Build_Assimilator_unit.id)] = (self.build_assimilator, None)
+        self.handlers[int(actions.RAW_FUNCTIONS.Harvest_Gather_unit.id)] = (self.gather, None)
+        self.handlers[int(actions.RAW_FUNCTIONS.Attack_pt.id)] = (self.attack, None)
+        self.episode = 0
+        self.game_loop = 0
+
+    # -----------------ENV INTERFACE----------------
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+    def observation_spec(self):
+        return ({'raw_units': (0, len(features.FeatureUnit)), 'player': (len(features.Player),)},)
+
+    def action_spec(self):
+        return (None,)
+
+    def reset(self):
+        self.episode += 1
+        self.game_loop = 0
+        self.capacity = self.initial_capacity
+        self.units = np.zeros((self.capacity, len(features.FeatureUnit)))
+        self.stats = np.zeros((self.capacity, 4))
+        self.targets = np.full((self.capacity, 2), np.nan)
+        self.n = 0
+        self.next_tag = 1
+        self.rows = {}
+        self.queues = {}
+        self.gathering = {}
+        self.harvesters = {}
+        self.constructing = 0
+        self.sides = {SELF: Side(), ENEMY: Side()}
+        self.enemy_builds = 0
+        # True while the last combat update found no fight and no unit has moved or appeared since, target
+        # acquisition would then find nothing again
+        self.combat_settled = False
+
+        self.top_left = bool(self.random.randint(2))
+        for alliance, top_left in ((SELF, self.top_left), (ENEMY, not self.top_left)):
+            nexus = self.add_unit(units.Protoss.Nexus, alliance, reflect(TOP_LEFT_NEXUS, top_left))
+            patches = [self.add_unit(units.Neutral.MineralField, NEUTRAL, reflect(xy, top_left))
+                       for xy in TOP_LEFT_MINERALS]
+            for xy in TOP_LEFT_GEYSERS:
+                self.add_unit(units.Neutral.VespeneGeyser, NEUTRAL, reflect(xy, top_left))
+            for i in range(12):
+                probe = self.add_unit(units.Protoss.Probe, alliance, self.near(nexus, 3))
+                self.assign_harvester(probe, patches[i % len(patches)])
+        return self.timesteps(environment.StepType.FIRST, 0)
+
+    def step(self, agent_actions):
+        for action in agent_actions:
+            handler = self.handlers.get(int(action.function))
+            if handler is not None:
+                handler[0](handler[1], action.arguments)
+
+        self.game_loop += self.step_mul
+        self.update_economy()
+        if self.constructing:
+            self.update_construction()
+        if self.queues:
+            self.update_production()
+        self.update_enemy()
+        self.update_combat()
+
+        mine = self.sides[SELF].structures
+        theirs = self.sides[ENEMY].structures
+        if not theirs or not mine or self.game_loop >= self.max_game_loops:
+            reward = 1 if not theirs and mine else (-1 if not mine and theirs else 0)
+            return self.timesteps(environment.StepType.LAST, reward)
+        return self.timesteps(environment.StepType.MID, 0)
+
+    def timesteps(self, step_type, reward):
+        last = step_type == environment.StepType.LAST
+        return [environment.TimeStep(step_type=step_type, reward=reward, discount=0.0 if last else 1.0,
+                                     observation=self.observation())]
+
+    def observation(self):
+        side = self.sides[SELF]
+        army_supply = 2 * side.army
+        player = np.array([1, side.minerals, side.vespene, side.food_used, min(side.supply_cap, MAX_SUPPLY),
+                           army_supply, side.workers, side.workers - side.mineral_workers - self.gas_workers(side),
+                           side.army, 0, 0], dtype=np.int64)
+        return named_array.NamedDict(raw_units=named(self.units[:self.n].astype(np.int64), RAW_UNIT_NAMES),
+                                     player=named(player, PLAYER_NAMES),
+                                     game_loop=np.array([self.game_loop], dtype=np.int64))
+
+    # -----------------UNITS----------------
+
+    def add_unit(self, unit_type, alliance, xy, completed=True):
+        if self.n == self.capacity:
+            self.units = np.vstack((self.units, np.zeros_like(self.units)))
+            self.stats = np.vstack((self.stats, np.zeros_like(self.stats)))
+            self.targets = np.vstack((self.targets, np.full_like(self.targets, np.nan)))
+            self.capacity *= 2
+        row = self.n
+        self.n += 1
+        tag = self.next_tag
+        self.next_tag += 1
+        data = UNIT_DATA[unit_type]
+
+        unit = self.units[row]
+        unit[:] = 0
+        unit[UNIT_TYPE] = unit_type
+        unit[ALLIANCE] = alliance
+        unit[OWNER] = {SELF: 1, ENEMY: 2}.get(alliance, 16)
+        unit[DISPLAY_TYPE] = 1
+        unit[X], unit[Y] = xy
+        unit[TAG] = tag
+        unit[BUILD_PROGRESS] = 100 if completed else 0
+        unit[HEALTH] = data.health
+        unit[SHIELD] = data.shield
+        unit[RADIUS] = data.radius
+        self.combat_settled = False
+        if unit_type == units.Neutral.VespeneGeyser:
+            unit[VESPENE_CONTENTS] = 2250
+        elif unit_type == units.Neutral.MineralField:
+            unit[MINERAL_CONTENTS] = 1800
+        self.stats[row] = (data.dps, data.range, data.speed, 0 if completed else 100.0 / data.build_loops)
+        self.targets[row] = np.nan
+        self.rows[tag] = row
+
+        side = self.sides.get(alliance)
+        if side is not None:
+            if unit_type == units.Protoss.Probe:
+                side.workers += 1
+            elif unit_type in ARMY_TYPES:
+                side.army += 1
+            elif unit_type in STRUCTURE_TYPES:
+                side.structures += 1
+                if unit_type == units.Protoss.Nexus:
+                    side.nexuses.append(tag)
+                elif unit_type == units.Protoss.Gateway:
+                    side.gateways.append(tag)
+                elif unit_type == units.Protoss.Assimilator:
+                    side.assimilators.append(tag)
+            if completed:
+                self.on_completed(side, unit_type, 1)
+            else:
+                self.constructing += 1
+        return tag
+
+    def on_completed(self, side, unit_type, count):
+        side.completed[unit_type] = side.completed.get(unit_type, 0) + count
+        if unit_type == units.Protoss.Nexus:
+            side.supply_cap += SUPPLY_PER_NEXUS * count
+        elif unit_type == units.Protoss.Pylon:
+            side.supply_cap += SUPPLY_PER_PYLON * count
+
+    def remove_units(self, rows):
+        for row in sorted(rows, reverse=True):
+            unit = self.units[row]
+            tag = int(unit[TAG])
+            unit_type = int(unit[UNIT_TYPE])
+            side = self.sides.get(int(unit[ALLIANCE]))
+            if side is not None:
+                if unit_type == units.Protoss.Probe:
+                    side.workers -= 1
+                elif unit_type in ARMY_TYPES:
+                    side.army -= 1
+                elif unit_type in STRUCTURE_TYPES:
+                    side.structures -= 1
+                    if tag in side.nexuses:
+                        side.nexuses.remove(tag)
+                    if tag in side.gateways:
+                        side.gateways.remove(tag)
+                    if tag in side.assimilators:
+                        side.assimilators.remove(tag)
+                if unit[BUILD_PROGRESS] >= 100:
+                    self.on_completed(side, unit_type, -1)
+                else:
+                    self.constructing -= 1
+                for job in self.queues.pop(tag, []):
+                    side.queued_supply -= UNIT_DATA[job[0]].supply
+            self.release_harvester(tag)
+            for worker in self.harvesters.pop(tag, []):
+                del self.gathering[worker]
+                self.units[self.rows[worker], ORDER_LENGTH] = 0
+                if side is None:
+                    self.sides[int(self.units[self.rows[worker], ALLIANCE])].mineral_workers -= 1
+
+            del self.rows[tag]
+            last = self.n - 1
+            if row != last:
+                self.units[row] = self.units[last]
+                self.stats[row] = self.stats[last]
+                self.targets[row] = self.targets[last]
+                self.rows[int(self.units[row, TAG])] = row
+            self.n = last
+
+    def unit(self, tag):
+        row = self.rows.get(int(tag))
+        return None if row is None else self.units[row]
+
+    def near(self, tag, distance):
+        unit = self.unit(tag)
+        angle = self.random.uniform(0, 2 * np.pi)
+        return (float(np.clip(unit[X] + distance * np.cos(angle), 0, 63)),
+                float(np.clip(unit[Y] + distance * np.sin(angle), 0, 63)))
+
+    def assign_harvester(self, worker, target):
+        self.release_harvester(worker)
+        self.gathering[worker] = target
+        self.harvesters.setdefault(target, []).append(worker)
+        row = self.rows[worker]
+        self.units[row, ORDER_LENGTH] = 1
+        self.targets[row] = np.nan
+        if self.units[self.rows[target], UNIT_TYPE] != units.Protoss.Assimilator:
+            self.sides[int(self.units[row, ALLIANCE])].mineral_workers += 1
+
+    def release_harvester(self, worker):
+        target = self.gathering.pop(worker, None)
+        if target is None:
+            return
+        self.harvesters[target].remove(worker)
+        self.units[self.rows[worker], ORDER_LENGTH] = 0
+        if self.units[self.rows[target], UNIT_TYPE] != units.Protoss.Assimilator:
+            self.sides[int(self.units[self.rows[worker], ALLIANCE])].mineral_workers -= 1
+
+    def gas_workers(self, side):
+        return sum(len(self.harvesters.get(tag, ())) for tag in side.assimilators)
+
+    def spend(self, alliance, unit_type):
+        data = UNIT_DATA[unit_type]
+        side = self.sides[alliance]
+        if not side.can_afford(data):
+            return False
+        side.minerals -= data.minerals
+        side.vespene -= data.vespene
+        return True
+
+    def placement_free(self, unit_type, x, y):
+        data = self.units[:self.n]
+        solid = self.stats[:self.n, SPEED] == 0
+        gap = np.hypot(data[:, X] - x, data[:, Y] - y) - data[:, RADIUS] - UNIT_DATA[unit_type].radius
+        return not np.any(solid & (gap < 0))
+
+    # -----------------ACTIONS----------------
+
+    def train(self, name, arguments):
+        unit_type, producer_type, requirement = PRODUCTION[name]
+        data = UNIT_DATA[unit_type]
+        for tag in arguments[1]:
+            producer = self.unit(tag)
+            if (producer is None or producer[UNIT_TYPE] != producer_type or producer[BUILD_PROGRESS] < 100
+                    or producer[ORDER_LENGTH] >= MAX_ORDERS):
+                continue
+            alliance = int(producer[ALLIANCE])
+            side = self.sides[alliance]
+            if requirement is not None and not side.completed.get(requirement):
+                continue
+            if side.food_used + data.supply > min(side.supply_cap, MAX_SUPPLY) or not self.spend(alliance, unit_type):
+                continue
+            self.queues.setdefault(int(tag), []).append([unit_type, 0])
+            side.queued_supply += data.supply
+            producer[ORDER_LENGTH] += 1
+
+    def construct(self, name, arguments):
+        unit_type, requirement = CONSTRUCTION[name]
+        probe = self.unit(arguments[1][0])
+        if probe is None or probe[UNIT_TYPE] != units.Protoss.Probe:
+            return
+        alliance = int(probe[ALLIANCE])
+        x, y = arguments[2]
+        if requirement == units.Protoss.Pylon:
+            data = self.units[:self.n]
+            powered = ((data[:, UNIT_TYPE] == units.Protoss.Pylon) & (data[:, ALLIANCE] == alliance) &
+                       (data[:, BUILD_PROGRESS] >= 100) &
+                       (np.hypot(data[:, X] - x, data[:, Y] - y) <= PYLON_POWER_RADIUS))
+            if not np.any(powered):
+                return
+        elif requirement is not None and not self.sides[alliance].completed.get(requirement):
+            return
+        if self.placement_free(unit_type, x, y) and self.spend(alliance, unit_type):
+            self.add_unit(unit_type, alliance, (x, y), completed=False)
+
+    def build_assimilator(self, unused_name, arguments):
+        probe = self.unit(arguments[1][0])
+        geyser = self.unit(arguments[2][0])
+        if probe is None or geyser is None or geyser[UNIT_TYPE] != units.Neutral.VespeneGeyser:
+            return
+        xy = (geyser[X], geyser[Y])
+        data = self.units[:self.n]
+        taken = (data[:, UNIT_TYPE] == units.Protoss.Assimilator) & (data[:, X] == xy[0]) & (data[:, Y] == xy[1])
+        alliance = int(probe[ALLIANCE])
+        if not np.any(taken) and self.spend(alliance, units.Protoss.Assimilator):
+            self.add_unit(units.Protoss.Assimilator, alliance, xy, completed=False)
+
+    def gather(self, unused_name, arguments):
+        target_tag = int(arguments[2][0])
+        target = self.unit(target_tag)
+        if target is None:
+            return
+        for tag in arguments[1]:
+            probe = self.unit(tag)
+            if probe is not None and probe[UNIT_TYPE] == units.Protoss.Probe:
+                self.assign_harvester(int(tag), target_tag)
+
+    def attack(self, unused_name, arguments):
+        for tag in arguments[1]:
+            row = self.rows.get(int(tag))
+            if row is not None and self.stats[row, SPEED] > 0:
+                self.release_harvester(int(tag))
+                self.targets[row] = arguments[2]
+                self.units[row, ORDER_LENGTH] = 1
+
+    # -----------------SIMULATION----------------
+
+    def update_economy(self):
+        for side in self.sides.values():
+            workers = side.mineral_workers
+            effective = min(workers, MINERAL_SATURATION) + 0.5 * min(max(workers - MINERAL_SATURATION, 0), 8)
+            gas = 0
+            for tag in side.assimilators:
+                row = self.rows[tag]
+                assigned = len(self.harvesters.get(tag, ()))
+                self.units[row, ASSIGNED_HARVESTERS] = assigned
+                if self.units[row, BUILD_PROGRESS] >= 100:
+                    self.units[row, IDEAL_HARVESTERS] = GAS_SATURATION
+                    gas += min(assigned, GAS_SATURATION)
+            side.minerals += effective * MINERAL_RATE * self.step_mul
+            side.vespene += gas * GAS_RATE * self.step_mul
+            for tag in side.nexuses:
+                row = self.rows[tag]
+                self.units[row, ASSIGNED_HARVESTERS] = workers
+                self.units[row, IDEAL_HARVESTERS] = MINERAL_SATURATION
+
+    def update_construction(self):
+        building = np.flatnonzero(self.stats[:self.n, BUILD_RATE])
+        progress = self.units[building, BUILD_PROGRESS] + self.stats[building, BUILD_RATE] * self.step_mul
+        done = progress >= 100
+        self.units[building, BUILD_PROGRESS] = np.minimum(progress, 100)
+        for row in building[done].tolist():
+            self.stats[row, BUILD_RATE] = 0
+            self.constructing -= 1
+            self.on_completed(self.sides[int(self.units[row, ALLIANCE])], int(self.units[row, UNIT_TYPE]), 1)
+
+    def update_production(self):
+        for tag, jobs in list(self.queues.items()):
+            job = jobs[0]
+            job[1] += self.step_mul
+            if job[1] >= UNIT_DATA[job[0]].build_loops:
+                jobs.pop(0)
+                alliance = int(self.units[self.rows[tag], ALLIANCE])
+                self.sides[alliance].queued_supply -= UNIT_DATA[job[0]].supply
+                self.add_unit(job[0], alliance, self.near(tag, 3))
+                self.units[self.rows[tag], ORDER_LENGTH] = len(jobs)
+            if not jobs:
+                del self.queues[tag]
+
+    def update_enemy(self):
+        '''
+        Scripted very easy opponent: saturates minerals, adds a pylon, a gateway and a steady trickle of zealots,
+        and sends its army at our nexus once the attack time is reached.
+        '''
+        side = self.sides[ENEMY]
+        if not side.nexuses or not side.workers:
+            return
+        nexus = side.nexuses[0]
+        if side.workers < MINERAL_SATURATION and nexus not in self.queues:
+            self.train('Train_Probe_quick', [[0], [nexus]])
+
+        builder = None
+        if (self.enemy_builds < 3 and self.game_loop >= 1300 * (self.enemy_builds + 1)
+                and side.can_afford(UNIT_DATA[units.Protoss.Pylon])):
+            # None when every enemy probe is busy or dead, the build then waits for a later update
+            builder = next((tag for tag in self.gathering if self.units[self.rows[tag], ALLIANCE] == ENEMY), None)
+        if builder is not None:
+            x, y = reflect(TOP_LEFT_NEXUS, not self.top_left)
+            toward_center = 1 if self.top_left else -1
+            name, xy = (('Build_Pylon_pt', (x, y - 5 * toward_center)),
+                        ('Build_Gateway_pt', (x - 3 * toward_center, y - 8 * toward_center)),
+                        ('Build_Pylon_pt', (x - 5 * toward_center, y)))[self.enemy_builds]
+            structures = side.structures
+            self.construct(name, [[0], [builder], xy])
+            self.enemy_builds += side.structures > structures
+
+        if side.completed.get(units.Protoss.Gateway):
+            for gateway in side.gateways:
+                if gateway not in self.queues:
+                    self.train('Train_Zealot_quick', [[0], [gateway]])
+
+        if self.game_loop >= self.enemy_attack_loop and side.army:
+            zealots = ((self.units[:self.n, UNIT_TYPE] == units.Protoss.Zealot) &
+                       (self.units[:self.n, ALLIANCE] == ENEMY) & np.isnan(self.targets[:self.n, 0]))
+            self.targets[:self.n][zealots] = reflect(TOP_LEFT_NEXUS, self.top_left)
+
+    def update_combat(self):
+        n = self.n
+        data = self.units[:n]
+        stats = self.stats[:n]
+        damage = None
+        # only army units deal damage, skip everything while neither side has any or nothing changed
+        if (self.sides[SELF].army or self.sides[ENEMY].army) and not self.combat_settled:
+            alliance = data[:, ALLIANCE]
+            x = data[:, X]
+            y = data[:, Y]
+            radius = data[:, RADIUS]
+            armed = np.flatnonzero(stats[:, DPS])
+            if self.sides[SELF].army and self.sides[ENEMY].army:
+                armies = ((armed[alliance[armed] == SELF], ENEMY), (armed[alliance[armed] == ENEMY], SELF))
+            else:
+                armies = ((armed, ENEMY if self.sides[SELF].army else SELF),)
+            for attackers, other in armies:
+                ax = x[attackers]
+                ay = y[attackers]
+                # opponents outside the army's bounding box grown by the acquire reach can't be acquired, so the
+                # pairwise distances only cover the units near a fight
+                near = np.flatnonzero((alliance == other) & (x >= ax.min() - ACQUIRE_REACH)
+                                      & (x <= ax.max() + ACQUIRE_REACH) & (y >= ay.min() - ACQUIRE_REACH)
+                                      & (y <= ay.max() + ACQUIRE_REACH))
+                if not len(near):
+                    continue
+                gap = (np.hypot(x[near] - ax[:, None], y[near] - ay[:, None]) - radius[near]
+                       - radius[attackers, None])
+                closest = gap.argmin(axis=1)
+                gap = gap[np.arange(len(attackers)), closest]
+                nearest = near[closest]
+                in_range = gap <= stats[attackers, RANGE]
+                if in_range.any():
+                    if damage is None:
+                        damage = np.zeros(n)
+                    np.add.at(damage, nearest[in_range], stats[attackers[in_range], DPS] * self.step_mul)
+                    self.targets[attackers[in_range]] = np.nan
+                chasing = ~in_range & (gap <= ACQUIRE_RANGE)
+                self.targets[attackers[chasing]] = data[nearest[chasing]][:, [X, Y]]
+            self.combat_settled = damage is None
+
+        moving = np.flatnonzero(~np.isnan(self.targets[:n, 0]))
+        if len(moving):
+            delta = self.targets[moving] - data[moving][:, [X, Y]]
+            distance = np.hypot(delta[:, 0], delta[:, 1])
+            step = np.minimum(stats[moving, SPEED] * self.step_mul, distance)
+            scale = np.divide(step, distance, out=np.zeros_like(step), where=distance > 0)
+            data[moving, X] += delta[:, 0] * scale
+            data[moving, Y] += delta[:, 1] * scale
+            arrived = moving[step >= distance]
+            self.targets[arrived] = np.nan
+            data[arrived, ORDER_LENGTH] = 0
+            self.combat_settled = False
+
+        if damage is not None:
+            hit = np.flatnonzero(damage)
+            absorbed = np.minimum(data[hit, SHIELD], damage[hit])
+            data[hit, SHIELD] -= absorbed
+            data[hit, HEALTH] -= damage[hit] - absorbed
+            dead = hit[data[hit, HEALTH] <= 0]
+            if len(dead):
+                self.remove_units(dead.tolist())
@@ -0,0 +1,55 @@
+import queue
+import threading
+
+# learning steps waiting for the worker, a full queue makes the agent wait instead of falling further behind
+QUEUE_SIZE = 4
+
+
+class LearnPipeline:
+    '''
+    Runs an agent's learning steps on a worker thread fed by a bounded queue, so the TD update and replay of step t
+    run while the environment computes step t + 1. Jobs run in the order they were submitted. Code on either thread
+    that touches the Q-table takes lock around each table operation.
+    An exception raised by a job stops later jobs and is raised again by the next submit() or drain().
+    '''
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.lock = threading.RLock()
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='learn-pipeline', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                if self.error is None:
+                    fn, args = job
+                    fn(*args)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.jobs.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, fn, *args):
+        '''
+        Queues fn(*args), blocking while QUEUE_SIZE jobs are already waiting.
+        '''
+        self._raise_error()
+        self.jobs.put((fn, args))
+
+    def drain(self):
+        '''
+        Waits for every submitted job, call before reading the whole table, e.g. to save it.
+        '''
+        self.jobs.join()
+        self._raise_error()
+
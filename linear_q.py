@@ -0,0 +1,165 @@
+import json
+import os
+import numpy as np
+from q_table import TERMINAL_STATE, bits_mask
+
+# overlapping tilings per tile-coded field, tiling t is shifted by t / TILINGS of a tile
+TILINGS = 4
+# tile width of every tile-coded field, in the field's own units
+TILE_WIDTHS = {'minerals': 400, 'vespene': 200}
+
+
+class LinearQLearner:
+    '''
+    Q-learner over a linear function of state features, with the same interface as QLearningTable. States are keys
+    of a StateEncoder; a key is decoded into a feature vector of every field's value divided by its largest value,
+    a constant bias, and TILINGS one-hot tile codes for the fields in TILE_WIDTHS. Q(s) = phi(s) @ weights, one
+    weight column per action, so memory stays at n_features x n_actions however many states are visited, and an
+    update moves the values of every state sharing features with the one it was learned on.
+    State ids are the keys themselves, so the replay buffer can hold them and learn_batch decodes a whole minibatch
+    with array operations.
+    '''
+
+    def __init__(self, actions, encoder, learning_rate=0.01, discount_factor=0.9, tilings=TILINGS,
+                 tile_widths=None):
+        self.actions = list(actions)
+        self.encoder = encoder
+        self.learning_rate = learning_rate
+        self.discount_factor = discount_factor
+        self.tilings = tilings
+        self.tile_widths = dict(TILE_WIDTHS if tile_widths is None else tile_widths)
+        self.action_ids = {action: i for i, action in enumerate(self.actions)}
+
+        fields = encoder.fields
+        self.shifts = np.array(encoder.shifts, dtype=np.int64)
+        self.bit_masks = np.array([(1 << field.bits) - 1 for field in fields], dtype=np.int64)
+        # bucket -> value lookup of every field, padded to the largest bucket number a field's bits can hold
+        self.edges = np.zeros((len(fields), int(self.bit_masks.max()) + 1))
+        for i, field in enumerate(fields):
+            self.edges[i, :len(field.edges)] = field.edges
+            self.edges[i, len(field.edges):] = field.edges[-1]
+        self.field_ids = np.arange(len(fields))
+
+        self.scaled = [i for i, field in enumerate(fields) if field.name not in self.tile_widths]
+        self.scales = np.array([1.0 / max(fields[i].max_value, 1) for i in self.scaled])
+        # one column per (tiled field, tiling): the field it codes, the tile width, the tiling's shift in tiles and
+        # the feature of the tiling's first tile. A tiling of a field with values up to v has v // width + 2 tiles
+        tiled, widths, shifts, firsts = [], [], [], []
+        first = len(self.scaled) + 1
+        for i, field in enumerate(fields):
+            if field.name in self.tile_widths:
+                width = float(self.tile_widths[field.name])
+                tiles = int(field.max_value // width) + 2
+                for tiling in range(tilings):
+                    tiled.append(i)
+                    widths.append(width)
+                    shifts.append(tiling / float(tilings))
+                    firsts.append(first + tiling * tiles)
+                first += tilings * tiles
+        self.tiled = np.array(tiled, dtype=np.int64)
+        self.tile_widths_inv = 1.0 / np.array(widths)
+        self.tile_shifts = np.array(shifts)
+        self.tile_firsts = np.array(firsts, dtype=np.int64)
+        self.n_features = first
+        self.weights = np.zeros((self.n_features, len(self.actions)), dtype=np.float64)
+
+    def state_id(self, state):
+        return state
+
+    def features(self, keys):
+        '''
+        :param keys: array of encoded states
+        :return: float array of shape (len(keys), n_features)
+        '''
+        keys = np.asarray(keys, dtype=np.int64).reshape(-1, 1)
+        values = self.edges[self.field_ids, (keys >> self.shifts) & self.bit_masks]
+        phi = np.zeros((len(keys), self.n_features))
+        phi[:, :len(self.scaled)] = values[:, self.scaled] * self.scales
+        phi[:, len(self.scaled)] = 1.0
+        tiles = np.floor(values[:, self.tiled] * self.tile_widths_inv + self.tile_shifts).astype(np.int64)
+        phi[np.arange(len(keys))[:, None], self.tile_firsts + tiles] = 1.0
+        return phi
+
+    def choose_action(self, obs, epsilon=0.9, mask=None):
+        '''
+        Epsilon-greedy choice, both the greedy and the random pick only among the actions valid in mask.
+        :param mask: bool array over the actions, None when every action is valid
+        '''
+        valid = np.arange(len(self.actions)) if mask is None else np.flatnonzero(mask)
+        if np.random.uniform() < epsilon:
+            state_action = (self.features([obs]) @ self.weights)[0, valid]
+            best = valid[state_action == state_action.max()]
+            return self.actions[best[np.random.randint(len(best))]]
+        return self.actions[valid[np.random.randint(len(valid))]]
+
+    def learn(self, prev_state, action, reward, state, mask=None):
+        '''
+        :param mask: actions valid in state, the target bootstraps from the best of those only
+        '''
+        action_id = self.action_ids[action]
+        if state != TERMINAL_STATE:
+            phi = self.features([prev_state, state])
+            q_next = phi[1] @ self.weights
+            q_estimate = reward + self.discount_factor * (q_next if mask is None else q_next[mask]).max()
+        else:
+            phi = self.features([prev_state])
+            q_estimate = reward
+
+        q_predict = phi[0] @ self.weights[:, action_id]
+        self.weights[:, action_id] += self.learning_rate * (q_estimate - q_predict) * phi[0]
+
+    def learn_batch(self, state_ids, action_ids, rewards, next_state_ids, terminals, next_masks=None):
+        '''
+        One TD update per transition of a minibatch of state ids from state_id(), all computed from the weights
+        before the batch and applied as a single matrix product.
+        :param next_masks: mask_bits() of the actions valid in each next state, None when all are
+        '''
+        phi = self.features(np.concatenate([state_ids, next_state_ids]))
+        q_next = phi[len(state_ids):] @ self.weights
+        phi = phi[:len(state_ids)]
+        if next_masks is not None:
+            q_next = np.where(bits_mask(next_masks, len(self.actions)), q_next, -np.inf)
+        q_next = q_next.max(axis=1)
+        q_estimate = rewards + self.discount_factor * np.where(terminals, 0.0, q_next)
+        batch = np.arange(len(state_ids))
+        errors = np.zeros((len(state_ids), len(self.actions)))
+        errors[batch, action_ids] = q_estimate - (phi @ self.weights)[batch, action_ids]
+        self.weights += self.learning_rate * (phi.T @ errors)
+
+    # -----------------CHECKPOINTS----------------
+
+    @staticmethod
+    def checkpoint_files(path):
+        '''
+        The weights and a JSON header describing them, the header is replaced last.
+        '''
+        return path + '.weights', path + '.linear.json'
+
+    def header(self):
+        return {'actions': self.actions, 'fields': [field.name for field in self.encoder.fields],
+                'tilings': self.tilings, 'tile_widths': self.tile_widths, 'dtype': self.weights.dtype.str,
+                'shape': list(self.weights.shape)}
+
+    def save(self, path):
+        '''
+        :param path: checkpoint path prefix
+        :return: the number of weights written
+        '''
+        weights_file, header_file = self.checkpoint_files(path)
+        with open(weights_file + '.tmp', 'wb') as f:
+            f.write(np.ascontiguousarray(self.weights).tobytes())
+        os.replace(weights_file + '.tmp', weights_file)
+        with open(header_file + '.tmp', 'w') as f:
+            json.dump(self.header(), f)
+        os.replace(header_file + '.tmp', header_file)
+        return self.weights.size
+
+    def load(self, path):
+        weights_file, header_file = self.checkpoint_files(path)
+        with open(header_file) as f:
+            header = json.load(f)
+        expected = json.loads(json.dumps(self.header()))
+        if header != expected:
+            raise ValueError("Checkpoint %s doesn't match the learner's actions and features" % path)
+        self.weights = np.fromfile(weights_file, dtype=np.dtype(header['dtype'])).reshape(header['shape'])
+        return self
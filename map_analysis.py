@@ -0,0 +1,245 @@
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.position import Point2
+import hashlib
+import os
+import re
+import numpy as np
+
+CACHE_DIR = 'map_cache'
+# bump when the analysis changes, so stale cache files are ignored
+CACHE_VERSION = 1
+# cells around a start location opened up for the distance fields, the starting townhall blocks its own center
+START_CLEARANCE = 3
+# a cell on the attack route this close (in cells) to unpathable ground is a choke, chokes closer together than
+# CHOKE_SPACING are the same choke. The route is found with steps near unpathable ground costing up to
+# 1 + ROUTE_CENTERING ** 2, so it follows the middle of corridors and ramps instead of hugging their edges
+CHOKE_CLEARANCE = 4.0
+ROUTE_CENTERING = 4.0
+CHOKE_SPACING = 10.0
+# an expansion with a townhall this close is taken
+EXPANSION_GAP = 8.0
+TOWNHALL_TYPES = {UnitTypeId.NEXUS, UnitTypeId.COMMANDCENTER, UnitTypeId.COMMANDCENTERFLYING, UnitTypeId.ORBITALCOMMAND,
+                  UnitTypeId.ORBITALCOMMANDFLYING, UnitTypeId.PLANETARYFORTRESS, UnitTypeId.HATCHERY, UnitTypeId.LAIR,
+                  UnitTypeId.HIVE}
+
+DIAGONAL = np.sqrt(2)
+MOVES = [(-1, 0, 1.0), (1, 0, 1.0), (0, -1, 1.0), (0, 1, 1.0),
+         (-1, -1, DIAGONAL), (-1, 1, DIAGONAL), (1, -1, DIAGONAL), (1, 1, DIAGONAL)]
+
+
+def ground_distance(pathable, seeds, cost=None):
+    '''
+    Octile ground distance from the seed cells to every cell, relaxing all 8 neighbours at once until nothing
+    changes.
+    :param pathable: bool grid indexed [y, x]
+    :param seeds: bool grid of the cells at distance 0
+    :param cost: optional grid of per-cell step cost multipliers
+    :return: float32 grid, inf where the seeds can't be reached
+    '''
+    distance = np.full(pathable.shape, np.inf, dtype=np.float32)
+    distance[seeds] = 0
+    blocked = ~pathable & ~seeds
+    while True:
+        relaxed = distance.copy()
+        for dy, dx, length in MOVES:
+            target = relaxed[max(dy, 0):relaxed.shape[0] + min(dy, 0), max(dx, 0):relaxed.shape[1] + min(dx, 0)]
+            source = distance[max(-dy, 0):distance.shape[0] + min(-dy, 0), max(-dx, 0):distance.shape[1] + min(-dx, 0)]
+            step = length if cost is None else length * cost[max(dy, 0):cost.shape[0] + min(dy, 0),
+                                                              max(dx, 0):cost.shape[1] + min(dx, 0)]
+            np.minimum(target, source + step, out=target)
+        relaxed[blocked] = np.inf
+        if np.array_equal(relaxed, distance):
+            return distance
+        distance = relaxed
+
+
+class MapAnalysis:
+    '''
+    Static map features for one map and start location: ramps, expansions in ground distance order, chokes on the
+    route to the enemy main, the main ramp wall and ground distance fields from both start locations.
+    Computed once at start and saved to CACHE_DIR as a compressed .npz named after the map and a hash of its grids
+    and our start location, so later games on the same map load it in a few milliseconds and decision code reads
+    precomputed lists instead of sorting map features mid-game.
+    '''
+
+    def __init__(self, bot, cache_dir=CACHE_DIR):
+        self.bot = bot
+        self.cache_dir = cache_dir
+        self.from_cache = False
+        self.ramps = []
+        self.ramp_bottoms = []
+        self.expansions = []
+        self.chokes = []
+        self.wall_pylon = None
+        self.wall_buildings = []
+        self.wall_warpin = None
+        self.distance = None
+        self.enemy_distance = None
+
+    def start(self):
+        '''
+        Call from on_start. Loads the analysis from the cache, or computes and saves it.
+        '''
+        path = self.cache_path()
+        if os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    self._unpack(data)
+                self.from_cache = True
+                return
+            except (OSError, ValueError, KeyError):
+                pass
+        self.compute()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # written under a temporary name first, so a game killed mid-write never leaves a broken cache file
+            with open(path + '.tmp', 'wb') as f:
+                np.savez_compressed(f, **self._pack())
+            os.replace(path + '.tmp', path)
+
+    def cache_path(self):
+        game_info = self.bot.game_info
+        digest = hashlib.sha1()
+        digest.update(b'%d' % CACHE_VERSION)
+        digest.update(game_info.map_name.encode())
+        digest.update(np.ascontiguousarray(game_info.pathing_grid.data_numpy).tobytes())
+        digest.update(np.ascontiguousarray(game_info.terrain_height.data_numpy).tobytes())
+        digest.update(np.array(self.bot.start_location, dtype=np.float32).tobytes())
+        name = re.sub(r'\W+', '_', game_info.map_name)
+        return os.path.join(self.cache_dir or '', '%s_%s.npz' % (name, digest.hexdigest()[:16]))
+
+    # -----------------ANALYSIS----------------
+
+    def compute(self):
+        game_info = self.bot.game_info
+        start = self.bot.start_location
+        enemy_start = self.bot.enemy_start_locations[0]
+
+        pathable = game_info.pathing_grid.data_numpy != 0
+        ys, xs = np.indices(pathable.shape)
+        around_start = np.hypot(xs + 0.5 - start.x, ys + 0.5 - start.y) <= START_CLEARANCE
+        around_enemy = np.hypot(xs + 0.5 - enemy_start.x, ys + 0.5 - enemy_start.y) <= START_CLEARANCE
+        self.distance = ground_distance(pathable, around_start)
+        self.enemy_distance = ground_distance(pathable, around_enemy)
+
+        ramps = sorted(game_info.map_ramps, key=lambda ramp: ramp.top_center.distance_to(start))
+        self.ramps = [ramp.top_center for ramp in ramps]
+        self.ramp_bottoms = [ramp.bottom_center for ramp in ramps]
+        self.expansions = sorted(self.bot.expansion_locations, key=self.ground_distance_to)
+        self.chokes = self._find_chokes(pathable)
+
+        # python-sc2 only knows the wall for ramps of the usual main ramp size
+        try:
+            ramp = self.bot.main_base_ramp
+            self.wall_pylon = ramp.protoss_wall_pylon
+            self.wall_buildings = sorted(ramp.protoss_wall_buildings)
+            self.wall_warpin = ramp.protoss_wall_warpin
+        except Exception:
+            self.wall_pylon, self.wall_buildings, self.wall_warpin = None, [], None
+
+    def _find_chokes(self, pathable):
+        '''
+        Walks a corridor-centered route from our natural (or our main) to the enemy main and keeps its narrowest
+        points.
+        :return: [(Point2, width)] ordered from our side outwards
+        '''
+        clearance = ground_distance(np.ones(pathable.shape, dtype=bool), ~pathable)
+        seeds = self.enemy_distance == 0
+        field = ground_distance(pathable, seeds, cost=1 + (ROUTE_CENTERING / np.maximum(clearance, 1)) ** 2)
+        height, width = pathable.shape
+        origin = self.expansions[1] if len(self.expansions) > 1 else self.bot.start_location
+        y, x = int(origin.y), int(origin.x)
+        if not np.isfinite(field[y, x]):
+            return []
+
+        route = [(y, x)]
+        while field[y, x] > 0:
+            neighbours = [(y + dy, x + dx) for dy, dx, _ in MOVES if 0 <= y + dy < height and 0 <= x + dx < width]
+            y, x = min(neighbours, key=lambda cell: field[cell])
+            if field[y, x] >= field[route[-1]]:
+                break
+            route.append((y, x))
+
+        chokes = []
+        widths = [clearance[cell] for cell in route]
+        for i in range(1, len(route) - 1):
+            if widths[i] > CHOKE_CLEARANCE or widths[i] > widths[i - 1] or widths[i] > widths[i + 1]:
+                continue
+            point = Point2((route[i][1] + 0.5, route[i][0] + 0.5))
+            if chokes and chokes[-1][0].distance_to(point) < CHOKE_SPACING:
+                if widths[i] < chokes[-1][1] / 2:
+                    chokes[-1] = (point, 2 * float(widths[i]))
+                continue
+            chokes.append((point, 2 * float(widths[i])))
+        return chokes
+
+    # -----------------CACHE----------------
+
+    @staticmethod
+    def _points(points):
+        return np.array([(point.x, point.y) for point in points], dtype=np.float32).reshape(-1, 2)
+
+    def _pack(self):
+        optional = lambda point: np.array([] if point is None else (point.x, point.y), dtype=np.float32)
+        return {
+            'ramps': self._points(self.ramps),
+            'ramp_bottoms': self._points(self.ramp_bottoms),
+            'expansions': self._points(self.expansions),
+            'chokes': np.array([(point.x, point.y, width) for point, width in self.chokes],
+                               dtype=np.float32).reshape(-1, 3),
+            'wall_pylon': optional(self.wall_pylon),
+            'wall_buildings': self._points(self.wall_buildings),
+            'wall_warpin': optional(self.wall_warpin),
+            # float16 keeps ground distances to within a cell on the largest maps at half the size
+            'distance': self.distance.astype(np.float16),
+            'enemy_distance': self.enemy_distance.astype(np.float16),
+        }
+
+    def _unpack(self, data):
+        points = lambda name: [Point2((float(x), float(y))) for x, y in data[name]]
+        optional = lambda name: Point2(tuple(float(v) for v in data[name])) if data[name].size else None
+        self.ramps = points('ramps')
+        self.ramp_bottoms = points('ramp_bottoms')
+        self.expansions = points('expansions')
+        self.chokes = [(Point2((float(x), float(y))), float(width)) for x, y, width in data['chokes']]
+        self.wall_pylon = optional('wall_pylon')
+        self.wall_buildings = points('wall_buildings')
+        self.wall_warpin = optional('wall_warpin')
+        self.distance = data['distance'].astype(np.float32)
+        self.enemy_distance = data['enemy_distance'].astype(np.float32)
+
+    # -----------------QUERIES----------------
+
+    def ground_distance_to(self, point, from_enemy=False):
+        '''
+        :return: ground distance from our (or the enemy's) start location to point, inf when unreachable
+        '''
+        field = self.enemy_distance if from_enemy else self.distance
+        x = min(max(int(point[0]), 0), field.shape[1] - 1)
+        y = min(max(int(point[1]), 0), field.shape[0] - 1)
+        return float(field[y, x])
+
+    @property
+    def natural(self):
+        return self.expansions[1] if len(self.expansions) > 1 else None
+
+    @property
+    def third(self):
+        return self.expansions[2] if len(self.expansions) > 2 else None
+
+    @property
+    def natural_ramp(self):
+        '''
+        :return: top center of the ramp second closest to our start location, where the army defends the natural
+        '''
+        return self.ramps[1] if len(self.ramps) > 1 else None
+
+    def next_expansion(self):
+        '''
+        :return: the closest expansion by ground distance without a known townhall, or None when all are taken
+        '''
+        townhalls = list(self.bot.townhalls) + list(self.bot.enemy_structures.of_type(TOWNHALL_TYPES))
+        for expansion in self.expansions:
+            if not any(townhall.distance_to(expansion) < EXPANSION_GAP for townhall in townhalls):
+                return expansion
+        return None
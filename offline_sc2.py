@@ -0,0 +1,278 @@
+from s2clientprotocol import common_pb2, data_pb2, raw_pb2, sc2api_pb2
+from sc2.client import Client
+from sc2.data import ActionResult, Alliance, Attribute, DisplayType, Race
+from sc2.dicts.unit_research_abilities import RESEARCH_INFO
+from sc2.dicts.unit_train_build_abilities import TRAIN_INFO
+from sc2.game_data import GameData
+from sc2.game_info import GameInfo
+from sc2.game_state import GameState
+from sc2.ids.ability_id import AbilityId
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.ids.upgrade_id import UpgradeId
+import numpy as np
+import fake_sc2_env
+from fake_sc2_env import ALLIANCE, BUILD_PROGRESS, HEALTH, RADIUS, SHIELD, TAG, UNIT_TYPE, X, Y
+
+# the FakeSC2Env map: each start is a main of MAIN_RADIUS cells on high ground, ringed by CLIFF_WIDTH unpathable
+# cells and left through a RAMP_WIDTH wide ramp towards the open low ground
+MAP_SIZE = 64
+PLAYABLE_BORDER = 2
+MAIN_RADIUS = 11
+CLIFF_WIDTH = 2
+RAMP_WIDTH = 3
+RAMP_DIRECTION = (0, 1)
+# terrain_height bytes, height = -16 + 32 * byte / 255
+LOW_GROUND = 100
+HIGH_GROUND = 130
+
+# cost, supply and build time (game loops) of the Protoss unit types:
+# (minerals, vespene, food required, food provided, build loops)
+UNIT_COSTS = {
+    UnitTypeId.NEXUS: (400, 0, 0, 15, 1590),
+    UnitTypeId.PYLON: (100, 0, 0, 8, 400),
+    UnitTypeId.ASSIMILATOR: (75, 0, 0, 0, 480),
+    UnitTypeId.GATEWAY: (150, 0, 0, 0, 1040),
+    UnitTypeId.WARPGATE: (150, 0, 0, 0, 160),
+    UnitTypeId.FORGE: (150, 0, 0, 0, 720),
+    UnitTypeId.CYBERNETICSCORE: (150, 0, 0, 0, 800),
+    UnitTypeId.PHOTONCANNON: (150, 0, 0, 0, 640),
+    UnitTypeId.SHIELDBATTERY: (100, 0, 0, 0, 640),
+    UnitTypeId.TWILIGHTCOUNCIL: (150, 100, 0, 0, 800),
+    UnitTypeId.ROBOTICSFACILITY: (150, 100, 0, 0, 1040),
+    UnitTypeId.STARGATE: (150, 150, 0, 0, 960),
+    UnitTypeId.TEMPLARARCHIVE: (150, 200, 0, 0, 800),
+    UnitTypeId.DARKSHRINE: (150, 150, 0, 0, 1590),
+    UnitTypeId.ROBOTICSBAY: (150, 150, 0, 0, 1040),
+    UnitTypeId.FLEETBEACON: (300, 200, 0, 0, 960),
+    UnitTypeId.PROBE: (50, 0, 1, 0, 272),
+    UnitTypeId.ZEALOT: (100, 0, 2, 0, 608),
+    UnitTypeId.STALKER: (125, 50, 2, 0, 672),
+    UnitTypeId.SENTRY: (50, 100, 2, 0, 592),
+    UnitTypeId.ADEPT: (100, 25, 2, 0, 608),
+    UnitTypeId.HIGHTEMPLAR: (50, 150, 2, 0, 880),
+    UnitTypeId.DARKTEMPLAR: (125, 125, 2, 0, 880),
+    UnitTypeId.ARCHON: (0, 0, 4, 0, 268),
+    UnitTypeId.OBSERVER: (25, 75, 1, 0, 480),
+    UnitTypeId.IMMORTAL: (275, 100, 4, 0, 880),
+}
+STRUCTURES = {UnitTypeId.NEXUS, UnitTypeId.PYLON, UnitTypeId.ASSIMILATOR, UnitTypeId.GATEWAY, UnitTypeId.WARPGATE,
+              UnitTypeId.FORGE, UnitTypeId.CYBERNETICSCORE, UnitTypeId.PHOTONCANNON, UnitTypeId.SHIELDBATTERY,
+              UnitTypeId.TWILIGHTCOUNCIL, UnitTypeId.ROBOTICSFACILITY, UnitTypeId.STARGATE,
+              UnitTypeId.TEMPLARARCHIVE, UnitTypeId.DARKSHRINE, UnitTypeId.ROBOTICSBAY, UnitTypeId.FLEETBEACON}
+# (minerals, vespene, research loops), upgrades missing here cost 100/100
+UPGRADE_COSTS = {
+    UpgradeId.WARPGATERESEARCH: (50, 50, 2240),
+    UpgradeId.CHARGE: (100, 100, 2240),
+    UpgradeId.BLINKTECH: (150, 150, 2720),
+    UpgradeId.PROTOSSGROUNDWEAPONSLEVEL1: (100, 100, 2880),
+    UpgradeId.PROTOSSGROUNDWEAPONSLEVEL2: (150, 150, 3440),
+    UpgradeId.PROTOSSGROUNDWEAPONSLEVEL3: (200, 200, 4000),
+    UpgradeId.PROTOSSGROUNDARMORSLEVEL1: (100, 100, 2880),
+    UpgradeId.PROTOSSGROUNDARMORSLEVEL2: (150, 150, 3440),
+    UpgradeId.PROTOSSGROUNDARMORSLEVEL3: (200, 200, 4000),
+}
+# target kinds of the abilities that don't create anything, python-sc2 checks commands against them
+TARGET = data_pb2.AbilityData.Target
+COMMAND_ABILITIES = {AbilityId.ATTACK: TARGET.PointOrUnit, AbilityId.MOVE: TARGET.PointOrUnit,
+                     AbilityId.SMART: TARGET.PointOrUnit, AbilityId.HARVEST_GATHER: TARGET.Unit,
+                     AbilityId.MORPH_ARCHON: getattr(TARGET, 'None')}
+POWER_RADIUS = 6.5
+
+
+class OfflineClient(Client):
+    '''
+    Answers the queries a bot's on_step makes without a game: every placement is valid, pathing distance is the
+    straight line and no ability is available, so warp-ins are skipped.
+    '''
+
+    def __init__(self):
+        # there's no websocket, a request the methods below don't answer fails on the placeholder
+        super(OfflineClient, self).__init__(object())
+
+    async def query_building_placement(self, ability, positions, ignore_resources=True):
+        return [ActionResult.Success for _ in positions]
+
+    async def _query_building_placement_fast(self, ability, positions, ignore_resources=True):
+        return [True for _ in positions]
+
+    async def query_pathing(self, start, end):
+        return start.position.distance_to(end)
+
+    async def query_pathings(self, zipped_list):
+        return [start.position.distance_to(end) for start, end in zipped_list]
+
+    async def query_available_abilities(self, units, ignore_resource_requirements=False):
+        return [[] for _ in units]
+
+
+# -----------------RECORDINGS----------------
+
+def game_data():
+    '''
+    :return: a Response with the ResponseData of the Protoss units, abilities and upgrades the bots use, costs
+    from UNIT_COSTS and UPGRADE_COSTS and creation / research abilities from python-sc2's own tables
+    '''
+    creation = {}
+    abilities = dict(COMMAND_ABILITIES)
+    for producer in UNIT_COSTS:
+        for unit_type, info in TRAIN_INFO.get(producer, {}).items():
+            creation.setdefault(unit_type, info['ability'])
+            if unit_type == UnitTypeId.ASSIMILATOR:
+                abilities[info['ability']] = TARGET.Unit
+            elif info.get('requires_placement_position'):
+                abilities[info['ability']] = TARGET.Point
+            else:
+                abilities[info['ability']] = getattr(TARGET, 'None')
+    creation[UnitTypeId.ARCHON] = AbilityId.MORPH_ARCHON
+    research = {}
+    for producer in UNIT_COSTS:
+        for upgrade, info in RESEARCH_INFO.get(producer, {}).items():
+            research[upgrade] = info['ability']
+            abilities[info['ability']] = getattr(TARGET, 'None')
+
+    data = sc2api_pb2.ResponseData()
+    for unit_type, (minerals, vespene, food_required, food_provided, build_loops) in UNIT_COSTS.items():
+        unit = data.units.add(unit_id=unit_type.value, name=unit_type.name, available=True, mineral_cost=minerals,
+                              vespene_cost=vespene, food_required=food_required, food_provided=food_provided,
+                              race=Race.Protoss.value, build_time=build_loops,
+                              ability_id=creation.get(unit_type, AbilityId.NULL_NULL).value)
+        unit.attributes.append(Attribute.Structure.value if unit_type in STRUCTURES else Attribute.Light.value)
+        if unit_type == UnitTypeId.WARPGATE:
+            unit.tech_alias.append(UnitTypeId.GATEWAY.value)
+    for unit_type in (UnitTypeId.MINERALFIELD, UnitTypeId.VESPENEGEYSER):
+        unit = data.units.add(unit_id=unit_type.value, name=unit_type.name, available=True,
+                              has_minerals=unit_type == UnitTypeId.MINERALFIELD,
+                              has_vespene=unit_type == UnitTypeId.VESPENEGEYSER)
+        unit.attributes.append(Attribute.Structure.value)
+    for ability, target in sorted(abilities.items(), key=lambda item: item[0].value):
+        data.abilities.add(ability_id=ability.value, link_name=ability.name, button_name=ability.name,
+                           friendly_name=ability.name, available=True, target=target)
+    for upgrade, ability in research.items():
+        minerals, vespene, loops = UPGRADE_COSTS.get(upgrade, (100, 100, 2240))
+        data.upgrades.add(upgrade_id=upgrade.value, name=upgrade.name, mineral_cost=minerals, vespene_cost=vespene,
+                          research_time=loops, ability_id=ability.value)
+    return sc2api_pb2.Response(data=data)
+
+
+def image(grid, bits_per_pixel):
+    height, width = grid.shape
+    data = np.packbits(grid.astype(bool)) if bits_per_pixel == 1 else grid.astype(np.uint8)
+    return common_pb2.ImageData(bits_per_pixel=bits_per_pixel, size=common_pb2.Size2DI(x=width, y=height),
+                                data=data.tobytes())
+
+
+def map_grids():
+    '''
+    Pathing, placement and height grids, indexed [y, x], of the FakeSC2Env map.
+    '''
+    ys, xs = np.indices((MAP_SIZE, MAP_SIZE)) + 0.5
+    height = np.full((MAP_SIZE, MAP_SIZE), LOW_GROUND, dtype=np.uint8)
+    pathable = np.zeros((MAP_SIZE, MAP_SIZE), dtype=bool)
+    pathable[PLAYABLE_BORDER:-PLAYABLE_BORDER, PLAYABLE_BORDER:-PLAYABLE_BORDER] = True
+    ramps = np.zeros_like(pathable)
+    for top_left in (True, False):
+        x, y = fake_sc2_env.reflect(fake_sc2_env.TOP_LEFT_NEXUS, top_left)
+        dx, dy = RAMP_DIRECTION if top_left else (-RAMP_DIRECTION[0], -RAMP_DIRECTION[1])
+        distance = np.hypot(xs - x, ys - y)
+        along = (xs - x) * dx + (ys - y) * dy
+        across = np.abs((xs - x) * dy - (ys - y) * dx)
+        ramp = (along > MAIN_RADIUS - 1) & (along <= MAIN_RADIUS + CLIFF_WIDTH + 1) & (across <= RAMP_WIDTH / 2.0)
+        height[distance <= MAIN_RADIUS] = HIGH_GROUND
+        pathable[(distance > MAIN_RADIUS) & (distance <= MAIN_RADIUS + CLIFF_WIDTH) & ~ramp] = False
+        descent = np.clip((along - MAIN_RADIUS + 1) / (CLIFF_WIDTH + 2), 0, 1)
+        height[ramp] = np.round(HIGH_GROUND + (LOW_GROUND - HIGH_GROUND) * descent[ramp]).astype(np.uint8)
+        ramps |= ramp
+    return pathable, pathable & ~ramps, height
+
+
+def game_info(env):
+    '''
+    :param env: a reset FakeSC2Env, the enemy start location is its enemy nexus
+    :return: a Response with the ResponseGameInfo of the env's map
+    '''
+    pathable, placeable, height = map_grids()
+    enemy_start = fake_sc2_env.reflect(fake_sc2_env.TOP_LEFT_NEXUS, not env.top_left)
+    start_raw = raw_pb2.StartRaw(map_size=common_pb2.Size2DI(x=MAP_SIZE, y=MAP_SIZE),
+                                 pathing_grid=image(pathable, 1), placement_grid=image(placeable, 1),
+                                 terrain_height=image(height, 8),
+                                 playable_area=common_pb2.RectangleI(
+                                     p0=common_pb2.PointI(x=PLAYABLE_BORDER, y=PLAYABLE_BORDER),
+                                     p1=common_pb2.PointI(x=MAP_SIZE - PLAYABLE_BORDER,
+                                                          y=MAP_SIZE - PLAYABLE_BORDER)),
+                                 start_locations=[common_pb2.Point2D(x=enemy_start[0], y=enemy_start[1])])
+    info = sc2api_pb2.ResponseGameInfo(map_name='FakeSC2Env', start_raw=start_raw)
+    for player_id in (1, 2):
+        info.player_info.add(player_id=player_id, type=sc2api_pb2.Participant, race_requested=Race.Protoss.value,
+                             race_actual=Race.Protoss.value)
+    return sc2api_pb2.Response(game_info=info)
+
+
+def observation(env):
+    '''
+    Converts the env's units and our player's totals to the ResponseObservation python-sc2 reads, as seen by
+    player 1 with full vision. Gathering probes carry a gather order on their mineral field or assimilator.
+    '''
+    height = map_grids()[2]
+    side = env.sides[fake_sc2_env.SELF]
+    response = sc2api_pb2.ResponseObservation()
+    observation = response.observation
+    observation.game_loop = env.game_loop
+    observation.player_common.player_id = 1
+    observation.player_common.minerals = int(side.minerals)
+    observation.player_common.vespene = int(side.vespene)
+    observation.player_common.food_cap = min(side.supply_cap, fake_sc2_env.MAX_SUPPLY)
+    observation.player_common.food_used = side.food_used
+    observation.player_common.food_army = 2 * side.army
+    observation.player_common.food_workers = side.workers
+    observation.player_common.army_count = side.army
+    raw = observation.raw_data
+    raw.player.camera.x, raw.player.camera.y = fake_sc2_env.reflect(fake_sc2_env.TOP_LEFT_NEXUS, env.top_left)
+
+    alliances = {fake_sc2_env.SELF: Alliance.Self.value, fake_sc2_env.ENEMY: Alliance.Enemy.value,
+                 fake_sc2_env.NEUTRAL: Alliance.Neutral.value}
+    owners = {fake_sc2_env.SELF: 1, fake_sc2_env.ENEMY: 2, fake_sc2_env.NEUTRAL: 16}
+    for row in env.units[:env.n]:
+        unit_type = UnitTypeId(int(row[UNIT_TYPE]))
+        alliance = int(row[ALLIANCE])
+        data = fake_sc2_env.UNIT_DATA[unit_type.value]
+        x, y = float(row[X]), float(row[Y])
+        z = -16 + 32 * int(height[min(int(y), MAP_SIZE - 1), min(int(x), MAP_SIZE - 1)]) / 255.0
+        unit = raw.units.add(display_type=DisplayType.Visible.value, alliance=alliances[alliance],
+                             tag=int(row[TAG]), unit_type=unit_type.value, owner=owners[alliance],
+                             pos=common_pb2.Point(x=x, y=y, z=z), radius=float(row[RADIUS]),
+                             build_progress=float(row[BUILD_PROGRESS]) / 100, health=float(row[HEALTH]),
+                             health_max=data.health, shield=float(row[SHIELD]), shield_max=data.shield,
+                             mineral_contents=int(row[fake_sc2_env.MINERAL_CONTENTS]),
+                             vespene_contents=int(row[fake_sc2_env.VESPENE_CONTENTS]),
+                             assigned_harvesters=int(row[fake_sc2_env.ASSIGNED_HARVESTERS]),
+                             ideal_harvesters=int(row[fake_sc2_env.IDEAL_HARVESTERS]), is_powered=True)
+        target = env.gathering.get(int(row[TAG]))
+        if target is not None:
+            unit.orders.add(ability_id=AbilityId.HARVEST_GATHER.value, target_unit_tag=target)
+        if (alliance == fake_sc2_env.SELF and unit_type == UnitTypeId.PYLON and row[BUILD_PROGRESS] >= 100):
+            raw.player.power_sources.add(pos=common_pb2.Point(x=x, y=y, z=z), radius=POWER_RADIUS,
+                                         tag=int(row[TAG]))
+    return response
+
+
+def recording(env):
+    '''
+    :param env: a FakeSC2Env, reset and populated
+    :return: (game data, game info, observation) protos in the format of python-sc2's recorded test data
+    '''
+    return game_data(), game_info(env), observation(env)
+
+
+def start_bot(bot, recorded, loop):
+    '''
+    Prepares bot on a recording the way python-sc2's game loop does and runs its on_start.
+    :param recorded: (game data, game info, observation) protos
+    :param loop: the asyncio event loop to run on_start on
+    '''
+    raw_game_data, raw_game_info, raw_observation = recorded
+    bot._initialize_variables()
+    bot._prepare_start(client=OfflineClient(), player_id=1, game_info=GameInfo(raw_game_info.game_info),
+                       game_data=GameData(raw_game_data.data))
+    bot._prepare_step(state=GameState(raw_observation), proto_game_info=raw_game_info)
+    bot._prepare_first_step()
+    loop.run_until_complete(bot.on_start())
@@ -0,0 +1,56 @@
+from sc2.position import Point2
+
+# a point target this close to the unit's current target counts as the same order
+TARGET_TOLERANCE = 1.0
+# a unit this close to the point it was last sent to has arrived, sending it there again changes nothing
+ARRIVAL_DISTANCE = 2.0
+
+
+class OrderFilter:
+    '''
+    Drops commands that wouldn't change what a unit does. Remembers the last (ability, target) sent to every unit
+    tag and compares new commands with it and with the unit's current orders, so army-wide commands repeated
+    every step only reach the units that need them.
+    '''
+
+    def __init__(self):
+        self.last_orders = {}
+        self.sent = 0
+        self.dropped = 0
+
+    @staticmethod
+    def same_target(a, b):
+        if a is None or b is None:
+            return a is b
+        if isinstance(a, int) or isinstance(b, int):
+            return a == b
+        a, b = Point2(a), Point2(b)
+        return a.distance_to_point2(b) <= TARGET_TOLERANCE
+
+    def is_redundant(self, unit, ability, target):
+        if unit.orders:
+            order = unit.orders[0]
+            if order.ability.id == ability and self.same_target(order.target, target):
+                return True
+        last = self.last_orders.get(unit.tag)
+        if last is None or last[0] != ability or not self.same_target(last[1], target):
+            return False
+        return isinstance(target, Point2) and unit.distance_to(target) <= ARRIVAL_DISTANCE
+
+    def issue(self, unit, ability, target=None, queue=False):
+        '''
+        Sends unit(ability, target, queue) unless it's redundant. Queued commands are always sent.
+        :param target: a Point2, a Unit or None
+        :return: True when the command was sent
+        '''
+        key = target.tag if hasattr(target, 'tag') else target
+        if not queue and self.is_redundant(unit, ability, key):
+            self.dropped += 1
+            return False
+        unit(ability, target=target, queue=queue)
+        self.last_orders[unit.tag] = (ability, key)
+        self.sent += 1
+        return True
+
+    def forget(self, unit_tag):
+        self.last_orders.pop(unit_tag, None)
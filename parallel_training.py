@@ -0,0 +1,240 @@
+from pysc2.env import run_loop
+from absl import app, flags
+import functools
+import multiprocessing as mp
+import numpy as np
+import os
+import queue
+import random
+import time
+import traceback
+from q_table import QLearningTable, KEY_DTYPE, FREE_KEY
+from fake_sc2_env import FakeSC2Env
+import pysc2_bot
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer("workers", max(mp.cpu_count() - 1, 1), "Number of training processes.")
+flags.DEFINE_integer("episodes", 1000, "Episodes per worker.")
+flags.DEFINE_integer("sync_every", 5, "Episodes a worker plays between merges with the shared Q-table.")
+flags.DEFINE_enum("env", "sc2", ["sc2", "fake"], "Environment of every worker: SC2 or FakeSC2Env, which needs no "
+                                                 "StarCraft install.")
+
+ENV_FACTORIES = {'sc2': pysc2_bot.make_env, 'fake': FakeSC2Env}
+
+
+class SyncingWorker:
+    '''
+    Worker side of the delta merge. Keeps the values the worker's table had at the last sync, sends the
+    difference for every row the agent learned on since then and overwrites its rows with the merged ones.
+    '''
+
+    def __init__(self, worker_id, q_table, inbox, outbox):
+        self.worker_id = worker_id
+        self.q_table = q_table
+        self.inbox = inbox
+        self.outbox = outbox
+        self.seen_version = 0
+        self.base = q_table.values.copy()
+        if hasattr(q_table, 'add_listener'):
+            q_table.add_listener(self.on_rows_replaced)
+
+    def on_rows_replaced(self, event, rows, values):
+        '''
+        Evicted and restored rows of a bounded table weren't learned here, their base moves with them so they
+        aren't sent as deltas.
+        '''
+        if rows.max() >= len(self.base):
+            grown = np.zeros((len(self.q_table.state_keys), len(self.q_table.actions)), dtype=self.base.dtype)
+            grown[:len(self.base)] = self.base
+            self.base = grown
+        self.base[rows] = values
+
+    def sync(self, episodes):
+        table = self.q_table
+        rows = np.array(sorted(table.dirty_rows), dtype=np.int64)
+        base = np.zeros((len(rows), len(table.actions)), dtype=table.q_values.dtype)
+        known = rows < len(self.base)
+        base[known] = self.base[rows[known]]
+        keys = np.array([table.state_keys[row] for row in rows.tolist()], dtype=KEY_DTYPE)
+        # rows a bounded table freed since the last sync are dirty too, but hold no state
+        live = keys != FREE_KEY
+
+        self.outbox.put(('sync', self.worker_id, keys[live], (table.q_values[rows] - base)[live], self.seen_version,
+                         episodes))
+        keys, values, self.seen_version = self.inbox.get()
+
+        # one row at a time, a bounded table may evict rows while the merged states are added
+        for key, value in zip(keys.tolist(), values):
+            table.q_values[table.check_if_state_exists(key)] = value
+        table.dirty_rows.clear()
+        self.base = table.values.copy()
+
+
+def train_worker(worker_id, episodes, sync_every, env_factory, agent_factory, inbox, outbox, seed):
+    '''
+    Runs one environment and one agent, merging its Q-table with the coordinator every sync_every episodes.
+    '''
+    try:
+        if not FLAGS.is_parsed():
+            FLAGS.mark_as_parsed()
+        random.seed(seed)
+        np.random.seed(seed)
+        agent = agent_factory()
+        if not isinstance(agent.q_table, QLearningTable):
+            raise TypeError("parallel training merges Q-table rows, %s isn't supported" % type(agent.q_table).__name__)
+        worker = SyncingWorker(worker_id, agent.q_table, inbox, outbox)
+        worker.sync(0)
+        played = 0
+        with env_factory() as env:
+            while played < episodes:
+                chunk = min(sync_every, episodes - played)
+                run_loop.run_loop([agent], env, max_episodes=chunk)
+                played += chunk
+                worker.sync(chunk)
+        outbox.put(('done', worker_id, None))
+    except Exception:
+        outbox.put(('error', worker_id, traceback.format_exc()))
+
+
+class ParallelTrainer:
+    '''
+    Trains N agents in N processes against one shared Q-table. Workers send the deltas of the rows they updated;
+    the coordinator adds them to the shared table, versions the touched rows and sends back every row changed
+    since that worker's last sync. Workers only wait on each other at a merge, so throughput scales with cores.
+    The shared table is built with the workers' max_states and q_dtype (see pysc2_bot.make_q_table), a bounded one
+    also spills to spill_path.
+    '''
+
+    def __init__(self, actions, workers, episodes, sync_every=5, env_factory=pysc2_bot.make_env,
+                 agent_factory=pysc2_bot.rlAgent, checkpoint_path=None, checkpoint_every=50, seed=0, max_states=0,
+                 q_dtype='float64', spill_path=None):
+        self.workers = workers
+        self.episodes = episodes
+        self.sync_every = sync_every
+        self.env_factory = env_factory
+        self.agent_factory = agent_factory
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.seed = seed
+
+        self.q_table = pysc2_bot.make_q_table(actions, max_states, q_dtype, spill_path)
+        if checkpoint_path and os.path.exists(QLearningTable.checkpoint_files(checkpoint_path)[2]):
+            self.q_table.load(checkpoint_path)
+        # rows of a resumed table count as version 1, so every worker receives them on its first sync
+        self.version = 1
+        self.row_versions = np.ones(len(self.q_table.state_keys), dtype=np.int64)
+        self.row_versions[np.array(self.q_table.state_keys, dtype=KEY_DTYPE) == FREE_KEY] = 0
+        if hasattr(self.q_table, 'add_listener'):
+            self.q_table.add_listener(self.on_rows_replaced)
+        self.episodes_done = 0
+
+    def on_rows_replaced(self, event, rows, values):
+        '''
+        Evicted rows have no state to send until a merge reuses them, restored rows are sent with their next merge.
+        '''
+        if event == 'evict':
+            self.row_versions[rows[rows < len(self.row_versions)]] = 0
+
+    def merge(self, keys, deltas):
+        table = self.q_table
+        rows = []
+        # one row at a time, a bounded table may evict rows while the merged states are added
+        for key, delta in zip(keys.tolist(), deltas):
+            row = table.check_if_state_exists(key)
+            table.q_values[row] += delta
+            rows.append(row)
+        rows = np.array(rows, dtype=np.int64)
+        table.dirty_rows.update(rows.tolist())
+        if len(self.row_versions) < len(table.state_keys):
+            grown = np.zeros(max(len(table.state_keys), 2 * len(self.row_versions)), dtype=np.int64)
+            grown[:len(self.row_versions)] = self.row_versions
+            self.row_versions = grown
+        self.version += 1
+        # rows evicted later in this merge already had their version reset
+        live = np.array([table.state_keys[row] != FREE_KEY for row in rows.tolist()], dtype=bool)
+        self.row_versions[rows[live]] = self.version
+
+    def changed_since(self, version):
+        rows = np.flatnonzero(self.row_versions[:len(self.q_table.state_keys)] > version)
+        keys = np.array([self.q_table.state_keys[row] for row in rows.tolist()], dtype=KEY_DTYPE)
+        return keys, self.q_table.q_values[rows].copy(), self.version
+
+    def run(self):
+        '''
+        :return: a dict of run statistics
+        '''
+        outbox = mp.Queue()
+        inboxes = [mp.Queue() for _ in range(self.workers)]
+        processes = [mp.Process(target=train_worker,
+                                args=(i, self.episodes, self.sync_every, self.env_factory, self.agent_factory,
+                                      inboxes[i], outbox, self.seed + i),
+                                daemon=True)
+                     for i in range(self.workers)]
+        start = time.time()
+        for process in processes:
+            process.start()
+
+        running = set(range(self.workers))
+        errors = {}
+        last_checkpoint = 0
+        try:
+            while running:
+                try:
+                    message = outbox.get(timeout=5)
+                except queue.Empty:
+                    for i in list(running):
+                        if not processes[i].is_alive():
+                            errors[i] = "exited with code %s" % processes[i].exitcode
+                            running.discard(i)
+                    continue
+
+                kind, worker_id = message[0], message[1]
+                if kind == 'sync':
+                    _, _, keys, deltas, seen_version, episodes = message
+                    self.merge(keys, deltas)
+                    inboxes[worker_id].put(self.changed_since(seen_version))
+                    self.episodes_done += episodes
+                    if self.checkpoint_path and self.episodes_done - last_checkpoint >= self.checkpoint_every:
+                        self.q_table.save(self.checkpoint_path)
+                        last_checkpoint = self.episodes_done
+                else:
+                    running.discard(worker_id)
+                    if kind == 'error':
+                        errors[worker_id] = message[2]
+                        print("Worker %d failed:\n%s" % (worker_id, message[2]))
+        finally:
+            for process in processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+            if self.checkpoint_path:
+                self.q_table.save(self.checkpoint_path)
+
+        elapsed = time.time() - start
+        return {'workers': self.workers,
+                'episodes': self.episodes_done,
+                'seconds': elapsed,
+                'episodes_per_hour': self.episodes_done * 3600 / elapsed if elapsed else 0.0,
+                'states': len(self.q_table),
+                'errors': errors}
+
+
+def main(unused_argv):
+    if FLAGS.learner != 'table':
+        raise app.UsageError("parallel training merges Q-table rows, --learner=%s isn't supported" % FLAGS.learner)
+    # workers don't spill, a spill file is only read back by the table that wrote it
+    agent_factory = functools.partial(pysc2_bot.rlAgent, replay_capacity=FLAGS.replay_capacity,
+                                      replay_batch_size=FLAGS.replay_batch_size, replay_updates=FLAGS.replay_updates,
+                                      mask_actions=FLAGS.mask_actions, max_states=FLAGS.q_max_states,
+                                      q_dtype=FLAGS.q_dtype)
+    trainer = ParallelTrainer(pysc2_bot.ProtossAgent().actions, FLAGS.workers, FLAGS.episodes, FLAGS.sync_every,
+                              env_factory=ENV_FACTORIES[FLAGS.env], agent_factory=agent_factory,
+                              checkpoint_path=FLAGS.checkpoint, checkpoint_every=FLAGS.checkpoint_every,
+                              max_states=FLAGS.q_max_states, q_dtype=FLAGS.q_dtype, spill_path=FLAGS.q_spill)
+    stats = trainer.run()
+    print("Trained %(episodes)d episodes on %(workers)d workers in %(seconds).1fs "
+          "(%(episodes_per_hour).0f episodes/hour), %(states)d states" % stats)
+
+
+if __name__ == "__main__":
+    app.run(main)
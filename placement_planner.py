@@ -0,0 +1,202 @@
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.position import Point2
+import numpy as np
+
+POWER_RADIUS = 6.5
+# cells around mineral fields and geysers kept free so mining paths stay open
+RESOURCE_BUFFER = 3
+# pylon slots are kept in this ring (distance from the townhall center) on the side facing the map center
+PYLON_RING = (5.0, 10.0)
+# a reserved slot whose building hasn't started after this many game seconds is given back
+RESERVATION_SECONDS = 10.0
+
+BUILDING_SIZES = {
+    UnitTypeId.PYLON: 2,
+    UnitTypeId.SHIELDBATTERY: 2,
+    UnitTypeId.PHOTONCANNON: 2,
+    UnitTypeId.DARKSHRINE: 2,
+    UnitTypeId.GATEWAY: 3,
+    UnitTypeId.CYBERNETICSCORE: 3,
+    UnitTypeId.FORGE: 3,
+    UnitTypeId.ROBOTICSFACILITY: 3,
+    UnitTypeId.ROBOTICSBAY: 3,
+    UnitTypeId.TWILIGHTCOUNCIL: 3,
+    UnitTypeId.TEMPLARARCHIVE: 3,
+    UnitTypeId.STARGATE: 3,
+    UnitTypeId.FLEETBEACON: 3,
+}
+
+
+class Anchor:
+    '''
+    A pylon (whose power field holds building slots) or a townhall (whose surroundings hold pylon slots), with its
+    candidate slots of every size ordered best first. Slots are (x0, y0, size) bottom-left cell footprints.
+    '''
+
+    def __init__(self, tag, center, powers):
+        self.tag = tag
+        self.center = center
+        self.powers = powers
+        self.slots = {}
+
+
+class PlacementPlanner:
+    '''
+    Keeps building slots around pylons and townhalls so building commands get a spot without a find_placement
+    round-trip to the engine. Placeable cells come from game_info.placement_grid once at start; an occupancy grid
+    is updated incrementally as structures start, die or slots are reserved. Every slot is checked against the
+    grids with a one cell margin, so buildings never touch and units can always walk between them.
+    Slot lists are validated lazily when handed out and only the anchors near a freed footprint are refilled,
+    so take() is amortized O(1).
+    '''
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.placeable = None
+        self.occupied = None
+        self.footprints = {}
+        self.anchors = {}
+        self.reserved = {}
+        # bumped on every occupancy change, so caches derived from the grids know when to rebuild
+        self.version = 0
+
+    def start(self):
+        '''
+        Call from on_start, reads the placement grid and registers the starting structures.
+        '''
+        self.placeable = self.bot.game_info.placement_grid.data_numpy != 0
+        self.occupied = np.zeros(self.placeable.shape, dtype=np.int16)
+        ys, xs = np.indices(self.placeable.shape)
+        for resource in self.bot.resources:
+            x, y = resource.position
+            self.placeable[np.hypot(xs + 0.5 - x, ys + 0.5 - y) <= RESOURCE_BUFFER] = False
+        for structure in self.bot.structures:
+            self.add_structure(structure)
+            if structure.is_ready:
+                self.add_anchor(structure)
+
+    @staticmethod
+    def footprint(center, size):
+        return int(round(center[0] - size / 2)), int(round(center[1] - size / 2)), size
+
+    def fits(self, slot):
+        x0, y0, size = slot
+        height, width = self.placeable.shape
+        if x0 < 1 or y0 < 1 or x0 + size + 1 > width or y0 + size + 1 > height:
+            return False
+        return (self.placeable[y0:y0 + size, x0:x0 + size].all()
+                and not self.occupied[y0 - 1:y0 + size + 1, x0 - 1:x0 + size + 1].any())
+
+    def _mark(self, slot, amount):
+        x0, y0, size = slot
+        self.occupied[y0:y0 + size, x0:x0 + size] += amount
+        self.version += 1
+
+    # -----------------STRUCTURES----------------
+
+    def add_structure(self, unit):
+        '''
+        Call from on_building_construction_started. Marks the footprint and drops the matching reservation.
+        '''
+        if unit.footprint_radius is None or unit.tag in self.footprints:
+            return
+        slot = self.footprint(unit.position, int(round(2 * unit.footprint_radius)))
+        if self.reserved.pop(slot, None) is not None:
+            self._mark(slot, -1)
+        self.footprints[unit.tag] = slot
+        self._mark(slot, 1)
+
+    def add_anchor(self, unit):
+        '''
+        Call from on_building_construction_complete. Pylons add powered slots, townhalls add pylon slots.
+        '''
+        if unit.type_id == UnitTypeId.PYLON:
+            anchor = Anchor(unit.tag, unit.position, powers=True)
+        elif unit.type_id == UnitTypeId.NEXUS:
+            anchor = Anchor(unit.tag, unit.position, powers=False)
+        else:
+            return
+        self.anchors[unit.tag] = anchor
+        self._fill(anchor)
+
+    def remove_structure(self, tag):
+        '''
+        Call from on_unit_destroyed. Frees the footprint and refills the anchors around it.
+        '''
+        self.anchors.pop(tag, None)
+        slot = self.footprints.pop(tag, None)
+        if slot is not None:
+            self._mark(slot, -1)
+            self._refill_near(slot)
+
+    def _refill_near(self, slot):
+        x0, y0, size = slot
+        center = (x0 + size / 2, y0 + size / 2)
+        for anchor in self.anchors.values():
+            if np.hypot(anchor.center[0] - center[0], anchor.center[1] - center[1]) <= PYLON_RING[1] + size:
+                self._fill(anchor)
+
+    def _fill(self, anchor):
+        cx, cy = anchor.center
+        if anchor.powers:
+            sizes, low, high = (2, 3), 0.0, POWER_RADIUS
+            ox, oy = cx, cy
+        else:
+            sizes, (low, high) = (2,), PYLON_RING
+            ox, oy = Point2(anchor.center).towards(self.bot.game_info.map_center, (low + high) / 2)
+        for size in sizes:
+            reach = int(high) + size
+            slots = []
+            for x0 in range(int(cx) - reach, int(cx) + reach + 1):
+                for y0 in range(int(cy) - reach, int(cy) + reach + 1):
+                    distance = np.hypot(x0 + size / 2 - cx, y0 + size / 2 - cy)
+                    if low <= distance <= high and self.fits((x0, y0, size)):
+                        slots.append((np.hypot(x0 + size / 2 - ox, y0 + size / 2 - oy), (x0, y0, size)))
+            # best last, so handing out a slot is a pop()
+            anchor.slots[size] = [slot for _, slot in sorted(slots, reverse=True)]
+
+    # -----------------SLOTS----------------
+
+    def take(self, building, townhall=None):
+        '''
+        Reserves a slot for building. Pylons go around townhall (or any townhall), everything else into the power
+        field of a completed pylon.
+        :return: the Point2 to build at, or None when no slot is free
+        '''
+        self._expire()
+        size = BUILDING_SIZES.get(building)
+        if size is None:
+            return None
+        powered = building != UnitTypeId.PYLON
+        if townhall is not None and not powered:
+            anchors = [self.anchors[townhall.tag]] if townhall.tag in self.anchors else []
+        else:
+            anchors = [anchor for anchor in self.anchors.values() if anchor.powers == powered]
+        for anchor in anchors:
+            slots = anchor.slots.get(size, [])
+            while slots:
+                slot = slots.pop()
+                if self.fits(slot):
+                    self._mark(slot, 1)
+                    self.reserved[slot] = self.bot.time + RESERVATION_SECONDS
+                    return Point2((slot[0] + size / 2, slot[1] + size / 2))
+        return None
+
+    def release(self, position, building):
+        '''
+        Gives back a slot from take() that won't be built on after all.
+        '''
+        slot = self.footprint(position, BUILDING_SIZES[building])
+        if self.reserved.pop(slot, None) is not None:
+            self._mark(slot, -1)
+            self._refill_near(slot)
+
+    def _expire(self):
+        if not self.reserved:
+            return
+        now = self.bot.time
+        for slot, expiry in list(self.reserved.items()):
+            if expiry <= now:
+                del self.reserved[slot]
+                self._mark(slot, -1)
+                self._refill_near(slot)
@@ -1,46 +1,54 @@
 from pysc2.agents import base_agent
 from pysc2.env import sc2_env, run_loop
 from pysc2.lib import actions, features, units
-from absl import app
+from absl import app, flags
+from contextlib import nullcontext
 import numpy as np
-import pandas as pd
+import os
 import random
-
-class QLearningTable:
-
-    def __init__(self, actions, learning_rate=0.01, discount_factor=0.9):
-        self.actions = actions
-        self.learning_rate = learning_rate
-        self.discount_factor = discount_factor
-        self.q_table = pd.DataFrame(columns=self.actions, dtype=np.float64)
-
-    def check_if_state_exists(self, state):
-
-        if state not in self.q_table.index:
-            self.q_table = self.q_table.append(pd.Series([0] * len(self.actions),
-                                                         index=self.q_table.columns,
-                                                         name=state))
-
-    def choose_action(self, obs, epsilon = 0.9):
-        self.check_if_state_exists(obs)
-        if np.random.uniform() < epsilon:
-            state_action = self.q_table.loc[obs, :]
-            action = np.random.choice(state_action[state_action == np.max(state_action)].index) #TODO understand why index
-        else:
-            action = np.random.choice(self.actions)
-        return action
-
-    def learn(self, prev_state, action, reward, state):
-
-        self.check_if_state_exists(state)
-        q_predict = self.q_table.loc[prev_state, action]
-        if state != 'terminal':
-            q_estimate = reward + self.discount_factor * self.q_table.loc[state, :].max()
-        else:
-            q_estimate = reward
-
-        self.q_table.loc[prev_state, action] += self.learning_rate * (q_estimate - q_predict)
-
+from q_table import QLearningTable, BoundedQLearningTable, mask_bits
+from linear_q import LinearQLearner
+from state_encoding import PROTOSS_STATE_ENCODER, PROTOSS_LINEAR_STATE_ENCODER
+from state_features import PROTOSS_STATE_FEATURES, PROTOSS_LINEAR_STATE_FEATURES
+from unit_index import UnitIndex
+from replay_buffer import ReplayBuffer
+from learn_pipeline import LearnPipeline
+from step_profiler import StepProfiler, NULL_PROFILER
+
+FLAGS = flags.FLAGS
+flags.DEFINE_enum("agent", "random", ["random", "rl"], "Which agent to train.")
+flags.DEFINE_string("checkpoint", None, "Q-table checkpoint path prefix, resumed from if it exists.")
+flags.DEFINE_integer("checkpoint_every", 50, "Episodes between Q-table checkpoints.")
+flags.DEFINE_integer("replay_capacity", 0, "Transitions kept for experience replay, 0 disables replay.")
+flags.DEFINE_integer("replay_batch_size", 32, "Transitions per replayed minibatch.")
+flags.DEFINE_integer("replay_updates", 4, "Replayed minibatches per agent step.")
+flags.DEFINE_enum("learner", "table", ["table", "linear"],
+                  "Q-learner of the rl agent: a table of exact states, or linear in normalized counts and "
+                  "tile-coded resources.")
+flags.DEFINE_integer("q_max_states", 0, "States the Q-table keeps in memory, least used ones are evicted past it. "
+                     "0 keeps every state.")
+flags.DEFINE_enum("q_dtype", "float64", ["float64", "float32", "float16"], "Q-table value storage.")
+flags.DEFINE_string("q_spill", None, "SQLite file evicted Q-table rows are spilled to and restored from.")
+flags.DEFINE_bool("pipeline", False, "Run the rl agent's Q-table updates and replay on a worker thread, overlapping "
+                  "them with the environment's next step.")
+flags.DEFINE_bool("mask_actions", True, "Only choose and bootstrap from actions whose preconditions hold.")
+flags.DEFINE_string("profile_dir", None, "Directory for per-game step phase timings, profiling is off when unset.")
+flags.DEFINE_bool("profile_trace", False, "Also write a Chrome trace of every game to profile_dir.")
+
+MINERAL_FIELD_TYPES = [
+    units.Neutral.BattleStationMineralField,
+    units.Neutral.BattleStationMineralField750,
+    units.Neutral.LabMineralField,
+    units.Neutral.LabMineralField750,
+    units.Neutral.MineralField,
+    units.Neutral.MineralField750,
+    units.Neutral.PurifierMineralField,
+    units.Neutral.PurifierMineralField750,
+    units.Neutral.PurifierRichMineralField,
+    units.Neutral.PurifierRichMineralField750,
+    units.Neutral.RichMineralField,
+    units.Neutral.RichMineralField750
+]
 
 class ProtossAgent(base_agent.BaseAgent):
 
@@ -53,12 +61,21 @@ class ProtossAgent(base_agent.BaseAgent):
         #                 "build_gateway",
         #                 "train_zealot",
         #                 "attack")
-        self.actions = ["train_probe", "build_pylon", "build_gateway", "build_assimilator","harvest_gas", "harvest_minerals", "train_zealot", "attack", "build_cyber_core", "train_stalker"]
+        self.actions = ["train_probe", "build_pylon", "build_gateway", "build_assimilator","harvest_gas", "harvest_minerals", "train_zealot", "attack", "build_cyber_core", "train_stalker", "do_nothing"]
         self.pylon_coords = []
         # self.pylon_index = 0
+        self.unit_index = None
+        self.unit_index_obs = None
+        self.profiler = NULL_PROFILER
+
+    def reset(self):
+        super(ProtossAgent, self).reset()
+        self.profiler.end_game()
 
     def step(self, obs):
         super(ProtossAgent, self).step(obs)
+        with self.profiler.phase('unit_index'):
+            self.get_unit_index(obs)
 
         if obs.first():
             nexus = self.get_my_units_by_type(obs, units.Protoss.Nexus)[0]
@@ -70,43 +87,75 @@ class ProtossAgent(base_agent.BaseAgent):
 
     # -----------------UTILITY----------------
 
-    def get_my_units_by_type(self, obs, unit_type):
+    def get_unit_index(self, obs):
+        if self.unit_index_obs is not obs:
+            self.unit_index = UnitIndex(obs.observation.raw_units)
+            self.unit_index_obs = obs
+        return self.unit_index
 
-        return [unit for unit in obs.observation.raw_units if unit.unit_type == unit_type and
-                unit.alliance == features.PlayerRelative.SELF]
+    def get_my_units_by_type(self, obs, unit_type):
+        return self.get_unit_index(obs).units(features.PlayerRelative.SELF, unit_type)
 
     def get_my_completed_units_by_type(self, obs, unit_type):
-        return [unit for unit in obs.observation.raw_units
-                if unit.unit_type == unit_type and
-                unit.build_progress == 100 and
-                unit.alliance == features.PlayerRelative.SELF]
+        return self.get_unit_index(obs).units(features.PlayerRelative.SELF, unit_type, completed=True)
 
     def get_enemy_units_by_type(self, obs, unit_type):
-        return [unit for unit in obs.observation.raw_units
-                if unit.unit_type == unit_type
-                and unit.alliance == features.PlayerRelative.ENEMY]
+        return self.get_unit_index(obs).units(features.PlayerRelative.ENEMY, unit_type)
 
     def get_enemy_completed_units_by_type(self, obs, unit_type):
-        return [unit for unit in obs.observation.raw_units
-                if unit.unit_type == unit_type
-                and unit.build_progress == 100
-                and unit.alliance == features.PlayerRelative.ENEMY]
-
-    def get_distances(self, obs, units, xy):
-        units_xy = [(unit.x, unit.y) for unit in units]
-        return np.linalg.norm(np.array(units_xy) - np.array(xy), axis=1)
+        return self.get_unit_index(obs).units(features.PlayerRelative.ENEMY, unit_type, completed=True)
 
-    def select_build_worker(self, obs, x, y):
+    def get_neutral_units_by_types(self, obs, unit_types):
+        return self.get_unit_index(obs).units_of_types(features.PlayerRelative.NEUTRAL, unit_types)
 
-        probes = self.get_my_completed_units_by_type(obs, units.Protoss.Probe)
+    def get_closest(self, obs, alliance, unit_types, xy, completed=None):
+        return self.get_unit_index(obs).closest(alliance, unit_types, xy, completed)
 
-        if probes:
-            distances_to_point = self.get_distances(obs, probes, (x, y))
-            min_index = np.argmin(distances_to_point)
-            # probe = np.random.choice(probes[min_index])
-            probe = probes[min_index]
-            return probe
-        return None
+    def select_build_worker(self, obs, x, y):
+        return self.get_closest(obs, features.PlayerRelative.SELF, units.Protoss.Probe, (x, y), completed=True)
+
+    def valid_actions(self, obs):
+        '''
+        Checks the preconditions of every action in one pass over the observation. An action is valid when it
+        would issue a command instead of falling back to no_op(); the checks mirror the ones in the action methods.
+        :return: bool array over self.actions, do_nothing is always valid so at least one action is
+        '''
+        index = self.get_unit_index(obs)
+        player = obs.observation.player
+        minerals, vespene = player.minerals, player.vespene
+        free_supply = player.food_cap - player.food_used
+        SELF, NEUTRAL = features.PlayerRelative.SELF, features.PlayerRelative.NEUTRAL
+        order_length = features.FeatureUnit.order_length
+
+        # counts and columns only, building unit rows would cost more than the rest of the check
+        has_probes = index.count(SELF, units.Protoss.Probe) > 0
+        has_nexus = index.count(SELF, units.Protoss.Nexus) > 0
+        nexus_orders = index.column(SELF, units.Protoss.Nexus, order_length, completed=True)
+        has_pylon = index.count(SELF, units.Protoss.Pylon, completed=True) > 0
+        gateway_orders = index.column(SELF, units.Protoss.Gateway, order_length)
+        has_gateway = index.count(SELF, units.Protoss.Gateway, completed=True) > 0
+        has_core = index.count(SELF, units.Protoss.CyberneticsCore, completed=True) > 0
+        gas_harvesters = index.column(SELF, units.Protoss.Assimilator, features.FeatureUnit.assigned_harvesters,
+                                      completed=True)
+        gateway_free = len(gateway_orders) > 0 and gateway_orders[0] < 5
+
+        valid = {
+            'train_probe': minerals >= 50 and free_supply > 0 and len(nexus_orders) > 0 and nexus_orders[0] < 5,
+            'build_pylon': minerals >= 100 and has_probes and index.count(SELF, units.Protoss.Pylon) < 3,
+            'build_gateway': has_pylon and not has_gateway and minerals >= 150 and has_probes,
+            'build_assimilator': (minerals >= 75 and has_nexus and has_probes
+                                  and index.count(NEUTRAL, units.Neutral.VespeneGeyser) > 0),
+            'harvest_gas': has_probes and has_nexus and len(gas_harvesters) > 0 and gas_harvesters[0] < 3,
+            'harvest_minerals': (bool((index.column(SELF, units.Protoss.Probe, order_length) == 0).any())
+                                 and any(index.count(NEUTRAL, mineral) for mineral in MINERAL_FIELD_TYPES)),
+            'train_zealot': has_gateway and minerals >= 100 and free_supply > 1 and gateway_free,
+            'attack': index.count(SELF, units.Protoss.Stalker) > 0 or index.count(SELF, units.Protoss.Zealot) > 0,
+            'build_cyber_core': has_pylon and has_gateway and minerals >= 150 and has_probes,
+            'train_stalker': (has_gateway and has_core and minerals >= 125 and free_supply > 2 and vespene >= 50
+                              and gateway_free),
+            'do_nothing': True,
+        }
+        return np.array([valid[action] for action in self.actions], dtype=bool)
 
 
     # -----------------ACTIONS----------------
@@ -127,7 +176,10 @@ class ProtossAgent(base_agent.BaseAgent):
     def harvest_gas(self, obs):
 
         probes = self.get_my_units_by_type(obs, units.Protoss.Probe)
-        nexus = self.get_my_units_by_type(obs, units.Protoss.Nexus)[0]
+        nexuses = self.get_my_units_by_type(obs, units.Protoss.Nexus)
+        if not probes or not nexuses:
+            return actions.RAW_FUNCTIONS.no_op()
+        nexus = nexuses[0]
         idle_probes = [probe for probe in probes if probe.order_length == 0]
         extra_workers = (nexus.assigned_harvesters > nexus.ideal_harvesters)
         assimilators = self.get_my_completed_units_by_type(obs, units.Protoss.Assimilator)
@@ -148,14 +200,16 @@ class ProtossAgent(base_agent.BaseAgent):
 
     def build_assimilator(self, obs):
 
-        geysers = [unit for unit in obs.observation.raw_units if unit.unit_type in [units.Neutral.VespeneGeyser]]
-        nexus = self.get_my_units_by_type(obs, units.Protoss.Nexus)[0]
-        distances = self.get_distances(obs, geysers, (nexus.x, nexus.y))
-        geyser = geysers[np.argmin(distances)]
+        geysers = self.get_neutral_units_by_types(obs, [units.Neutral.VespeneGeyser])
+        nexuses = self.get_my_units_by_type(obs, units.Protoss.Nexus)
+        if not geysers or not nexuses:
+            return actions.RAW_FUNCTIONS.no_op()
+        nexus = nexuses[0]
+        geyser = self.get_closest(obs, features.PlayerRelative.NEUTRAL, units.Neutral.VespeneGeyser, (nexus.x, nexus.y))
 
         probe = self.select_build_worker(obs, geyser.x, geyser.y)
 
-        if obs.observation.player.minerals >= 75 and probe.any():
+        if obs.observation.player.minerals >= 75 and probe is not None:
             return actions.RAW_FUNCTIONS.Build_Assimilator_unit("now", probe.tag, geyser.tag)
 
         return actions.RAW_FUNCTIONS.no_op()
@@ -165,24 +219,10 @@ class ProtossAgent(base_agent.BaseAgent):
         probes = self.get_my_units_by_type(obs, units.Protoss.Probe)
         idle_probes = [probe for probe in probes if probe.order_length == 0]
         if idle_probes:
-            mineral_patches = [unit for unit in obs.observation.raw_units
-                               if unit.unit_type in [
-                                   units.Neutral.BattleStationMineralField,
-                                   units.Neutral.BattleStationMineralField750,
-                                   units.Neutral.LabMineralField,
-                                   units.Neutral.LabMineralField750,
-                                   units.Neutral.MineralField,
-                                   units.Neutral.MineralField750,
-                                   units.Neutral.PurifierMineralField,
-                                   units.Neutral.PurifierMineralField750,
-                                   units.Neutral.PurifierRichMineralField,
-                                   units.Neutral.PurifierRichMineralField750,
-                                   units.Neutral.RichMineralField,
-                                   units.Neutral.RichMineralField750
-                               ]]
             probe = random.choice(idle_probes)
-            distances = self.get_distances(obs, mineral_patches, (probe.x, probe.y))
-            patch = mineral_patches[np.argmin(distances)]
+            patch = self.get_closest(obs, features.PlayerRelative.NEUTRAL, MINERAL_FIELD_TYPES, (probe.x, probe.y))
+            if patch is None:
+                return actions.RAW_FUNCTIONS.no_op()
             return actions.RAW_FUNCTIONS.Harvest_Gather_unit("now", probe.tag, patch.tag)
         return actions.RAW_FUNCTIONS.no_op()
 
@@ -196,8 +236,7 @@ class ProtossAgent(base_agent.BaseAgent):
         if obs.observation.player.minerals >= 100 and probes and pylons_active < 3:
             pylon_xy = self.pylon_coords[pylons_active]
 
-            distances = self.get_distances(obs, probes, pylon_xy)
-            probey = probes[np.argmin(distances)]
+            probey = self.get_closest(obs, features.PlayerRelative.SELF, units.Protoss.Probe, pylon_xy)
             return actions.RAW_FUNCTIONS.Build_Pylon_pt("now", probey.tag, pylon_xy)
         return actions.RAW_FUNCTIONS.no_op()
 
@@ -209,8 +248,7 @@ class ProtossAgent(base_agent.BaseAgent):
         if (len(completed_pylons) > 0 and len(gateways) == 0 and obs.observation.player.minerals >= 150 and len(
                 probes) > 0):
             gateway_xy = (22, 21) if self.base_top_left else (35, 45)
-            distances = self.get_distances(obs, probes, gateway_xy)
-            probe = probes[np.argmin(distances)]
+            probe = self.get_closest(obs, features.PlayerRelative.SELF, units.Protoss.Probe, gateway_xy)
             return actions.RAW_FUNCTIONS.Build_Gateway_pt("now", probe.tag, gateway_xy)
         return actions.RAW_FUNCTIONS.no_op()
 
@@ -222,8 +260,7 @@ class ProtossAgent(base_agent.BaseAgent):
         if (len(completed_pylons) > 0 and len(gateways) > 0 and obs.observation.player.minerals >= 150 and len(
                 probes) > 0):
             core_xy = (26, 22) if self.base_top_left else (33, 44)
-            distances = self.get_distances(obs, probes, core_xy)
-            probe = probes[np.argmin(distances)]
+            probe = self.get_closest(obs, features.PlayerRelative.SELF, units.Protoss.Probe, core_xy)
             return actions.RAW_FUNCTIONS.Build_CyberneticsCore_pt("now", probe.tag, core_xy)
         return actions.RAW_FUNCTIONS.no_op()
 
@@ -253,8 +290,7 @@ class ProtossAgent(base_agent.BaseAgent):
         stalkers = self.get_my_units_by_type(obs, units.Protoss.Stalker)
         if len(stalkers) > 0:
             attack_xy = (38, 44) if self.base_top_left else (19, 23)
-            distances = self.get_distances(obs, stalkers, attack_xy)
-            zealot = stalkers[np.argmax(distances)]
+            zealot = self.get_unit_index(obs).farthest(features.PlayerRelative.SELF, units.Protoss.Stalker, attack_xy)
             x_offset = random.randint(-4, 4)
             y_offset = random.randint(-4, 4)
             return actions.RAW_FUNCTIONS.Attack_pt("now", zealot.tag,
@@ -263,8 +299,7 @@ class ProtossAgent(base_agent.BaseAgent):
         zealots = self.get_my_units_by_type(obs, units.Protoss.Zealot)
         if len(zealots) > 0:
             attack_xy = (38, 44) if self.base_top_left else (19, 23)
-            distances = self.get_distances(obs, zealots, attack_xy)
-            zealot = zealots[np.argmax(distances)]
+            zealot = self.get_unit_index(obs).farthest(features.PlayerRelative.SELF, units.Protoss.Zealot, attack_xy)
             x_offset = random.randint(-4, 4)
             y_offset = random.randint(-4, 4)
             return actions.RAW_FUNCTIONS.Attack_pt("now", zealot.tag,
@@ -274,22 +309,94 @@ class ProtossAgent(base_agent.BaseAgent):
 
 class rlAgent(ProtossAgent):
 
-    def __init__(self):
+    def __init__(self, checkpoint_path=None, checkpoint_every=50, replay_capacity=0, replay_batch_size=32,
+                 replay_updates=4, mask_actions=True, learner='table', max_states=0, q_dtype='float64',
+                 spill_path=None, pipeline=False, replay_seed=None):
+        '''
+        :param learner: 'table' for a QLearningTable, 'linear' for a LinearQLearner. Either is kept in q_table.
+        :param max_states: state budget of the table, a BoundedQLearningTable is used when set
+        :param spill_path: SQLite file a bounded table spills evicted rows to
+        :param pipeline: learn on a LearnPipeline worker thread, step() returns as soon as the action is chosen
+        :param replay_seed: seed of the replay buffer's minibatch sampling
+        '''
         super(rlAgent, self).__init__()
-        self.q_table = QLearningTable(self.actions)
+        self.mask_actions = mask_actions
+        if learner == 'linear':
+            self.state_encoder = PROTOSS_LINEAR_STATE_ENCODER
+            self.state_features = PROTOSS_LINEAR_STATE_FEATURES
+            self.q_table = LinearQLearner(self.actions, self.state_encoder)
+        else:
+            self.state_encoder = PROTOSS_STATE_ENCODER
+            self.state_features = PROTOSS_STATE_FEATURES
+            self.q_table = make_q_table(self.actions, max_states, q_dtype, spill_path)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        if checkpoint_path and os.path.exists(self.q_table.checkpoint_files(checkpoint_path)[-1]):
+            self.q_table.load(checkpoint_path)
+            print("Resumed %s from %s" % (type(self.q_table).__name__, checkpoint_path))
+        self.replay = ReplayBuffer(replay_capacity, replay_seed) if replay_capacity else None
+        if self.replay is not None and isinstance(self.q_table, BoundedQLearningTable):
+            self.q_table.add_listener(self.on_rows_replaced)
+        self.replay_batch_size = replay_batch_size
+        self.replay_updates = replay_updates
+        self.pipeline = LearnPipeline() if pipeline else None
+        self.table_lock = self.pipeline.lock if pipeline else nullcontext()
         self.new_game()
 
     def step(self,obs):
-        super(rlAgent, self).step(obs)
-        state = str(self.get_state(obs))
-        action = self.q_table.choose_action(state)
-        if self.previous_action is not None:
-            self.q_table.learn(self.previous_state, self.previous_action,
-                               obs.reward, 'terminal' if obs.last() else state)
-
-        self.previous_state = state
-        self.previous_action = action
-        return getattr(self,action)(obs)
+        profiler = self.profiler
+        with profiler.phase('step'):
+            super(rlAgent, self).step(obs)
+            with profiler.phase('get_state'):
+                state = self.state_encoder.encode(self.get_state(obs))
+            with profiler.phase('valid_actions'):
+                mask = self.valid_actions(obs) if self.mask_actions else None
+            with profiler.phase('choose_action'), self.table_lock:
+                action = self.q_table.choose_action(state, mask=mask)
+            transition = None
+            if self.previous_action is not None:
+                transition = (self.previous_state, self.previous_action, obs.reward, state, obs.last(), mask)
+
+            self.previous_state = state
+            self.previous_action = action
+            with profiler.phase(action):
+                function_call = getattr(self,action)(obs)
+            # learning comes after the action is built, pipelined it then runs while the environment steps
+            # instead of competing with the action method for the GIL
+            if transition is not None:
+                if self.pipeline is not None:
+                    with profiler.phase('submit'):
+                        self.pipeline.submit(self.learn_step, *transition)
+                else:
+                    self.learn_step(*transition)
+            return function_call
+
+    def learn_step(self, previous_state, previous_action, reward, state, last, mask=None):
+        '''
+        TD update of the previous step's action, then replay. On the pipeline's worker thread the table lock is
+        taken per update, so choose_action never waits for a whole replay round.
+        '''
+        profiler = self.profiler
+        with profiler.phase('learn'), self.table_lock:
+            self.q_table.learn(previous_state, previous_action, reward, 'terminal' if last else state, mask=mask)
+        if self.replay is not None:
+            with profiler.phase('replay'):
+                self.replay_step(previous_state, previous_action, reward, state, last, mask)
+
+    def replay_step(self, previous_state, previous_action, reward, state, last, mask=None):
+        table = self.q_table
+        with self.table_lock:
+            # a terminal transition's next state is never bootstrapped from, looking it up would only add a row
+            self.replay.add(table.state_id(previous_state), table.action_ids[previous_action],
+                            reward, 0 if last else table.state_id(state), last, mask_bits(mask))
+        if len(self.replay) >= self.replay_batch_size:
+            for _ in range(self.replay_updates):
+                with self.table_lock:
+                    table.learn_batch(*self.replay.sample(self.replay_batch_size))
+
+    def on_rows_replaced(self, event, rows, values):
+        if event == 'evict':
+            self.replay.drop_states(rows)
 
     def new_game(self):
         self.base_top_left = None
@@ -299,105 +406,98 @@ class rlAgent(ProtossAgent):
     def reset(self):
         super(rlAgent, self).reset()
         self.new_game()
+        if self.checkpoint_path and self.episodes > 1 and (self.episodes - 1) % self.checkpoint_every == 0:
+            self.save_checkpoint()
 
+    def save_checkpoint(self):
+        if self.pipeline is not None:
+            self.pipeline.drain()
+        if self.checkpoint_path:
+            self.q_table.save(self.checkpoint_path)
+        if isinstance(self.q_table, BoundedQLearningTable):
+            print("Q-table: %(states)d/%(max_states)d states, hit rate %(hit_rate).3f, "
+                  "eviction rate %(eviction_rate).4f, %(restored)d restored" % self.q_table.stats())
 
-    def get_state(self, obs):
-
-        probes = self.get_my_units_by_type(obs, units.Protoss.Probe)
-        idle_probes = [probe for probe in probes if probe.order_length == 0]
-        nexuses = self.get_my_units_by_type(obs, units.Protoss.Nexus)
-
-        pylons = self.get_my_units_by_type(obs, units.Protoss.Pylon)
-        completed_pylons = self.get_my_completed_units_by_type(obs, units.Protoss.Pylon)
-
-        gateways = self.get_my_units_by_type(obs, units.Protoss.Gateway)
-        completed_gateways = self.get_my_completed_units_by_type(obs, units.Protoss.Gateway)
-
-        zealots = self.get_my_units_by_type(obs, units.Protoss.Zealot)
-        queued_zealots = (completed_gateways[0].order_length if len(completed_gateways) > 0 else 0)
-        free_supply = (obs.observation.player.food_cap - obs.observation.player.food_used)
-
-        can_afford_pylon_or_zealot = obs.observation.player.minerals >= 100
-        can_afford_gateway = obs.observation.player.minerals >= 150
 
-        enemy_probes = self.get_enemy_units_by_type(obs, units.Protoss.Probe)
-        enemy_nexuses = self.get_enemy_units_by_type(obs, units.Protoss.Nexus)
+    def get_state(self, obs):
+        return self.state_features.extract(obs)
 
-        enemy_pylons = self.get_enemy_units_by_type(obs, units.Protoss.Pylon)
-        enemy_completed_pylons = self.get_enemy_completed_units_by_type(obs, units.Protoss.Pylon)
 
-        enemy_gateways = self.get_enemy_units_by_type(obs, units.Protoss.Gateway)
-        enemy_completed_gateways = self.get_enemy_completed_units_by_type(obs, units.Protoss.Gateway)
 
-        enemy_zealots = self.get_enemy_units_by_type(obs, units.Protoss.Zealot)
 
-        return (len(nexuses),
-                len(probes),
-                len(idle_probes),
-                len(pylons),
-                len(completed_pylons),
-                len(gateways),
-                len(completed_gateways),
-                len(zealots),
-                queued_zealots,
-                free_supply,
-                can_afford_pylon_or_zealot,
-                can_afford_gateway,
-                len(enemy_nexuses),
-                len(enemy_probes),
-                len(enemy_pylons),
-                len(enemy_completed_pylons),
-                len(enemy_gateways),
-                len(enemy_completed_gateways),
-                len(enemy_zealots))
 
 
 
+class RandomAgent(ProtossAgent):
 
+    def step(self, obs):
+        with self.profiler.phase('step'):
+            super(RandomAgent, self).step(obs)
+            action = random.choice(self.actions)
+            with self.profiler.phase(action):
+                return getattr(self, action)(obs)
 
 
 
-class RandomAgent(ProtossAgent):
 
-    def step(self, obs):
-        super(RandomAgent, self).step(obs)
-        action = random.choice(self.actions)
-        return getattr(self, action)(obs)
 
 
 
 
 
+def make_q_table(actions, max_states=0, q_dtype='float64', spill_path=None):
+    '''
+    :param max_states: state budget, a BoundedQLearningTable when set and an unbounded QLearningTable when 0
+    :param spill_path: SQLite file a bounded table spills evicted rows to
+    '''
+    if max_states:
+        return BoundedQLearningTable(actions, max_states, dtype=q_dtype, spill_path=spill_path)
+    return QLearningTable(actions, dtype=q_dtype)
 
 
+def make_env(map_name="Simple64", race=sc2_env.Race.protoss, difficulty=sc2_env.Difficulty.very_easy, seed=None):
+    return sc2_env.SC2Env(
+        map_name=map_name,
+        players=[sc2_env.Agent(sc2_env.Race.protoss),
+                 sc2_env.Bot(race,
+                             difficulty)],
+        # players=[sc2_env.Agent(sc2_env.Race.protoss),
+        #          sc2_env.Agent(sc2_env.Race.protoss)],
+        agent_interface_format=features.AgentInterfaceFormat(
+            action_space=actions.ActionSpace.RAW,
+            use_raw_units=True,
+            raw_resolution=64,
+            # feature_dimensions=features.Dimensions(screen=84, minimap=64)
+        ),
+        step_mul= 48,
+        disable_fog=True,
+        random_seed=seed
+    )
 
 
 def main(unused_argv):
-    # agent = rlAgent()
     # agent1 = rlAgent()
-    agent2 = RandomAgent()
+    if FLAGS.agent == "rl":
+        agent2 = rlAgent(FLAGS.checkpoint, FLAGS.checkpoint_every, FLAGS.replay_capacity,
+                         FLAGS.replay_batch_size, FLAGS.replay_updates, FLAGS.mask_actions, FLAGS.learner,
+                         FLAGS.q_max_states, FLAGS.q_dtype, FLAGS.q_spill, FLAGS.pipeline)
+    else:
+        agent2 = RandomAgent()
+    if FLAGS.profile_dir:
+        agent2.profiler = StepProfiler(type(agent2).__name__, FLAGS.profile_dir, FLAGS.profile_trace)
     try:
         while True:
-            with sc2_env.SC2Env(
-                    map_name="Simple64",
-                    players=[sc2_env.Agent(sc2_env.Race.protoss),
-                             sc2_env.Bot(sc2_env.Race.protoss,
-                                         sc2_env.Difficulty.very_easy)],
-                    # players=[sc2_env.Agent(sc2_env.Race.protoss),
-                    #          sc2_env.Agent(sc2_env.Race.protoss)],
-                    agent_interface_format=features.AgentInterfaceFormat(
-                        action_space=actions.ActionSpace.RAW,
-                        use_raw_units=True,
-                        raw_resolution=64,
-                        # feature_dimensions=features.Dimensions(screen=84, minimap=64)
-                    ),
-            step_mul= 48,
-            disable_fog=True
-            ) as env:
+            with make_env() as env:
                 run_loop.run_loop([agent2], env, max_episodes=1000)
+                if isinstance(agent2, rlAgent):
+                    agent2.save_checkpoint()
     except KeyboardInterrupt:
         pass
+    finally:
+        agent2.profiler.end_game()
+        if isinstance(agent2, rlAgent):
+            agent2.save_checkpoint()
 
 
 if __name__ == "__main__":
-    app.run(main)
\ No newline at end of file
+    app.run(main)
\ No newline at end of file
@@ -0,0 +1,434 @@
+import json
+import os
+import sqlite3
+import numpy as np
+
+TERMINAL_STATE = 'terminal'
+KEY_DTYPE = np.int64
+# action masks are stored as bitmasks, bit i set when action i is valid
+MASK_DTYPE = np.uint64
+ALL_ACTIONS = np.iinfo(MASK_DTYPE).max
+# state key of a row freed by eviction, in memory and in checkpoints
+FREE_KEY = -1
+# rows looked up this recently are never evicted, so row indexes held during a learn() or a replay add stay valid
+PROTECTED_LOOKUPS = 64
+
+
+def mask_bits(mask):
+    '''
+    :param mask: bool array over the actions (at most 64), or None for all actions
+    :return: the mask as an integer bitmask
+    '''
+    if mask is None:
+        return ALL_ACTIONS
+    bits = 0
+    for action_id in np.flatnonzero(mask).tolist():
+        bits |= 1 << action_id
+    return bits
+
+
+def bits_mask(bits, actions):
+    '''
+    :param bits: array of bitmasks from mask_bits()
+    :return: bool array of shape bits.shape + (actions,)
+    '''
+    bits = np.asarray(bits, dtype=MASK_DTYPE)
+    return ((bits[..., None] >> np.arange(actions, dtype=MASK_DTYPE)) & MASK_DTYPE(1)).astype(bool)
+
+
+class QLearningTable:
+    '''
+    Tabular Q-learner backed by a dict from state key to row index and a preallocated NumPy matrix of action
+    values. The matrix grows geometrically, so inserting a new state is amortized O(1) instead of copying the whole
+    table like DataFrame.append did.
+    '''
+
+    def __init__(self, actions, learning_rate=0.01, discount_factor=0.9, initial_capacity=1024, growth_factor=2,
+                 dtype=np.float64):
+        '''
+        :param dtype: value storage, float32 or float16 halve or quarter the memory of float64
+        '''
+        self.actions = list(actions)
+        self.learning_rate = learning_rate
+        self.discount_factor = discount_factor
+        self.growth_factor = growth_factor
+        self.action_ids = {action: i for i, action in enumerate(self.actions)}
+
+        self.state_rows = {}
+        self.state_keys = []
+        self.q_values = np.zeros((max(int(initial_capacity), 1), len(self.actions)), dtype=dtype)
+        # rows changed since the last checkpoint, rows whose state changed since, and how many rows the checkpoint
+        # already holds
+        self.dirty_rows = set()
+        self.rekeyed_rows = set()
+        self.saved_rows = 0
+        self.checkpoint_path = None
+        self.checkpoint_slot = 0
+
+    def __len__(self):
+        return len(self.state_keys)
+
+    def __contains__(self, state):
+        return state in self.state_rows
+
+    @property
+    def capacity(self):
+        return self.q_values.shape[0]
+
+    @property
+    def values(self):
+        '''
+        :return: a view of the value rows of every known state, indexed by state id
+        '''
+        return self.q_values[:len(self.state_keys)]
+
+    def _grow(self, min_capacity):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity = int(capacity * self.growth_factor) + 1
+        grown = np.zeros((capacity, len(self.actions)), dtype=self.q_values.dtype)
+        grown[:len(self.state_keys)] = self.values
+        self.q_values = grown
+
+    def check_if_state_exists(self, state):
+        '''
+        Adds a zero-initialized row for unseen states.
+        :param state: any hashable state key
+        :return: the row index (state id) of the state
+        '''
+        row = self.state_rows.get(state)
+        if row is None:
+            row = len(self.state_keys)
+            if row >= self.capacity:
+                self._grow(row + 1)
+            self.state_rows[state] = row
+            self.state_keys.append(state)
+        return row
+
+    def state_id(self, state):
+        return self.check_if_state_exists(state)
+
+    def choose_action(self, obs, epsilon=0.9, mask=None):
+        '''
+        Epsilon-greedy choice, both the greedy and the random pick only among the actions valid in mask.
+        :param mask: bool array over the actions, None when every action is valid
+        '''
+        row = self.check_if_state_exists(obs)
+        valid = np.arange(len(self.actions)) if mask is None else np.flatnonzero(mask)
+        if np.random.uniform() < epsilon:
+            state_action = self.q_values[row, valid]
+            best = valid[state_action == state_action.max()]
+            return self.actions[best[np.random.randint(len(best))]]
+        return self.actions[valid[np.random.randint(len(valid))]]
+
+    def learn(self, prev_state, action, reward, state, mask=None):
+        '''
+        :param mask: actions valid in state, the target bootstraps from the best of those only
+        '''
+        prev_row = self.check_if_state_exists(prev_state)
+        action_id = self.action_ids[action]
+        if state != TERMINAL_STATE:
+            row = self.check_if_state_exists(state)
+            q_next = self.q_values[row] if mask is None else self.q_values[row, mask]
+            q_estimate = reward + self.discount_factor * q_next.max()
+        else:
+            q_estimate = reward
+
+        q_predict = self.q_values[prev_row, action_id]
+        self.q_values[prev_row, action_id] += self.learning_rate * (q_estimate - q_predict)
+        self.dirty_rows.add(prev_row)
+
+    def learn_batch(self, state_ids, action_ids, rewards, next_state_ids, terminals, next_masks=None):
+        '''
+        One TD update per transition of a minibatch, using row indexes from state_id(). Targets are computed from
+        the values before the batch; repeated (state, action) pairs accumulate their updates.
+        :param next_masks: mask_bits() of the actions valid in each next state, None when all are
+        '''
+        q_next = self.q_values[next_state_ids]
+        if next_masks is not None:
+            q_next = np.where(bits_mask(next_masks, len(self.actions)), q_next, -np.inf)
+        q_next = q_next.max(axis=1)
+        q_estimate = rewards + self.discount_factor * np.where(terminals, 0.0, q_next)
+        q_predict = self.q_values[state_ids, action_ids]
+        np.add.at(self.q_values, (state_ids, action_ids), self.learning_rate * (q_estimate - q_predict))
+        self.dirty_rows.update(state_ids.tolist())
+
+    # -----------------CHECKPOINTS----------------
+
+    @staticmethod
+    def checkpoint_files(path, slot=0):
+        '''
+        A checkpoint is three files: raw value rows, raw int64 state keys (row i of one is key i of the other) and a
+        small JSON header, path.qtable.json. Values and keys live in one of two slots, path.values / path.keys or
+        path.1.values / path.1.keys, and the header names the current one.
+        '''
+        prefix = path if not slot else '%s.%d' % (path, slot)
+        return prefix + '.values', prefix + '.keys', path + '.qtable.json'
+
+    def save(self, path):
+        '''
+        Writes the rows changed since the last save in place and appends the rows of new states. A save to a new
+        path is a full rewrite into the slot the header on disk doesn't name, through temporary files, and the header
+        is switched to it last: an interrupted full rewrite still loads the previous checkpoint. An interrupted
+        incremental save still loads too, with some of the changed rows at their new values. Rows that changed
+        state are marked free on disk before their values are written and get their new key last, so a row is
+        never loaded with another state's values.
+        :param path: checkpoint path prefix
+        :return: the number of rows written
+        '''
+        rows = len(self.state_keys)
+        saved = self.saved_rows if path == self.checkpoint_path else 0
+        if saved:
+            slot = self.checkpoint_slot
+        else:
+            header_file = self.checkpoint_files(path)[2]
+            slot = 1 - self.read_header(path).get('slot', 0) if os.path.exists(header_file) else 0
+        values_file, keys_file, header_file = self.checkpoint_files(path, slot)
+
+        new_keys = self.state_keys[saved:]
+        if new_keys and not all(isinstance(key, (int, np.integer)) for key in new_keys):
+            raise TypeError("Q-table checkpoints need integer state keys, encode states before saving")
+
+        changed = np.array(sorted(row for row in self.dirty_rows if row < saved), dtype=np.int64)
+        rekeyed = np.array(sorted(row for row in self.rekeyed_rows if row < saved), dtype=np.int64)
+        if len(rekeyed):
+            self._patch(keys_file, KEY_DTYPE, (saved,), rekeyed, FREE_KEY)
+        if len(changed):
+            self._patch(values_file, self.q_values.dtype, (saved, len(self.actions)), changed,
+                        self.q_values[changed])
+        if len(rekeyed):
+            self._patch(keys_file, KEY_DTYPE, (saved,), rekeyed,
+                        np.array([self.state_keys[row] for row in rekeyed.tolist()], dtype=KEY_DTYPE))
+
+        row_bytes = len(self.actions) * self.q_values.dtype.itemsize
+        key_bytes = np.dtype(KEY_DTYPE).itemsize
+        for file_name, offset, data in ((values_file, saved * row_bytes, self.q_values[saved:rows]),
+                                        (keys_file, saved * key_bytes, np.array(new_keys, dtype=KEY_DTYPE))):
+            if saved:
+                with open(file_name, 'r+b') as f:
+                    f.seek(offset)
+                    f.write(np.ascontiguousarray(data).tobytes())
+                    f.truncate()
+            else:
+                # a new file, never the one a loaded table has memory-mapped
+                with open(file_name + '.tmp', 'wb') as f:
+                    f.write(np.ascontiguousarray(data).tobytes())
+                os.replace(file_name + '.tmp', file_name)
+
+        header = {'actions': self.actions, 'dtype': self.q_values.dtype.str, 'rows': rows, 'slot': slot}
+        with open(header_file + '.tmp', 'w') as f:
+            json.dump(header, f)
+        os.replace(header_file + '.tmp', header_file)
+
+        self.saved_rows = rows
+        self.checkpoint_path = path
+        self.checkpoint_slot = slot
+        self.dirty_rows.clear()
+        self.rekeyed_rows.clear()
+        return len(changed) + rows - saved
+
+    @staticmethod
+    def _patch(file_name, dtype, shape, rows, data):
+        on_disk = np.memmap(file_name, dtype=dtype, mode='r+', shape=shape)
+        on_disk[rows] = data
+        on_disk.flush()
+        del on_disk
+
+    @classmethod
+    def read_header(cls, path):
+        with open(cls.checkpoint_files(path)[2]) as f:
+            return json.load(f)
+
+    def load(self, path):
+        '''
+        Replaces the table with a checkpoint. Values are memory-mapped copy-on-write, so nothing is read up front
+        and the file is never modified by learning; the matrix is only copied into memory when the table grows.
+        '''
+        header = self.read_header(path)
+        values_file, keys_file, _ = self.checkpoint_files(path, header.get('slot', 0))
+        if header['actions'] != self.actions:
+            raise ValueError("Checkpoint actions %s don't match table actions %s" % (header['actions'], self.actions))
+
+        rows = header['rows']
+        keys = np.fromfile(keys_file, dtype=KEY_DTYPE, count=rows).tolist()
+        if rows:
+            self.q_values = np.memmap(values_file, dtype=np.dtype(header['dtype']), mode='c',
+                                      shape=(rows, len(self.actions)))
+        else:
+            self.q_values = np.zeros((1, len(self.actions)), dtype=np.dtype(header['dtype']))
+        self.state_keys = keys
+        self.state_rows = dict(zip(keys, range(rows)))
+        self.saved_rows = rows
+        self.checkpoint_path = path
+        self.checkpoint_slot = header.get('slot', 0)
+        self.dirty_rows.clear()
+        self.rekeyed_rows.clear()
+        return self
+
+
+class BoundedQLearningTable(QLearningTable):
+    '''
+    QLearningTable holding at most max_states states. Every lookup counts a visit; when a new state needs a row and
+    the budget is used up, the evict_batch rows with the lowest visit count, halved for every half_life lookups
+    since the row was last used, are evicted, so states seen often and states seen lately both stay. Rows keep their
+    index for as long as their state stays, freed rows are reused by new states.
+    With a spill_path, evicted rows are written to an SQLite file and restored when their state comes back, so
+    memory stays bounded without forgetting what was learned. SQLite keeps its index on disk, so the spill
+    doesn't grow memory either.
+    Code holding row indexes (replay buffers, sync bases) registers a listener, called as
+    listener(event, rows, values) when rows get values that weren't learned: 'evict' with zeros for rows that were
+    freed, 'restore' with the spilled values of rows that were read back.
+    '''
+
+    def __init__(self, actions, max_states, learning_rate=0.01, discount_factor=0.9, dtype=np.float32,
+                 half_life=None, evict_batch=None, spill_path=None):
+        if max_states <= 2 * PROTECTED_LOOKUPS:
+            raise ValueError("max_states must be more than %d" % (2 * PROTECTED_LOOKUPS))
+        super(BoundedQLearningTable, self).__init__(actions, learning_rate, discount_factor,
+                                                    initial_capacity=min(1024, max_states), dtype=dtype)
+        self.max_states = int(max_states)
+        self.dtype = np.dtype(dtype)
+        self.half_life = float(half_life or max_states)
+        self.evict_batch = int(evict_batch or max(self.max_states // 64, 1))
+        self.listeners = []
+        self.free_rows = []
+        self.tick = 0
+        self.visits = np.zeros(self.capacity, dtype=np.int64)
+        self.last_used = np.zeros(self.capacity, dtype=np.int64)
+        self.hits = self.misses = self.evictions = self.restored = 0
+
+        self.spill = None
+        if spill_path:
+            self.spill = sqlite3.connect(spill_path)
+            # the spill is a cache of evicted rows, it doesn't need to survive a power cut
+            self.spill.execute('PRAGMA synchronous = OFF')
+            self.spill.execute('CREATE TABLE IF NOT EXISTS spill (key INTEGER PRIMARY KEY, value BLOB)')
+
+    def __len__(self):
+        return len(self.state_rows)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, event, rows, values):
+        for listener in self.listeners:
+            listener(event, rows, values)
+
+    def _grow(self, min_capacity):
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity = int(capacity * self.growth_factor) + 1
+        capacity = max(min(capacity, self.max_states), min_capacity)
+        grown = np.zeros((capacity, len(self.actions)), dtype=self.q_values.dtype)
+        grown[:len(self.state_keys)] = self.values
+        self.q_values = grown
+        for name in ('visits', 'last_used'):
+            counters = np.zeros(capacity, dtype=np.int64)
+            counters[:len(self.state_keys)] = getattr(self, name)[:len(self.state_keys)]
+            setattr(self, name, counters)
+
+    def check_if_state_exists(self, state):
+        self.tick += 1
+        row = self.state_rows.get(state)
+        if row is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if len(self.state_rows) >= self.max_states:
+                self.evict(self.evict_batch)
+            if self.free_rows:
+                row = self.free_rows.pop()
+                self.state_keys[row] = state
+                self.rekeyed_rows.add(row)
+                self.dirty_rows.add(row)
+            else:
+                row = len(self.state_keys)
+                if row >= self.capacity:
+                    self._grow(row + 1)
+                self.state_keys.append(state)
+            self.state_rows[state] = row
+            self.visits[row] = 0
+            if self.spill is not None:
+                self._restore(state, row)
+        self.visits[row] += 1
+        self.last_used[row] = self.tick
+        return row
+
+    def scores(self, rows):
+        '''
+        :return: the eviction score of rows, the lowest go first
+        '''
+        return self.visits[rows] * 0.5 ** ((self.tick - self.last_used[rows]) / self.half_life)
+
+    def evict(self, count):
+        '''
+        Frees the count lowest scoring rows not looked up in the last PROTECTED_LOOKUPS lookups.
+        '''
+        used = len(self.state_keys)
+        candidates = np.flatnonzero(self.last_used[:used] <= self.tick - PROTECTED_LOOKUPS)
+        keys = np.array(self.state_keys, dtype=KEY_DTYPE)
+        candidates = candidates[keys[candidates] != FREE_KEY]
+        count = min(count, len(candidates))
+        if not count:
+            return
+        rows = np.sort(candidates[np.argpartition(self.scores(candidates), count - 1)[:count]])
+        if self.spill is not None:
+            with self.spill:
+                self.spill.executemany('INSERT OR REPLACE INTO spill VALUES (?, ?)',
+                                       zip(keys[rows].tolist(), (self.q_values[row].tobytes() for row in rows)))
+        for row, key in zip(rows.tolist(), keys[rows].tolist()):
+            del self.state_rows[key]
+            self.state_keys[row] = FREE_KEY
+        self.q_values[rows] = 0
+        self.visits[rows] = 0
+        # the next save patches the freed rows like any changed row
+        self.dirty_rows.update(rows.tolist())
+        self.rekeyed_rows.update(rows.tolist())
+        self.free_rows.extend(rows[::-1].tolist())
+        self.evictions += count
+        self._notify('evict', rows, self.q_values[rows])
+
+    def _restore(self, state, row):
+        found = self.spill.execute('SELECT value FROM spill WHERE key = ?', (state,)).fetchone()
+        # a spill written with another value dtype can't be read back
+        if found is not None and len(found[0]) == self.q_values[row].nbytes:
+            self.q_values[row] = np.frombuffer(found[0], dtype=self.q_values.dtype)
+            self.restored += 1
+            self._notify('restore', np.array([row]), self.q_values[[row]])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'states': len(self), 'max_states': self.max_states, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'evictions': self.evictions,
+                'eviction_rate': self.evictions / lookups if lookups else 0.0, 'restored': self.restored,
+                'table_bytes': int(self.q_values.nbytes)}
+
+    def load(self, path):
+        '''
+        Replaces the table with a checkpoint. A checkpoint with more than max_states rows is cut down to max_states
+        states (evicted ones are spilled) and compacted, otherwise rows freed when it was saved are reused.
+        The values are read into memory instead of staying memory-mapped, the table is at most max_states rows and
+        eviction writes to rows the checkpoint holds.
+        '''
+        super(BoundedQLearningTable, self).load(path)
+        rows = len(self.state_keys)
+        self.q_values = np.array(self.q_values, dtype=self.dtype)
+        self.visits = np.zeros(max(rows, 1), dtype=np.int64)
+        self.last_used = np.zeros(max(rows, 1), dtype=np.int64)
+        self.state_rows.pop(FREE_KEY, None)
+        self.free_rows = [row for row in range(rows - 1, -1, -1) if self.state_keys[row] == FREE_KEY]
+        self.tick = PROTECTED_LOOKUPS
+        if rows > self.max_states:
+            if len(self) > self.max_states:
+                self.evict(len(self) - self.max_states)
+            kept = np.array(sorted(self.state_rows.values()), dtype=np.int64)
+            q_values = np.zeros((self.max_states, len(self.actions)), dtype=self.dtype)
+            q_values[:len(kept)] = self.q_values[kept]
+            self.q_values = q_values
+            self.state_keys = [self.state_keys[row] for row in kept.tolist()]
+            self.state_rows = {key: row for row, key in enumerate(self.state_keys)}
+            self.free_rows = []
+            self.visits = np.zeros(self.max_states, dtype=np.int64)
+            self.last_used = np.zeros(self.max_states, dtype=np.int64)
+            self.saved_rows = 0
+        return self
@@ -0,0 +1,72 @@
+import numpy as np
+from q_table import MASK_DTYPE, ALL_ACTIONS
+
+
+class ReplayBuffer:
+    '''
+    Fixed-size ring buffer of (state_id, action_id, reward, next_state_id, terminal, next_mask) transitions held in
+    NumPy arrays. State ids are Q-table row indexes, so a sampled minibatch can be applied with fancy indexing;
+    next_mask is the bitmask of the actions valid in the next state (see q_table.mask_bits).
+    Minibatches are drawn with the buffer's own seeded Generator, not the global np.random state, so sampling on a
+    learning worker thread neither races the agent's thread nor depends on how the two interleave.
+    '''
+
+    def __init__(self, capacity, seed=None):
+        '''
+        :param seed: seed of the Generator used by sample(), None draws fresh entropy
+        '''
+        self.capacity = int(capacity)
+        self.rng = np.random.default_rng(seed)
+        self.state_ids = np.zeros(self.capacity, dtype=np.int64)
+        self.action_ids = np.zeros(self.capacity, dtype=np.int64)
+        self.rewards = np.zeros(self.capacity, dtype=np.float64)
+        self.next_state_ids = np.zeros(self.capacity, dtype=np.int64)
+        self.terminals = np.zeros(self.capacity, dtype=bool)
+        self.next_masks = np.zeros(self.capacity, dtype=MASK_DTYPE)
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state_id, action_id, reward, next_state_id, terminal, next_mask=ALL_ACTIONS):
+        '''
+        :param next_state_id: ignored when terminal is True
+        '''
+        i = self.position
+        self.state_ids[i] = state_id
+        self.action_ids[i] = action_id
+        self.rewards[i] = reward
+        self.next_state_ids[i] = 0 if terminal else next_state_id
+        self.terminals[i] = terminal
+        self.next_masks[i] = next_mask
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        '''
+        :return: state_ids, action_ids, rewards, next_state_ids, terminals, next_masks of batch_size transitions
+            drawn uniformly
+        '''
+        i = self.rng.integers(self.size, size=batch_size)
+        return (self.state_ids[i], self.action_ids[i], self.rewards[i], self.next_state_ids[i], self.terminals[i],
+                self.next_masks[i])
+
+    def drop_states(self, state_ids):
+        '''
+        Removes the transitions from or to any of state_ids, e.g. Q-table rows that were evicted and will be reused
+        by other states. The remaining transitions keep their order, oldest first.
+        '''
+        order = np.arange(self.size)
+        if self.size == self.capacity:
+            order = (order + self.position) % self.capacity
+        dropped = (np.isin(self.state_ids[order], state_ids)
+                   | (np.isin(self.next_state_ids[order], state_ids) & ~self.terminals[order]))
+        if not dropped.any():
+            return
+        kept = order[~dropped]
+        for name in ('state_ids', 'action_ids', 'rewards', 'next_state_ids', 'terminals', 'next_masks'):
+            column = getattr(self, name)
+            column[:len(kept)] = column[kept]
+        self.size = len(kept)
+        self.position = self.size % self.capacity
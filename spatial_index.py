@@ -0,0 +1,123 @@
+from itertools import islice
+import heapq
+import math
+import numpy as np
+
+# side of a grid cell in map cells, about the range most proximity queries ask for
+CELL_SIZE = 8.0
+# up to this many positions a query just measures all of them, cheaper than building the grid
+BRUTE_FORCE_SIZE = 32
+
+
+class SpatialGrid:
+    '''
+    Uniform grid over a fixed set of 2D positions, built once in O(n) and queried by radius, k nearest or closest.
+    Queries only visit the cells around the query point, so they stay cheap as the number of positions grows.
+    Results are indices into positions. Points at the same distance come out in index order, like np.argmin.
+    Small sets (BRUTE_FORCE_SIZE positions or fewer) skip the grid and are measured in one vectorized pass.
+    '''
+
+    def __init__(self, positions, cell_size=CELL_SIZE):
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.cell_size = cell_size
+        self.cells = {}
+        self.brute_force = len(self.positions) <= BRUTE_FORCE_SIZE
+        if self.brute_force:
+            self.low = self.high = None
+            return
+        cells = np.floor(self.positions / cell_size).astype(np.int64)
+        self.low = cells.min(axis=0).tolist()
+        self.high = cells.max(axis=0).tolist()
+        keys = (cells[:, 0] - self.low[0]) * (self.high[1] - self.low[1] + 1) + cells[:, 1] - self.low[1]
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(sorted_keys)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            cx, cy = cells[order[start]].tolist()
+            self.cells[(cx, cy)] = order[start:end]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _cell(self, point):
+        return int(math.floor(point[0] / self.cell_size)), int(math.floor(point[1] / self.cell_size))
+
+    def _ring(self, cx, cy, r):
+        '''
+        :return: the index arrays of the non-empty cells at Chebyshev distance r from cell (cx, cy)
+        '''
+        if r == 0:
+            found = self.cells.get((cx, cy))
+            return [] if found is None else [found]
+        found = []
+        x0, x1 = max(cx - r, self.low[0]), min(cx + r, self.high[0])
+        for y in (cy - r, cy + r):
+            if self.low[1] <= y <= self.high[1]:
+                found.extend(self.cells[(x, y)] for x in range(x0, x1 + 1) if (x, y) in self.cells)
+        y0, y1 = max(cy - r + 1, self.low[1]), min(cy + r - 1, self.high[1])
+        for x in (cx - r, cx + r):
+            if self.low[0] <= x <= self.high[0]:
+                found.extend(self.cells[(x, y)] for y in range(y0, y1 + 1) if (x, y) in self.cells)
+        return found
+
+    def radius(self, point, distance):
+        '''
+        :return: indices of the positions within distance of point, in index order
+        '''
+        if self.brute_force:
+            offsets = self.positions - point
+            return np.flatnonzero(np.einsum('ij,ij->i', offsets, offsets) <= distance * distance)
+        x0, y0 = self._cell((point[0] - distance, point[1] - distance))
+        x1, y1 = self._cell((point[0] + distance, point[1] + distance))
+        found = [self.cells[(x, y)]
+                 for x in range(max(x0, self.low[0]), min(x1, self.high[0]) + 1)
+                 for y in range(max(y0, self.low[1]), min(y1, self.high[1]) + 1) if (x, y) in self.cells]
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.sort(np.concatenate(found))
+        offsets = self.positions[candidates] - point
+        return candidates[np.einsum('ij,ij->i', offsets, offsets) <= distance * distance]
+
+    def ordered(self, point):
+        '''
+        Yields (distance, index) of every position, closest first, visiting rings of cells only as far as needed.
+        '''
+        if self.brute_force:
+            offsets = self.positions - point
+            distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+            for index in np.argsort(distances, kind='stable').tolist():
+                yield distances[index], index
+            return
+        cx, cy = self._cell(point)
+        # rings closer than the grid's bounding box are empty, rings past its far corner have nothing left
+        first = max(self.low[0] - cx, cx - self.high[0], self.low[1] - cy, cy - self.high[1], 0)
+        last = max(abs(cx - self.low[0]), abs(cx - self.high[0]), abs(cy - self.low[1]), abs(cy - self.high[1]))
+        heap = []
+        for r in range(first, last + 1):
+            for indices in self._ring(cx, cy, r):
+                offsets = self.positions[indices] - point
+                distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+                for distance, index in zip(distances.tolist(), indices.tolist()):
+                    heapq.heappush(heap, (distance, index))
+            # every position not seen yet is at least r cells away
+            covered = r * self.cell_size
+            while heap and heap[0][0] <= covered:
+                yield heapq.heappop(heap)
+        while heap:
+            yield heapq.heappop(heap)
+
+    def nearest(self, point, k=1):
+        '''
+        :return: indices of the k positions closest to point, closest first
+        '''
+        return [index for _, index in islice(self.ordered(point), k)]
+
+    def closest(self, point):
+        '''
+        :return: index of the position closest to point, None when there are no positions
+        '''
+        for _, index in self.ordered(point):
+            return index
+        return None
@@ -0,0 +1,99 @@
+import bisect
+from collections import namedtuple
+
+KEY_BITS = 64
+
+
+class StateField:
+    '''
+    One bounded field of a packed state key. Values are mapped to buckets whose lower bounds are given by `edges`;
+    anything above the last edge falls into the last bucket and negative values fall into the first one.
+    '''
+
+    def __init__(self, name, limit=None, edges=None):
+        if (limit is None) == (edges is None):
+            raise ValueError("StateField %r needs exactly one of limit or edges" % name)
+        self.name = name
+        self.edges = tuple(range(limit + 1)) if edges is None else tuple(edges)
+        if self.edges[0] != 0 or list(self.edges) != sorted(set(self.edges)):
+            raise ValueError("StateField %r edges must be increasing and start at 0" % name)
+        self.bits = max((len(self.edges) - 1).bit_length(), 1)
+        # value -> bucket lookup for every value up to the last edge, anything larger is clamped
+        self.buckets = [bisect.bisect_right(self.edges, value) - 1 for value in range(self.edges[-1] + 1)]
+        self.max_value = self.edges[-1]
+
+
+class StateEncoder:
+    '''
+    Packs a tuple of bounded counters into a single integer key (at most 64 bits) so the Q-table indexes states by a
+    small int instead of str(tuple). decode() turns a key back into the bucket lower bounds for debugging.
+    '''
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.shifts = []
+        shift = 0
+        for field in self.fields:
+            self.shifts.append(shift)
+            shift += field.bits
+        if shift > KEY_BITS:
+            raise ValueError("State fields need %d bits, more than the %d bit key" % (shift, KEY_BITS))
+        self.bits = shift
+        self.State = namedtuple('State', [field.name for field in self.fields])
+        self._packers = list(zip(self.fields, self.shifts))
+        # per-field lookup of the already shifted bucket bits, indexed by the clamped value
+        self._luts = [[bucket << shift for bucket in field.buckets] for field, shift in self._packers]
+        self._tops = [field.max_value for field in self.fields]
+
+    def encode(self, values):
+        key = 0
+        for lut, top, value in zip(self._luts, self._tops, values):
+            if value > top:
+                value = top
+            elif value < 0:
+                value = 0
+            key |= lut[value]
+        return key
+
+    def decode(self, key):
+        '''
+        :param key: a key produced by encode()
+        :return: a State namedtuple holding the lower bound of each field's bucket
+        '''
+        return self.State(*(field.edges[(key >> shift) & ((1 << field.bits) - 1)]
+                            for field, shift in self._packers))
+
+
+COUNT_EDGES = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+WORKER_EDGES = (0, 1, 4, 8, 12, 16, 20, 24, 30, 40, 50, 60, 70)
+ARMY_EDGES = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+
+# Field order matches the tuple returned by rlAgent.get_state
+PROTOSS_STATE_ENCODER = StateEncoder([
+    StateField('nexuses', limit=3),
+    StateField('probes', edges=WORKER_EDGES),
+    StateField('idle_probes', edges=(0, 1, 2, 4, 8)),
+    StateField('pylons', limit=7),
+    StateField('completed_pylons', limit=7),
+    StateField('gateways', limit=7),
+    StateField('completed_gateways', limit=7),
+    StateField('zealots', edges=ARMY_EDGES),
+    StateField('queued_zealots', limit=5),
+    StateField('free_supply', edges=COUNT_EDGES),
+    StateField('can_afford_pylon_or_zealot', limit=1),
+    StateField('can_afford_gateway', limit=1),
+    StateField('enemy_nexuses', limit=3),
+    StateField('enemy_probes', edges=WORKER_EDGES),
+    StateField('enemy_pylons', edges=COUNT_EDGES),
+    StateField('enemy_completed_pylons', edges=COUNT_EDGES),
+    StateField('enemy_gateways', limit=7),
+    StateField('enemy_completed_gateways', limit=7),
+    StateField('enemy_zealots', edges=ARMY_EDGES),
+])
+
+# The tabular fields with raw resources in place of the can_afford flags, for the linear learner, which tile-codes
+# them. 63 bits, so keys stay positive as int64
+AFFORD_FIELDS = ('can_afford_pylon_or_zealot', 'can_afford_gateway')
+PROTOSS_LINEAR_STATE_ENCODER = StateEncoder(
+    [field for field in PROTOSS_STATE_ENCODER.fields if field.name not in AFFORD_FIELDS]
+    + [StateField('minerals', edges=range(0, 1600, 100)), StateField('vespene', edges=range(0, 800, 100))])
@@ -0,0 +1,150 @@
+from pysc2.lib import features, units
+from collections import namedtuple
+import numpy as np
+from unit_index import ALLIANCE_SLOTS
+
+CELLS_PER_SLOT = ALLIANCE_SLOTS * 4
+UNIT_COLUMNS = [int(features.FeatureUnit.unit_type), int(features.FeatureUnit.alliance),
+                int(features.FeatureUnit.build_progress), int(features.FeatureUnit.order_length)]
+
+# plain tuple view of obs.observation.player, attribute access on NamedNumpyArray is slow
+PlayerStats = namedtuple('PlayerStats', [field.name for field in features.Player])
+
+
+class UnitCount:
+    '''
+    Number of raw units of `unit_type` owned by `alliance`. completed / idle restrict the count to units with
+    build_progress == 100 / order_length == 0 when True (or to the opposite when False); None counts both.
+    '''
+
+    def __init__(self, name, unit_type, alliance, completed=None, idle=None):
+        self.name = name
+        self.unit_type = unit_type
+        self.alliance = alliance
+        self.completed = completed
+        self.idle = idle
+
+
+class FirstUnitValue(UnitCount):
+    '''
+    Value of `column` on the first matching raw unit, or `default` when there is none.
+    '''
+
+    def __init__(self, name, unit_type, alliance, column, completed=None, idle=None, default=0):
+        super(FirstUnitValue, self).__init__(name, unit_type, alliance, completed, idle)
+        self.column = column
+        self.default = default
+
+
+class PlayerValue:
+    '''
+    A value computed from the player stats, e.g. lambda player: player.minerals >= 100
+    '''
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+
+
+class FeatureExtractor:
+    '''
+    Computes a state vector from a declarative feature spec in a single vectorized pass over raw_units.
+    Every unit is mapped to a cell (unit type slot, alliance, completed, idle), the cells are counted once with
+    np.bincount and each UnitCount is a fixed selection of cells, so adding features doesn't add passes.
+    '''
+
+    def __init__(self, spec):
+        self.spec = list(spec)
+        self.names = [feature.name for feature in self.spec]
+        unit_features = [f for f in self.spec if isinstance(f, UnitCount)]
+
+        unit_types = sorted({int(f.unit_type) for f in unit_features})
+        self.n_cells = max(len(unit_types), 1) * CELLS_PER_SLOT
+        # first cell of every unit type's slot, types outside the spec land past n_cells
+        self.slot_of_type = np.full(max(unit_types, default=0) + 2, -1, dtype=np.int64)
+        self.slot_of_type[unit_types] = np.arange(len(unit_types))
+        self.cell_base = np.where(self.slot_of_type >= 0, self.slot_of_type * CELLS_PER_SLOT, self.n_cells)
+
+        counts = [f for f in unit_features if not isinstance(f, FirstUnitValue)]
+        self.count_positions = np.array([self.spec.index(f) for f in counts], dtype=np.int64)
+        self.count_cells = np.zeros((len(counts), self.n_cells), dtype=np.int64)
+        for i, feature in enumerate(counts):
+            self.count_cells[i, self._cells(feature)] = 1
+
+        self.first_values = []
+        for feature in unit_features:
+            if isinstance(feature, FirstUnitValue):
+                # one extra cell at the end for units that don't belong to any slot
+                matches = np.zeros(self.n_cells + 1, dtype=bool)
+                matches[self._cells(feature)] = True
+                self.first_values.append((self.spec.index(feature), matches, int(feature.column), feature.default))
+
+        self.player_values = [(self.spec.index(f), f.fn) for f in self.spec if isinstance(f, PlayerValue)]
+
+    def _cells(self, feature):
+        slot = self.slot_of_type[int(feature.unit_type)]
+        completed = [0, 1] if feature.completed is None else [int(feature.completed)]
+        idle = [0, 1] if feature.idle is None else [int(feature.idle)]
+        return [slot * CELLS_PER_SLOT + int(feature.alliance) * 4 + c * 2 + i for c in completed for i in idle]
+
+    def unit_cells(self, raw_units):
+        '''
+        :return: the cell of every raw unit, n_cells for units of types the spec doesn't mention
+        '''
+        unit_type, alliance, build_progress, order_length = np.asarray(raw_units)[:, UNIT_COLUMNS].T
+        cells = (self.cell_base[np.minimum(unit_type, len(self.cell_base) - 1)] + alliance * 4
+                 + (build_progress == 100) * 2 + (order_length == 0))
+        return np.minimum(cells, self.n_cells)
+
+    def extract_vector(self, obs):
+        data = np.asarray(obs.observation.raw_units)
+        values = np.zeros(len(self.spec), dtype=np.int64)
+        cells = self.unit_cells(data)
+
+        cell_counts = np.bincount(cells, minlength=self.n_cells + 1)[:self.n_cells]
+        values[self.count_positions] = self.count_cells @ cell_counts
+
+        for position, matches, column, default in self.first_values:
+            hits = matches[cells]
+            first = hits.argmax() if len(hits) else 0
+            values[position] = data[first, column] if len(hits) and hits[first] else default
+
+        player = PlayerStats._make(np.asarray(obs.observation.player).tolist())
+        for position, fn in self.player_values:
+            values[position] = fn(player)
+        return values
+
+    def extract(self, obs):
+        return tuple(self.extract_vector(obs).tolist())
+
+
+SELF = features.PlayerRelative.SELF
+ENEMY = features.PlayerRelative.ENEMY
+
+# Same fields, in the same order, as state_encoding.PROTOSS_STATE_ENCODER
+PROTOSS_STATE_FEATURES = FeatureExtractor([
+    UnitCount('nexuses', units.Protoss.Nexus, SELF),
+    UnitCount('probes', units.Protoss.Probe, SELF),
+    UnitCount('idle_probes', units.Protoss.Probe, SELF, idle=True),
+    UnitCount('pylons', units.Protoss.Pylon, SELF),
+    UnitCount('completed_pylons', units.Protoss.Pylon, SELF, completed=True),
+    UnitCount('gateways', units.Protoss.Gateway, SELF),
+    UnitCount('completed_gateways', units.Protoss.Gateway, SELF, completed=True),
+    UnitCount('zealots', units.Protoss.Zealot, SELF),
+    FirstUnitValue('queued_zealots', units.Protoss.Gateway, SELF, features.FeatureUnit.order_length, completed=True),
+    PlayerValue('free_supply', lambda player: player.food_cap - player.food_used),
+    PlayerValue('can_afford_pylon_or_zealot', lambda player: player.minerals >= 100),
+    PlayerValue('can_afford_gateway', lambda player: player.minerals >= 150),
+    UnitCount('enemy_nexuses', units.Protoss.Nexus, ENEMY),
+    UnitCount('enemy_probes', units.Protoss.Probe, ENEMY),
+    UnitCount('enemy_pylons', units.Protoss.Pylon, ENEMY),
+    UnitCount('enemy_completed_pylons', units.Protoss.Pylon, ENEMY, completed=True),
+    UnitCount('enemy_gateways', units.Protoss.Gateway, ENEMY),
+    UnitCount('enemy_completed_gateways', units.Protoss.Gateway, ENEMY, completed=True),
+    UnitCount('enemy_zealots', units.Protoss.Zealot, ENEMY),
+])
+
+# Same fields, in the same order, as state_encoding.PROTOSS_LINEAR_STATE_ENCODER
+PROTOSS_LINEAR_STATE_FEATURES = FeatureExtractor(
+    [feature for feature in PROTOSS_STATE_FEATURES.spec if not feature.name.startswith('can_afford')]
+    + [PlayerValue('minerals', lambda player: player.minerals), PlayerValue('vespene', lambda player: player.vespene)])
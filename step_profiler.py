@@ -0,0 +1,143 @@
+from contextlib import nullcontext
+import json
+import os
+from threading import get_ident
+from time import perf_counter_ns
+import numpy as np
+
+# log2 histogram buckets, the upper bound of bucket b is 2 ** b nanoseconds
+HISTOGRAM_BUCKETS = 40
+
+
+class Phase:
+    '''
+    Reusable context manager timing one named phase on one thread. Kept tiny because it runs several times per agent
+    step.
+    '''
+    __slots__ = ('name', 'durations', 'events', 'thread', 'start')
+
+    def __init__(self, name, durations, events, thread=0):
+        self.name = name
+        self.durations = durations
+        self.events = events
+        self.thread = thread
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = perf_counter_ns() - self.start
+        self.durations.append(duration)
+        if self.events is not None:
+            self.events.append((self.name, self.start, duration, self.thread))
+        return False
+
+
+class StepProfiler:
+    '''
+    Opt-in per-phase timing for agent steps. Code wraps each phase in `with profiler.phase(name):`, durations are
+    kept per game with perf_counter_ns and summarized at end_game() into percentiles and log2 histograms.
+    Summaries are appended to <output_dir>/summaries.jsonl and, with trace=True, every phase of the game is written
+    to a Chrome trace (chrome://tracing or https://ui.perfetto.dev) at <output_dir>/<name>_game<n>.trace.json.
+    Each thread gets its own Phase objects, e.g. for learn steps on a LearnPipeline worker, since a Phase holds the
+    start time of the call in progress; durations of a phase name are pooled over threads.
+    '''
+
+    def __init__(self, name='agent', output_dir=None, trace=False, verbose=True):
+        self.name = name
+        self.output_dir = output_dir
+        self.trace = trace
+        self.verbose = verbose
+        self.phases = {}
+        # thread ident to the trace's tid, in order of first use
+        self.threads = {}
+        self.durations = {}
+        self.events = [] if trace else None
+        self.games = 0
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def phase(self, name):
+        key = (get_ident(), name)
+        phase = self.phases.get(key)
+        if phase is None:
+            thread = self.threads.setdefault(key[0], len(self.threads))
+            phase = self.phases[key] = Phase(name, self.durations.setdefault(name, []), self.events, thread)
+        return phase
+
+    def summary(self):
+        '''
+        :return: dict from phase name to calls, total/mean/p50/p99/max time and a log2 histogram of the current game
+        '''
+        summary = {}
+        for name, durations in list(self.durations.items()):
+            if not durations:
+                continue
+            ns = np.array(durations, dtype=np.int64)
+            buckets = np.bincount(np.minimum(np.ceil(np.log2(np.maximum(ns, 1))).astype(np.int64),
+                                             HISTOGRAM_BUCKETS - 1), minlength=HISTOGRAM_BUCKETS)
+            summary[name] = {'calls': len(ns),
+                             'total_ms': float(ns.sum() / 1e6),
+                             'mean_us': float(ns.mean() / 1e3),
+                             'p50_us': float(np.percentile(ns, 50) / 1e3),
+                             'p99_us': float(np.percentile(ns, 99) / 1e3),
+                             'max_us': float(ns.max() / 1e3),
+                             'histogram_ns': {str(2 ** b): int(count) for b, count in enumerate(buckets.tolist())
+                                              if count}}
+        return summary
+
+    def end_game(self):
+        '''
+        Writes out and resets the current game's measurements, does nothing when no phase ran.
+        :return: the game summary or None
+        '''
+        if not any(list(self.durations.values())):
+            return None
+        self.games += 1
+        summary = self.summary()
+        if self.verbose:
+            print(self.format_summary(summary))
+        if self.output_dir:
+            with open(os.path.join(self.output_dir, 'summaries.jsonl'), 'a') as f:
+                f.write(json.dumps({'profiler': self.name, 'game': self.games, 'phases': summary}) + '\n')
+            if self.trace:
+                self.write_trace(os.path.join(self.output_dir, '%s_game%d.trace.json' % (self.name, self.games)))
+        for durations in list(self.durations.values()):
+            durations.clear()
+        if self.events is not None:
+            self.events.clear()
+        return summary
+
+    def write_trace(self, path):
+        origin = self.events[0][1] if self.events else 0
+        events = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': thread, 'ts': (start - origin) / 1e3,
+                   'dur': duration / 1e3} for name, start, duration, thread in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def format_summary(self, summary):
+        lines = ["%s game %d: %-28s %8s %10s %10s %10s %10s" % (self.name, self.games, 'phase', 'calls', 'total ms',
+                                                                 'p50 us', 'p99 us', 'max us')]
+        for name, stats in sorted(summary.items(), key=lambda item: -item[1]['total_ms']):
+            lines.append("%s game %d: %-28s %8d %10.1f %10.1f %10.1f %10.1f" % (
+                self.name, self.games, name, stats['calls'], stats['total_ms'], stats['p50_us'], stats['p99_us'],
+                stats['max_us']))
+        return '\n'.join(lines)
+
+
+class NullProfiler:
+    '''
+    Stand-in used when profiling is off, phase() returns a shared no-op context manager.
+    '''
+    _phase = nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def end_game(self):
+        return None
+
+
+NULL_PROFILER = NullProfiler()
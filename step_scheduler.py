@@ -0,0 +1,85 @@
+from time import perf_counter
+from step_profiler import NULL_PROFILER
+
+# priority of subsystems that run whenever they are due, regardless of the step budget
+CRITICAL = 0
+STEP_BUDGET_MS = 20.0
+# a due subsystem is deferred at most this many steps in a row before it runs over budget anyway
+MAX_DEFERRALS = 8
+COST_SMOOTHING = 0.2
+
+
+class Subsystem:
+    '''
+    One periodic piece of bot logic.
+    :param run: coroutine function taking no arguments
+    :param cadence: game seconds between runs, 0 runs it on every step
+    :param priority: CRITICAL (0) always runs when due, higher numbers are deferred first when a step runs long
+    :param budget_ms: expected cost, used to decide deferral until the subsystem has been measured
+    '''
+
+    def __init__(self, name, run, cadence=0.0, priority=CRITICAL, budget_ms=1.0):
+        self.name = name
+        self.run = run
+        self.cadence = cadence
+        self.priority = priority
+        self.budget_ms = budget_ms
+        self.expected_ms = budget_ms
+        self.next_run = 0.0
+        self.deferrals = 0
+        self.runs = 0
+        self.deferred = 0
+        self.overruns = 0
+
+
+class StepScheduler:
+    '''
+    Runs the due subsystems of a step in priority order inside a wall-clock step budget. Subsystems whose expected
+    cost would overrun the budget are deferred to the next step, where they are still due. Subsystems sharing a
+    cadence start staggered, so periodic work is spread over steps instead of landing on the same one.
+    '''
+
+    def __init__(self, subsystems, step_budget_ms=STEP_BUDGET_MS, profiler=NULL_PROFILER):
+        self.subsystems = sorted(subsystems, key=lambda subsystem: subsystem.priority)
+        self.step_budget_ms = step_budget_ms
+        self.profiler = profiler
+        by_cadence = {}
+        for subsystem in subsystems:
+            by_cadence.setdefault(subsystem.cadence, []).append(subsystem)
+        for cadence, group in by_cadence.items():
+            for i, subsystem in enumerate(group):
+                subsystem.next_run = cadence * i / len(group)
+
+    async def run(self, now):
+        '''
+        :param now: game time in seconds
+        :return: names of the subsystems that ran
+        '''
+        start = perf_counter()
+        ran = []
+        for subsystem in self.subsystems:
+            if now < subsystem.next_run:
+                continue
+            elapsed_ms = (perf_counter() - start) * 1000
+            if (subsystem.priority > CRITICAL and subsystem.deferrals < MAX_DEFERRALS
+                    and elapsed_ms + subsystem.expected_ms > self.step_budget_ms):
+                subsystem.deferrals += 1
+                subsystem.deferred += 1
+                continue
+
+            with self.profiler.phase(subsystem.name):
+                began = perf_counter()
+                await subsystem.run()
+                cost_ms = (perf_counter() - began) * 1000
+            subsystem.expected_ms += COST_SMOOTHING * (cost_ms - subsystem.expected_ms)
+            subsystem.overruns += cost_ms > subsystem.budget_ms
+            subsystem.deferrals = 0
+            subsystem.runs += 1
+            subsystem.next_run = now + subsystem.cadence
+            ran.append(subsystem.name)
+        return ran
+
+    def stats(self):
+        return {subsystem.name: {'runs': subsystem.runs, 'deferred': subsystem.deferred,
+                                 'overruns': subsystem.overruns, 'expected_ms': subsystem.expected_ms}
+                for subsystem in self.subsystems}
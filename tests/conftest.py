@@ -0,0 +1,11 @@
+import os
+import sys
+
+# the modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from absl import flags
+
+# pysc2_bot and the trainers read their flags at import and call time
+if not flags.FLAGS.is_parsed():
+    flags.FLAGS.mark_as_parsed()
@@ -0,0 +1,16 @@
+import benchmark
+import offline_sc2
+
+
+def test_shloompy_benchmark_runs_on_a_synthetic_scenario():
+    scenario = benchmark.SCENARIOS[0]
+    env = benchmark.scenario_env(scenario)
+    result = benchmark.benchmark_shloompy(scenario.name, offline_sc2.recording(env), steps=3, alloc_steps=1)
+    assert result['benchmark'] == 'Shloompy.on_step'
+    assert result['units'] == env.n
+
+
+def test_env_benchmark_reports_steps_per_second():
+    result = benchmark.benchmark_env(steps=600, enemy_attack_loop=4800)
+    assert result['benchmark'] == 'FakeSC2Env.step'
+    assert result['calls'] == 600 and result['steps_per_second'] > 0
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+from s2clientprotocol import common_pb2, raw_pb2
+from sc2.ids.ability_id import AbilityId
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.position import Point2
+from sc2.unit import Unit
+from sc2.unit_command import UnitCommand
+import benchmark
+from command_batcher import CommandBatcher
+
+BOT = SimpleNamespace(state=SimpleNamespace(game_loop=0))
+TARGET = Point2((50.5, 40.5))
+
+
+def zealot(tag):
+    return Unit(raw_pb2.Unit(tag=tag, unit_type=UnitTypeId.ZEALOT.value, owner=1, alliance=1,
+                             pos=common_pb2.Point(x=20, y=20)), BOT)
+
+
+def test_identical_commands_become_one_action():
+    identical, distinct = 12, 5
+    attacks = [UnitCommand(AbilityId.ATTACK, zealot(tag), TARGET) for tag in range(1, identical + 1)]
+    moves = [UnitCommand(AbilityId.MOVE, zealot(100 + i), Point2((10 + i, 10))) for i in range(distinct)]
+    # one move after every other attack, so python-sc2 alone can't merge the attacks
+    commands = []
+    for i, attack in enumerate(attacks):
+        commands.append(attack)
+        if i % 2 and moves:
+            commands.append(moves.pop())
+    commands.extend(moves)
+
+    batcher = CommandBatcher()
+    regrouped = batcher.regroup(commands)
+    assert sorted(map(id, regrouped)) == sorted(map(id, commands))
+    # runs of two adjacent attacks between the moves
+    assert batcher.action_stats(commands)[0] == identical // 2 + distinct
+    assert batcher.action_stats(regrouped)[0] == 1 + distinct
+
+
+def test_queue_flag_and_unit_order_are_kept():
+    unit = zealot(1)
+    first = UnitCommand(AbilityId.MOVE, unit, TARGET)
+    second = UnitCommand(AbilityId.ATTACK, unit, TARGET, queue=True)
+    queued = UnitCommand(AbilityId.ATTACK, zealot(2), TARGET, queue=True)
+    unqueued = UnitCommand(AbilityId.ATTACK, zealot(3), TARGET)
+    regrouped = CommandBatcher().regroup([first, queued, second, unqueued])
+
+    assert regrouped.index(first) < regrouped.index(second)
+    assert CommandBatcher.action_stats(regrouped)[0] == 4
+
+
+def test_benchmark_army_order_goes_out_as_two_actions():
+    result = benchmark.benchmark_command_batching(army_size=160, steps=1)
+    assert result['actions'] == {'before': 80, 'after': 2}
+    assert result['request_bytes']['after'] < result['request_bytes']['before']
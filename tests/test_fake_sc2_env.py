@@ -0,0 +1,47 @@
+from pysc2.lib import actions, units
+import fake_sc2_env
+from fake_sc2_env import FakeSC2Env
+
+NO_OP = [actions.RAW_FUNCTIONS.no_op()]
+
+
+def run_until(env, game_loop):
+    while env.game_loop < game_loop:
+        if env.step(NO_OP)[0].last():
+            break
+
+
+def test_enemy_builds_from_either_start():
+    starts = set()
+    for seed in range(8):
+        env = FakeSC2Env(seed=seed)
+        env.reset()
+        starts.add(env.top_left)
+        run_until(env, 4500)
+        assert env.enemy_builds == 3
+        assert env.sides[fake_sc2_env.ENEMY].gateways
+    assert starts == {True, False}
+
+
+def test_enemy_waits_while_no_probe_is_free():
+    env = FakeSC2Env(seed=0)
+    env.reset()
+    for tag in list(env.gathering):
+        if env.units[env.rows[tag], fake_sc2_env.ALLIANCE] == fake_sc2_env.ENEMY:
+            env.release_harvester(tag)
+    run_until(env, 1500)
+    assert env.enemy_builds == 0
+
+
+def test_settled_army_engages_a_unit_that_appears_near_it():
+    env = FakeSC2Env(seed=0)
+    env.reset()
+    env.add_unit(units.Protoss.Zealot, fake_sc2_env.SELF, (32, 32))
+    env.step(NO_OP)
+    env.step(NO_OP)
+    assert env.combat_settled
+
+    pylon = env.add_unit(units.Protoss.Pylon, fake_sc2_env.ENEMY, (32, 37))
+    for _ in range(3):
+        env.step(NO_OP)
+    assert env.unit(pylon)[fake_sc2_env.SHIELD] < 200
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from linear_q import LinearQLearner
+from q_table import mask_bits
+from state_encoding import PROTOSS_LINEAR_STATE_ENCODER
+
+ACTIONS = ['a', 'b', 'c']
+ENCODER = PROTOSS_LINEAR_STATE_ENCODER
+
+
+def encode(**values):
+    return ENCODER.encode([values.get(field.name, 0) for field in ENCODER.fields])
+
+
+def tiling_columns(learner):
+    '''
+    :return: per tiling of every tile-coded field, the range of its feature columns
+    '''
+    ranges = []
+    for i, first in enumerate(learner.tile_firsts.tolist()):
+        field = ENCODER.fields[learner.tiled[i]]
+        tiles = int(field.max_value * learner.tile_widths_inv[i]) + 2
+        ranges.append((field.name, first, first + tiles))
+    return ranges
+
+
+def test_features_hold_bias_scaled_counts_and_one_tile_per_tiling():
+    learner = LinearQLearner(ACTIONS, ENCODER)
+    keys = [encode(), encode(probes=30, zealots=8, minerals=450, vespene=120),
+            encode(probes=500, zealots=99, minerals=10 ** 6, vespene=10 ** 6)]
+    phi = learner.features(keys)
+    scaled = len(learner.scaled)
+
+    assert phi.shape == (len(keys), learner.n_features)
+    assert (phi[:, scaled] == 1.0).all()
+    assert ((phi[:, :scaled] >= 0) & (phi[:, :scaled] <= 1)).all()
+    names = [ENCODER.fields[i].name for i in learner.scaled]
+    assert phi[2, names.index('probes')] == phi[2, names.index('zealots')] == 1.0
+    assert ((phi[:, scaled + 1:] == 0) | (phi[:, scaled + 1:] == 1)).all()
+    for name, start, stop in tiling_columns(learner):
+        assert (phi[:, start:stop].sum(axis=1) == 1).all(), name
+    assert phi[:, scaled + 1:].sum(axis=1).tolist() == [learner.tilings * len(learner.tile_widths)] * len(keys)
+
+
+def test_features_clamp_at_the_last_edge():
+    learner = LinearQLearner(ACTIONS, ENCODER)
+    last = {field.name: field.max_value for field in ENCODER.fields}
+    np.testing.assert_array_equal(learner.features([encode(**last)]),
+                                  learner.features([encode(**{name: 10 * value + 1 for name, value in last.items()})]))
+
+
+def test_learn_matches_a_single_transition_learn_batch():
+    rng = np.random.RandomState(0)
+    states = [encode(probes=int(p), minerals=int(m), vespene=int(v))
+              for p, m, v in rng.randint(0, 1600, size=(6, 3))]
+    mask = np.array([True, False, True])
+    single = LinearQLearner(ACTIONS, ENCODER)
+    batched = LinearQLearner(ACTIONS, ENCODER)
+    for i in range(len(states) - 1):
+        action_id = i % len(ACTIONS)
+        reward = float(rng.uniform(-1, 1))
+        single.learn(states[i], ACTIONS[action_id], reward, states[i + 1], mask)
+        batched.learn_batch(np.array([states[i]]), np.array([action_id]), np.array([reward]),
+                            np.array([states[i + 1]]), np.array([False]),
+                            np.array([mask_bits(mask)], dtype=np.uint64))
+    assert single.weights.any()
+    np.testing.assert_allclose(batched.weights, single.weights, rtol=0, atol=1e-12)
+
+
+def test_load_rejects_a_checkpoint_of_another_learner(tmp_path):
+    path = str(tmp_path / 'ck')
+    learner = LinearQLearner(ACTIONS, ENCODER)
+    learner.learn(encode(probes=12), 'a', 1.0, encode(probes=13))
+    learner.save(path)
+    np.testing.assert_array_equal(LinearQLearner(ACTIONS, ENCODER).load(path).weights, learner.weights)
+    with pytest.raises(ValueError):
+        LinearQLearner(ACTIONS + ['d'], ENCODER).load(path)
+    with pytest.raises(ValueError):
+        LinearQLearner(ACTIONS, ENCODER, tilings=2).load(path)
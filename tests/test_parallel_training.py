@@ -0,0 +1,62 @@
+import functools
+import queue
+import numpy as np
+import pysc2_bot
+from fake_sc2_env import FakeSC2Env
+from parallel_training import ParallelTrainer, SyncingWorker
+from q_table import BoundedQLearningTable, FREE_KEY
+
+ACTIONS = ['a', 'b', 'c']
+
+
+def test_merge_adds_deltas_and_versions_rows():
+    trainer = ParallelTrainer(ACTIONS, workers=1, episodes=1)
+    trainer.merge(np.array([5, 6]), np.array([[1.0, 0, 0], [0, 2.0, 0]]))
+    trainer.merge(np.array([5]), np.array([[0.5, 0, 0]]))
+    table = trainer.q_table
+    np.testing.assert_array_equal(table.q_values[table.state_rows[5]], [1.5, 0, 0])
+
+    keys, values, version = trainer.changed_since(2)
+    assert keys.tolist() == [5] and version == 3
+    keys, values, _ = trainer.changed_since(0)
+    assert sorted(keys.tolist()) == [5, 6]
+
+
+def test_bounded_coordinator_never_sends_evicted_rows():
+    trainer = ParallelTrainer(ACTIONS, workers=1, episodes=1, max_states=200, q_dtype='float32')
+    assert trainer.q_table.q_values.dtype == np.float32
+    for start in range(0, 1000, 100):
+        keys = np.arange(start, start + 100)
+        trainer.merge(keys, np.ones((100, len(ACTIONS))))
+    keys, values, _ = trainer.changed_since(0)
+    assert len(keys) == len(trainer.q_table) <= 200
+    assert -1 not in keys.tolist()
+    for key, value in zip(keys.tolist(), values):
+        np.testing.assert_array_equal(trainer.q_table.q_values[trainer.q_table.state_rows[key]], value)
+
+
+def test_bounded_worker_never_sends_freed_rows():
+    table = BoundedQLearningTable(ACTIONS, max_states=200)
+    inbox, outbox = queue.Queue(), queue.Queue()
+    worker = SyncingWorker(0, table, inbox, outbox)
+    for state in range(150):
+        table.learn(state, 'a', 1.0, state + 1)
+    table.evict(20)
+    inbox.put((np.zeros(0, dtype=np.int64), np.zeros((0, len(ACTIONS))), 1))
+    worker.sync(1)
+    _, _, keys, deltas, _, _ = outbox.get()
+    assert FREE_KEY not in keys.tolist()
+    assert set(keys.tolist()) <= set(table.state_rows) and len(keys) == 130
+    assert np.all(deltas[:, 0] != 0)
+
+
+def test_workers_train_on_the_fake_env(tmp_path):
+    path = str(tmp_path / 'shared')
+    agent_factory = functools.partial(pysc2_bot.rlAgent, max_states=300, q_dtype='float32')
+    trainer = ParallelTrainer(pysc2_bot.ProtossAgent().actions, workers=2, episodes=2, sync_every=1,
+                              env_factory=FakeSC2Env, agent_factory=agent_factory, checkpoint_path=path,
+                              max_states=300, q_dtype='float32')
+    stats = trainer.run()
+    assert stats['errors'] == {}
+    assert stats['episodes'] == 4
+    assert len(trainer.q_table) > 0
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+import numpy as np
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.position import Point2
+import placement_planner
+from placement_planner import PlacementPlanner
+
+SIZE = 40
+MINERAL = Point2((30.5, 22.5))
+
+
+def structure(tag, type_id, center, size):
+    return SimpleNamespace(tag=tag, type_id=type_id, position=Point2(center), footprint_radius=size / 2,
+                           is_ready=True)
+
+
+def make_planner(grid=None, pylon=True):
+    '''
+    A nexus in the middle of a 40x40 map with one mineral field by the pylon and, optionally, a completed pylon.
+    '''
+    grid = np.ones((SIZE, SIZE), dtype=np.uint8) if grid is None else grid
+    structures = [structure(1, UnitTypeId.NEXUS, (20.5, 20.5), 5)]
+    if pylon:
+        structures.append(structure(2, UnitTypeId.PYLON, (27, 27), 2))
+    bot = SimpleNamespace(time=0.0, resources=[SimpleNamespace(position=MINERAL)], structures=structures,
+                          game_info=SimpleNamespace(placement_grid=SimpleNamespace(data_numpy=grid),
+                                                    map_center=Point2((SIZE, SIZE))))
+    planner = PlacementPlanner(bot)
+    planner.start()
+    return planner
+
+
+def take_all(planner, building):
+    slots = []
+    while True:
+        position = planner.take(building)
+        if position is None:
+            return slots
+        slots.append(planner.footprint(position, placement_planner.BUILDING_SIZES[building]))
+
+
+def cells(slot, margin=0):
+    x0, y0, size = slot
+    return {(x, y) for x in range(x0 - margin, x0 + size + margin) for y in range(y0 - margin, y0 + size + margin)}
+
+
+def test_slots_keep_clear_of_structures_resources_and_each_other():
+    planner = make_planner()
+    slots = take_all(planner, UnitTypeId.PYLON) + take_all(planner, UnitTypeId.GATEWAY)
+    assert slots
+    taken = set()
+    structures = cells(planner.footprints[1]) | cells(planner.footprints[2])
+    for slot in slots:
+        footprint = cells(slot)
+        assert not cells(slot, margin=1) & (taken | structures)
+        assert all(np.hypot(x + 0.5 - MINERAL.x, y + 0.5 - MINERAL.y) > placement_planner.RESOURCE_BUFFER
+                   for x, y in footprint)
+        taken |= footprint
+
+
+def test_take_returns_none_when_nothing_fits():
+    planner = make_planner(grid=np.zeros((SIZE, SIZE), dtype=np.uint8))
+    assert planner.take(UnitTypeId.PYLON) is None
+    assert planner.take(UnitTypeId.GATEWAY) is None
+    assert planner.take(UnitTypeId.NEXUS) is None
+
+
+def test_destroyed_structure_frees_its_footprint():
+    planner = make_planner()
+    position = planner.take(UnitTypeId.GATEWAY)
+    planner.add_structure(structure(3, UnitTypeId.GATEWAY, position, 3))
+    assert take_all(planner, UnitTypeId.GATEWAY)
+    assert planner.take(UnitTypeId.GATEWAY) is None
+
+    planner.remove_structure(3)
+    assert planner.take(UnitTypeId.GATEWAY) == position
+
+
+def test_expired_and_released_reservations_are_handed_back():
+    planner = make_planner()
+    first = planner.take(UnitTypeId.GATEWAY)
+    take_all(planner, UnitTypeId.GATEWAY)
+
+    planner.release(first, UnitTypeId.GATEWAY)
+    assert planner.take(UnitTypeId.GATEWAY) == first
+    assert planner.take(UnitTypeId.GATEWAY) is None
+
+    planner.bot.time = placement_planner.RESERVATION_SECONDS
+    assert planner.take(UnitTypeId.GATEWAY) is not None
+    assert not planner.reserved or min(planner.reserved.values()) > placement_planner.RESERVATION_SECONDS
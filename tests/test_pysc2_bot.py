@@ -0,0 +1,82 @@
+import os
+import pytest
+import pysc2_bot
+from fake_sc2_env import FakeSC2Env
+from step_profiler import StepProfiler
+
+OPTIONS = [
+    {},
+    {'mask_actions': False},
+    {'learner': 'linear'},
+    {'replay_capacity': 256},
+    {'q_dtype': 'float32', 'max_states': 130, 'replay_capacity': 256, 'spill': True},
+    {'pipeline': True, 'replay_capacity': 256},
+    {'learner': 'linear', 'pipeline': True, 'replay_capacity': 256},
+    {'checkpoint': True, 'checkpoint_every': 1},
+]
+
+
+def run_episodes(agent, env, episodes):
+    agent.setup(env.observation_spec(), env.action_spec())
+    for _ in range(episodes):
+        timesteps = env.reset()
+        agent.reset()
+        while True:
+            actions = [agent.step(timesteps[0])]
+            if timesteps[0].last():
+                break
+            timesteps = env.step(actions)
+
+
+@pytest.mark.parametrize('options', OPTIONS, ids=lambda options: ','.join(sorted(options)) or 'default')
+def test_rl_agent_plays_fake_env(options, tmp_path):
+    options = dict(options)
+    if options.pop('spill', False):
+        options['spill_path'] = str(tmp_path / 'spill.sqlite')
+    if options.pop('checkpoint', False):
+        options['checkpoint_path'] = str(tmp_path / 'ck')
+    agent = pysc2_bot.rlAgent(**options)
+    # an early attack ends the short games with a reward to learn from
+    run_episodes(agent, FakeSC2Env(seed=0, max_game_loops=9600, enemy_attack_loop=4800), 3)
+    agent.save_checkpoint()
+
+    table = agent.q_table
+    values = table.weights if options.get('learner') == 'linear' else table.values
+    assert values.any()
+    if 'checkpoint_path' in options:
+        assert os.path.exists(table.checkpoint_files(options['checkpoint_path'])[-1])
+        resumed = pysc2_bot.rlAgent(checkpoint_path=options['checkpoint_path'])
+        assert resumed.q_table.state_keys == table.state_keys
+
+
+def test_do_nothing_is_the_only_valid_action_when_nothing_is_affordable():
+    env = FakeSC2Env(seed=0)
+    agent = pysc2_bot.rlAgent()
+    agent.setup(env.observation_spec(), env.action_spec())
+    timestep = env.reset()[0]
+    agent.reset()
+    timestep.observation.player.minerals = 0
+    mask = agent.valid_actions(timestep)
+    assert mask[agent.actions.index('do_nothing')]
+    assert set(agent.actions[i] for i in mask.nonzero()[0]) <= {'do_nothing', 'harvest_gas', 'harvest_minerals',
+                                                                 'attack'}
+
+
+def test_pipelined_learn_steps_are_timed_on_the_worker_thread():
+    agent = pysc2_bot.rlAgent(pipeline=True, replay_capacity=256, replay_seed=0)
+    agent.profiler = StepProfiler(verbose=False)
+    run_episodes(agent, FakeSC2Env(seed=0, max_game_loops=2400), 1)
+    agent.pipeline.drain()
+    threads = {name: thread for thread, name in agent.profiler.phases}
+    assert threads['learn'] == threads['replay'] == agent.pipeline.thread.ident
+    assert threads['step'] != threads['learn']
+    assert agent.profiler.summary()['learn']['calls'] > 0
+
+
+@pytest.mark.parametrize('max_states', [0, 130])
+def test_replay_does_not_add_a_row_for_the_state_after_the_last_step(max_states):
+    agent = pysc2_bot.rlAgent(replay_capacity=16, max_states=max_states)
+    agent.replay_step(1, agent.actions[0], 1.0, 2, last=False)
+    agent.replay_step(2, agent.actions[0], -1.0, 3, last=True)
+    assert 2 in agent.q_table and 3 not in agent.q_table
+    assert len(agent.replay) == 2 and agent.replay.terminals[1]
@@ -0,0 +1,195 @@
+import numpy as np
+import pytest
+import q_table
+from q_table import BoundedQLearningTable, QLearningTable
+
+ACTIONS = ['a', 'b', 'c']
+
+
+def filled_table(states, seed=0):
+    table = QLearningTable(ACTIONS)
+    rng = np.random.RandomState(seed)
+    for state in range(states):
+        table.learn(state, ACTIONS[state % len(ACTIONS)], rng.uniform(), state + 1)
+    return table
+
+
+def assert_same_values(table, loaded):
+    assert loaded.state_keys == table.state_keys
+    np.testing.assert_array_equal(np.asarray(loaded.values), table.values)
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / 'ck')
+    table = filled_table(50)
+    assert table.save(path) == len(table)
+    assert_same_values(table, QLearningTable(ACTIONS).load(path))
+
+
+def test_incremental_save_writes_changed_and_new_rows(tmp_path):
+    path = str(tmp_path / 'ck')
+    table = filled_table(50)
+    table.save(path)
+    table.learn(3, 'a', 1.0, 60)
+    table.learn(70, 'b', 1.0, 71)
+    # rows of 3 and the three new states 60, 70 and 71
+    assert table.save(path) == 4
+    assert_same_values(table, QLearningTable(ACTIONS).load(path))
+
+
+def test_loaded_table_saves_back_to_its_checkpoint(tmp_path):
+    path = str(tmp_path / 'ck')
+    filled_table(50).save(path)
+    table = QLearningTable(ACTIONS).load(path)
+    for state in range(100, 200):
+        table.learn(state, 'c', 1.0, state + 1)
+    table.save(path)
+    assert_same_values(table, QLearningTable(ACTIONS).load(path))
+
+
+def test_interrupted_full_rewrite_keeps_previous_checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / 'ck')
+    previous = filled_table(50)
+    previous.save(path)
+
+    replace = q_table.os.replace
+
+    def crash_on_header(source, target):
+        if target.endswith('.json'):
+            raise KeyboardInterrupt
+        replace(source, target)
+
+    monkeypatch.setattr(q_table.os, 'replace', crash_on_header)
+    with pytest.raises(KeyboardInterrupt):
+        filled_table(80, seed=1).save(path)
+    monkeypatch.undo()
+
+    assert_same_values(previous, QLearningTable(ACTIONS).load(path))
+
+
+def test_float32_storage_round_trip(tmp_path):
+    path = str(tmp_path / 'ck')
+    table = QLearningTable(ACTIONS, dtype=np.float32)
+    table.learn(1, 'a', 1.0, 2)
+    table.save(path)
+    loaded = QLearningTable(ACTIONS).load(path)
+    assert loaded.q_values.dtype == np.float32
+    assert_same_values(table, loaded)
+
+
+def live_values(table):
+    return {key: np.asarray(table.q_values[row]).tolist() for key, row in table.state_rows.items()}
+
+
+def bounded_table(states, max_states=200, spill_path=None, seed=0):
+    table = BoundedQLearningTable(ACTIONS, max_states, spill_path=spill_path)
+    rng = np.random.RandomState(seed)
+    for state in range(states):
+        table.learn(state, ACTIONS[state % len(ACTIONS)], rng.uniform(), state + 1)
+    return table
+
+
+def test_bounded_save_load_round_trip(tmp_path):
+    path = str(tmp_path / 'ck')
+    table = bounded_table(150)
+    table.save(path)
+    assert live_values(BoundedQLearningTable(ACTIONS, 200).load(path)) == live_values(table)
+
+
+def test_bounded_load_evict_save_load(tmp_path):
+    path = str(tmp_path / 'ck')
+    bounded_table(400).save(path)
+    table = BoundedQLearningTable(ACTIONS, 200).load(path)
+    assert not isinstance(table.q_values, np.memmap)
+    evictions = table.evictions
+    for state in range(1000, 1300):
+        table.learn(state, 'a', 1.0, state + 1)
+    assert table.evictions > evictions
+    # freed and reused rows are patched in place, not rewritten with the whole table
+    assert table.save(path) < len(table.state_keys) + 300
+    assert live_values(BoundedQLearningTable(ACTIONS, 200).load(path)) == live_values(table)
+
+
+def test_interrupted_save_never_pairs_a_key_with_another_states_values(tmp_path, monkeypatch):
+    path = str(tmp_path / 'ck')
+    table = bounded_table(150)
+    table.save(path)
+    before = live_values(table)
+    for state in range(1000, 1100):
+        table.learn(state, 'b', 5.0, state + 1)
+
+    patch = QLearningTable._patch
+    calls = []
+
+    def crash_before_new_keys(*args):
+        calls.append(args[0])
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        patch(*args)
+
+    monkeypatch.setattr(QLearningTable, '_patch', staticmethod(crash_before_new_keys))
+    with pytest.raises(KeyboardInterrupt):
+        table.save(path)
+    monkeypatch.undo()
+
+    loaded = live_values(BoundedQLearningTable(ACTIONS, 200).load(path))
+    after = live_values(table)
+    for key, values in loaded.items():
+        assert values in (before.get(key), after.get(key))
+
+
+def test_spilled_rows_are_restored(tmp_path):
+    table = bounded_table(150, spill_path=str(tmp_path / 'spill.sqlite'))
+    learned = live_values(table)[5]
+    assert any(learned)
+    for state in range(1000, 1300):
+        table.check_if_state_exists(state)
+    assert 5 not in table
+    row = table.check_if_state_exists(5)
+    assert table.q_values[row].tolist() == learned and table.restored >= 1
+
+
+def test_mask_bits_round_trip():
+    rng = np.random.RandomState(0)
+    masks = rng.uniform(size=(20, 64)) < 0.5
+    masks[0] = False
+    masks[1] = True
+    masks[2, 63] = True
+    bits = np.array([q_table.mask_bits(mask) for mask in masks], dtype=q_table.MASK_DTYPE)
+    np.testing.assert_array_equal(q_table.bits_mask(bits, 64), masks)
+    assert q_table.mask_bits(None) == q_table.ALL_ACTIONS
+    assert q_table.bits_mask(q_table.mask_bits(None), 3).all()
+
+
+@pytest.mark.parametrize('epsilon', [1.0, 0.0], ids=['greedy', 'random'])
+def test_choose_action_never_picks_a_masked_action(epsilon):
+    np.random.seed(0)
+    table = QLearningTable(ACTIONS)
+    table.q_values[table.state_id('s')] = [5.0, -1.0, -2.0]
+    mask = np.array([False, True, True])
+    chosen = {table.choose_action('s', epsilon, mask) for _ in range(200)}
+    assert chosen == ({'b'} if epsilon else {'b', 'c'})
+
+
+def test_learn_bootstraps_from_valid_actions_only():
+    table = QLearningTable(ACTIONS, learning_rate=1.0, discount_factor=0.5)
+    table.q_values[table.state_id('next')] = [10.0, -4.0, -2.0]
+    table.learn('s', 'a', 1.0, 'next', mask=np.array([False, True, True]))
+    assert table.q_values[table.state_id('s'), 0] == 1.0 + 0.5 * -2.0
+
+
+def test_learn_batch_masks_next_actions_with_bitmasks():
+    table = QLearningTable(ACTIONS, learning_rate=1.0, discount_factor=0.5)
+    state, next_state = table.state_id('s'), table.state_id('next')
+    table.q_values[next_state] = [10.0, -4.0, -2.0]
+    next_masks = np.array([q_table.mask_bits([False, True, False]), q_table.mask_bits(None)],
+                          dtype=q_table.MASK_DTYPE)
+    table.learn_batch(np.array([state, state]), np.array([1, 2]), np.array([1.0, 1.0]),
+                      np.array([next_state, next_state]), np.array([False, False]), next_masks)
+    # only b is valid in the first transition's next state, every action in the second
+    np.testing.assert_array_equal(table.q_values[state], [0.0, 1.0 + 0.5 * -4.0, 1.0 + 0.5 * 10.0])
+
+    single = QLearningTable(ACTIONS, learning_rate=1.0, discount_factor=0.5)
+    single.q_values[single.state_id('next')] = [10.0, -4.0, -2.0]
+    single.learn('s', 'b', 1.0, 'next', mask=np.array([False, True, False]))
+    assert single.q_values[single.state_id('s'), 1] == table.q_values[state, 1]
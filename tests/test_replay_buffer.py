@@ -0,0 +1,35 @@
+import numpy as np
+from replay_buffer import ReplayBuffer
+
+
+def test_drop_states_keeps_the_rest_in_order():
+    replay = ReplayBuffer(4)
+    for i in range(6):
+        replay.add(i, 0, float(i), i + 1, terminal=i == 3)
+    # holds transitions 2..5, 3 is terminal so its next state 4 doesn't count
+    replay.drop_states([4])
+    assert replay.state_ids[:len(replay)].tolist() == [2, 3, 5]
+    assert replay.rewards[:len(replay)].tolist() == [2.0, 3.0, 5.0]
+    replay.add(9, 0, 9.0, 10, False)
+    assert replay.state_ids[:len(replay)].tolist() == [2, 3, 5, 9]
+
+
+def test_sample_draws_stored_transitions():
+    replay = ReplayBuffer(8)
+    for i in range(5):
+        replay.add(i, i % 2, float(i), i + 1, False)
+    state_ids, action_ids, rewards, next_state_ids, terminals, next_masks = replay.sample(64)
+    assert set(state_ids.tolist()) <= set(range(5))
+    np.testing.assert_array_equal(rewards, state_ids)
+    np.testing.assert_array_equal(next_state_ids, state_ids + 1)
+
+
+def test_sample_is_reproducible_with_a_seed():
+    batches = []
+    for _ in range(2):
+        replay = ReplayBuffer(8, seed=3)
+        for i in range(8):
+            replay.add(i, 0, float(i), i + 1, False)
+        np.random.seed(len(batches))
+        batches.append(replay.sample(16)[0])
+    np.testing.assert_array_equal(batches[0], batches[1])
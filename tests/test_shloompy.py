@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+from pysc2.lib import units
+from sc2.game_state import GameState
+from sc2.ids.unit_typeid import UnitTypeId
+import benchmark
+import fake_sc2_env
+import offline_sc2
+from build_order import BuildOrder
+from Shloompy_Bot import Shloompy
+
+STEPS = [{'id': 'gateway', 'item': 'GATEWAY'},
+         {'id': 'cybernetics_core', 'item': 'CYBERNETICSCORE'},
+         {'id': 'forge', 'item': 'FORGE'}]
+
+
+def test_reopen_reevaluates_finished_steps_of_the_type():
+    build = BuildOrder(SimpleNamespace(), STEPS, {'slot': None})
+    for step_id in ('gateway', 'cybernetics_core'):
+        build.finish(build.by_id[step_id])
+    assert [step.id for step in build.frontier] == ['forge']
+
+    build.reopen(UnitTypeId.GATEWAY)
+    assert not build.by_id['gateway'].done and build.by_id['cybernetics_core'].done
+    assert [step.id for step in build.frontier] == ['gateway', 'forge']
+    assert build.cursor == 0
+
+
+def test_destroyed_structure_reopens_its_build_step():
+    env = benchmark.scenario_env(benchmark.SCENARIOS[0])
+    recorded = offline_sc2.recording(env)
+    bot = Shloompy()
+    bot.map_analysis.cache_dir = None
+    loop = asyncio.new_event_loop()
+    try:
+        offline_sc2.start_bot(bot, recorded, loop)
+        loop.run_until_complete(bot.build_order.step())
+        gateway_step = bot.build_order.by_id['gateway']
+        assert gateway_step.done
+
+        row = next(row for row in range(env.n) if env.units[row, fake_sc2_env.UNIT_TYPE] == units.Protoss.Gateway
+                   and env.units[row, fake_sc2_env.ALLIANCE] == fake_sc2_env.SELF)
+        tag = int(env.units[row, fake_sc2_env.TAG])
+        env.remove_units([row])
+        observation = offline_sc2.observation(env)
+        observation.observation.game_loop = recorded[2].observation.game_loop + 1
+        observation.observation.raw_data.event.dead_units.append(tag)
+        bot._prepare_step(state=GameState(observation), proto_game_info=recorded[1])
+        loop.run_until_complete(bot.issue_events())
+    finally:
+        loop.close()
+    assert not gateway_step.done
@@ -0,0 +1,43 @@
+import bisect
+import numpy as np
+import pytest
+from state_encoding import PROTOSS_STATE_ENCODER, PROTOSS_LINEAR_STATE_ENCODER
+
+ENCODERS = {'tabular': PROTOSS_STATE_ENCODER, 'linear': PROTOSS_LINEAR_STATE_ENCODER}
+
+
+def bucket_floor(field, value):
+    value = min(max(value, 0), field.max_value)
+    return field.edges[bisect.bisect_right(field.edges, value) - 1]
+
+
+@pytest.mark.parametrize('encoder', ENCODERS.values(), ids=ENCODERS.keys())
+def test_keys_fit_a_positive_int64(encoder):
+    assert encoder.bits <= 63
+    top = encoder.encode([10 ** 9] * len(encoder.fields))
+    assert top < 2 ** 63 and np.int64(top) > 0
+
+
+@pytest.mark.parametrize('encoder', ENCODERS.values(), ids=ENCODERS.keys())
+def test_every_field_round_trips_next_to_every_other(encoder):
+    rng = np.random.RandomState(0)
+    for i, field in enumerate(encoder.fields):
+        above = [field.max_value + 1, 10 * field.max_value + 7]
+        for value in list(field.edges) + [edge + 1 for edge in field.edges] + above + [-1, -100]:
+            # the other fields at random values, including out of range ones, must not bleed into this one
+            values = [int(rng.randint(-5, other.max_value + 20)) for other in encoder.fields]
+            values[i] = value
+            decoded = encoder.decode(encoder.encode(values))
+            assert decoded == tuple(bucket_floor(other, v) for other, v in zip(encoder.fields, values)), \
+                (field.name, value)
+
+
+@pytest.mark.parametrize('encoder', ENCODERS.values(), ids=ENCODERS.keys())
+def test_distinct_buckets_give_distinct_keys(encoder):
+    keys = set()
+    for i, field in enumerate(encoder.fields):
+        for edge in field.edges:
+            values = [0] * len(encoder.fields)
+            values[i] = edge
+            keys.add(encoder.encode(values))
+    assert len(keys) == 1 + sum(len(field.edges) - 1 for field in encoder.fields)
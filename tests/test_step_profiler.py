@@ -0,0 +1,25 @@
+import json
+import threading
+from step_profiler import StepProfiler
+
+
+def test_threads_time_a_phase_with_their_own_phase_objects(tmp_path):
+    profiler = StepProfiler('agent', str(tmp_path), trace=True, verbose=False)
+    phases = []
+
+    def learn():
+        with profiler.phase('learn') as phase:
+            phases.append(phase)
+
+    with profiler.phase('learn') as phase:
+        worker = threading.Thread(target=learn)
+        worker.start()
+        worker.join()
+    assert phases[0] is not phase
+    assert phases[0] is not profiler.phase('learn')
+
+    summary = profiler.end_game()
+    assert summary['learn']['calls'] == 2
+    with open(tmp_path / 'agent_game1.trace.json') as f:
+        events = json.load(f)['traceEvents']
+    assert sorted(event['tid'] for event in events) == [0, 1]
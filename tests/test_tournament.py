@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import pytest
+import tournament
+from tournament import Game, Tournament
+
+# per-test directory the stubbed games leave their marks in, set before the workers fork
+MARKS = None
+
+
+def mark(game, name):
+    path = os.path.join(MARKS, '%s.%s' % (game.id, name))
+    count = int(open(path).read()) if os.path.exists(path) else 0
+    with open(path, 'w') as f:
+        f.write(str(count + 1))
+    return count + 1
+
+
+def play_stub(game, checkpoint=None):
+    attempt = mark(game, 'played')
+    if game.map_name == 'crash_once' and attempt == 1:
+        raise RuntimeError('lost connection to SC2')
+    if game.map_name == 'exit':
+        os._exit(3)
+    if game.map_name == 'hang':
+        # stands in for the SC2 client the game launches
+        client = subprocess.Popen(['sleep', '600'])
+        with open(os.path.join(MARKS, 'client.pid'), 'w') as f:
+            f.write(str(client.pid))
+        time.sleep(600)
+    return 'Victory'
+
+
+def game(map_name, seed=0):
+    return Game('random-zerg-hard-%s-%d' % (map_name, seed), 'random', 'zerg', 'hard', map_name, seed)
+
+
+def is_running(pid):
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+@pytest.fixture
+def stubbed(tmp_path, monkeypatch):
+    monkeypatch.setattr(tournament, 'play_pysc2', play_stub)
+    monkeypatch.setattr(tournament, 'play_shloompy', play_stub)
+    monkeypatch.setattr(sys.modules[__name__], 'MARKS', str(tmp_path))
+    return tmp_path
+
+
+def played(tmp_path, game):
+    path = tmp_path / ('%s.played' % game.id)
+    return int(path.read_text()) if path.exists() else 0
+
+
+def test_crashed_games_are_played_again(stubbed):
+    games = [game('win'), game('crash_once'), game('exit')]
+    results_path = str(stubbed / 'results.jsonl')
+    summary = Tournament(games, 2, results_path, retries=1).run()
+
+    records = tournament.load_results(results_path)
+    assert [records[g.id]['result'] for g in games] == ['Victory', 'Victory', 'Crash']
+    assert [records[g.id]['attempts'] for g in games] == [1, 2, 2]
+    assert records[games[2].id]['error'] == 'exited with code 3'
+    assert summary['random/zerg/hard/exit']['Crash'] == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'killpg'), reason='needs process groups')
+def test_timed_out_game_is_killed_with_its_client(stubbed):
+    hung = game('hang')
+    Tournament([hung], 1, str(stubbed / 'results.jsonl'), retries=0, game_timeout=1, stop_grace=1).run()
+
+    record = tournament.load_results(str(stubbed / 'results.jsonl'))[hung.id]
+    assert (record['result'], record['error']) == ('Timeout', 'timed out')
+    client = int((stubbed / 'client.pid').read_text())
+    for _ in range(50):
+        if not is_running(client):
+            break
+        time.sleep(0.1)
+    assert not is_running(client)
+
+
+def test_resume_skips_finished_games(stubbed):
+    games = [game('win', seed) for seed in range(3)]
+    results_path = stubbed / 'results.jsonl'
+    lines = [dict(games[0]._asdict(), result='Victory', attempts=1, seconds=1.0),
+             dict(games[1]._asdict(), result='Crash', attempts=2, seconds=1.0, error='exited with code 3')]
+    # the last line was cut short by a killed run
+    results_path.write_text(''.join(json.dumps(line) + '\n' for line in lines) + '{"id": "random-zer')
+
+    summary = Tournament(games, 2, str(results_path)).run()
+    assert [played(stubbed, g) for g in games] == [0, 1, 1]
+    assert summary['random/zerg/hard/win']['Victory'] == 3
+    assert summary['random/zerg/hard/win']['Crash'] == 0
+
+
+def test_summarize_counts_results_and_win_rate():
+    records = [dict(game('a', seed)._asdict(), result=result)
+               for seed, result in enumerate(['Victory', 'Victory', 'Defeat', 'Tie', 'Crash', 'Timeout'])]
+    records.append(dict(game('b')._asdict(), result='Defeat'))
+    summary = tournament.summarize(records)
+
+    entry = summary['random/zerg/hard/a']
+    assert (entry['games'], entry['Victory'], entry['Defeat'], entry['Tie'], entry['Crash'], entry['Timeout']) == \
+        (6, 2, 1, 1, 1, 1)
+    assert entry['win_rate'] == 0.5
+    assert summary['random/zerg/hard/b']['win_rate'] == 0.0
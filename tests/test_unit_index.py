@@ -0,0 +1,16 @@
+from pysc2.lib import features, units
+import fake_sc2_env
+from fake_sc2_env import FakeSC2Env
+from unit_index import UnitIndex
+
+
+def test_counts_are_kept_apart_for_every_alliance():
+    env = FakeSC2Env(seed=0)
+    raw_units = env.reset()[0].observation.raw_units
+    index = UnitIndex(raw_units)
+    for alliance in features.PlayerRelative:
+        for unit_type in (units.Protoss.Probe, units.Protoss.Nexus, units.Neutral.MineralField):
+            expected = sum(1 for row in raw_units
+                           if row[fake_sc2_env.ALLIANCE] == alliance and row[fake_sc2_env.UNIT_TYPE] == unit_type)
+            assert index.count(alliance, unit_type) == expected
+    assert index.count(features.PlayerRelative.SELF, units.Protoss.Probe) == 12
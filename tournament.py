@@ -0,0 +1,267 @@
+from pysc2.env import sc2_env
+from absl import app, flags
+from collections import namedtuple
+import multiprocessing as mp
+import numpy as np
+import json
+import os
+import queue
+import random
+import signal
+import time
+import traceback
+import pysc2_bot
+
+FLAGS = flags.FLAGS
+flags.DEFINE_list("bots", ["shloompy"], "Bots to evaluate: shloompy, rl, random.")
+flags.DEFINE_list("races", ["terran", "zerg", "protoss"], "Opponent races.")
+flags.DEFINE_list("difficulties", ["hard"], "Opponent difficulties, as in pysc2's sc2_env.Difficulty.")
+flags.DEFINE_list("maps", [], "Maps to play, default AbyssalReefLE for shloompy and Simple64 for the pysc2 agents.")
+flags.DEFINE_integer("games", 1, "Games (seeds) per bot, race, difficulty and map.")
+flags.DEFINE_integer("first_seed", 0, "Seed of the first game of every combination.")
+flags.DEFINE_integer("concurrency", max(mp.cpu_count() // 2, 1), "Games running at the same time.")
+flags.DEFINE_integer("retries", 1, "Times a crashed or timed out game is played again.")
+flags.DEFINE_integer("game_timeout", 3600, "Seconds before a game's process is killed.")
+flags.DEFINE_string("results", "tournament.jsonl", "JSON-lines file results are streamed to, games finished in it "
+                                                   "are skipped when the tournament is run again.")
+
+# seconds a stopped game gets to shut its SC2 instance down after SIGINT before its process group is killed
+STOP_GRACE = 10
+DEFAULT_MAPS = {'shloompy': 'AbyssalReefLE', 'rl': 'Simple64', 'random': 'Simple64'}
+RESULTS = ('Victory', 'Defeat', 'Tie')
+
+Game = namedtuple('Game', ['id', 'bot', 'race', 'difficulty', 'map_name', 'seed'])
+
+
+def game_matrix(bots, races, difficulties, maps, games, first_seed=0):
+    '''
+    :param maps: map names, or an empty list for every bot's default map
+    :return: one Game per combination of bot, race, difficulty, map and seed
+    '''
+    return [Game('%s-%s-%s-%s-%d' % (bot, race, difficulty, map_name, seed), bot, race, difficulty, map_name, seed)
+            for bot in bots for map_name in (maps or [DEFAULT_MAPS[bot]])
+            for race in races for difficulty in difficulties for seed in range(first_seed, first_seed + games)]
+
+
+def camel(name):
+    return ''.join(part.capitalize() for part in name.split('_'))
+
+
+def play_shloompy(game):
+    import sc2
+    from sc2.player import Bot, Computer
+    from Shloompy_Bot import Shloompy
+
+    result = sc2.run_game(
+        sc2.maps.get(game.map_name),
+        [Bot(sc2.Race.Protoss, Shloompy()), Computer(sc2.Race[camel(game.race)], sc2.Difficulty[camel(game.difficulty)])],
+        realtime=False,
+        random_seed=game.seed
+    )
+    return result.name
+
+
+def play_pysc2(game, checkpoint=None):
+    random.seed(game.seed)
+    np.random.seed(game.seed)
+    if game.bot == 'rl':
+        agent = pysc2_bot.rlAgent()
+        if checkpoint:
+            agent.q_table.load(checkpoint)
+    else:
+        agent = pysc2_bot.RandomAgent()
+    with pysc2_bot.make_env(game.map_name, sc2_env.Race[game.race], sc2_env.Difficulty[game.difficulty],
+                            game.seed) as env:
+        agent.setup(env.observation_spec()[0], env.action_spec()[0])
+        timestep = env.reset()[0]
+        agent.reset()
+        while not timestep.last():
+            timestep = env.step([agent.step(timestep)])[0]
+        agent.step(timestep)
+    return {1: 'Victory', -1: 'Defeat'}.get(int(timestep.reward), 'Tie')
+
+
+def play_game(game, outbox, checkpoint=None):
+    '''
+    Plays one game in a worker process and reports ('result', game id, result name) or ('error', game id,
+    traceback) on outbox. The worker leads a process group of its own, so stop_game() also reaches the SC2 instance
+    it launches.
+    :param checkpoint: Q-table checkpoint the rl agent starts from
+    '''
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    try:
+        if not FLAGS.is_parsed():
+            FLAGS.mark_as_parsed()
+        result = play_shloompy(game) if game.bot == 'shloompy' else play_pysc2(game, checkpoint)
+        outbox.put(('result', game.id, result))
+    except Exception:
+        outbox.put(('error', game.id, traceback.format_exc()))
+
+
+def signal_game(process, signum):
+    try:
+        os.killpg(process.pid, signum)
+    except ProcessLookupError:
+        # the group is gone, or the worker hasn't called setsid yet
+        if process.is_alive():
+            os.kill(process.pid, signum)
+
+
+def stop_game(process, grace=STOP_GRACE):
+    '''
+    Stops a game's worker and whatever it started. SIGINT first, the only signal python-sc2's kill switch cleans up
+    its SC2 client on, then SIGKILL to the whole process group after grace seconds. Where process groups don't exist
+    (Windows) the worker alone is terminated.
+    '''
+    if not hasattr(os, 'killpg'):
+        process.terminate()
+        process.join(timeout=grace)
+        return
+    if process.is_alive():
+        signal_game(process, signal.SIGINT)
+        process.join(timeout=grace)
+    signal_game(process, signal.SIGKILL)
+    process.join(timeout=1)
+
+
+def load_results(path):
+    '''
+    :return: the records already in path, by game id. A line cut short by a killed run is ignored.
+    '''
+    records = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record['id']] = record
+    return records
+
+
+def summarize(records):
+    '''
+    :return: {"bot/race/difficulty/map": counts of every result, games and win_rate over the finished games}
+    '''
+    summary = {}
+    for record in records:
+        key = '/'.join((record['bot'], record['race'], record['difficulty'], record['map_name']))
+        entry = summary.setdefault(key, dict({result: 0 for result in RESULTS}, Crash=0, Timeout=0, games=0))
+        entry[record['result']] = entry.get(record['result'], 0) + 1
+        entry['games'] += 1
+    for entry in summary.values():
+        finished = sum(entry[result] for result in RESULTS)
+        entry['win_rate'] = entry['Victory'] / finished if finished else 0.0
+    return summary
+
+
+class Tournament:
+    '''
+    Plays a matrix of games with at most concurrency games at a time, one process per game, so a game that
+    crashes or hangs its SC2 instance only takes its own process down. Crashed, failed and timed out games are
+    played again up to retries times. Every finished game is appended to the results file right away; games
+    already finished in it are skipped, so an interrupted tournament picks up where it stopped and a second run
+    only replays the games that crashed.
+    '''
+
+    def __init__(self, games, concurrency, results_path=None, retries=1, game_timeout=3600, checkpoint=None,
+                 stop_grace=STOP_GRACE):
+        self.games = games
+        self.concurrency = concurrency
+        self.results_path = results_path
+        self.retries = retries
+        self.game_timeout = game_timeout
+        self.checkpoint = checkpoint
+        self.stop_grace = stop_grace
+        self.records = load_results(results_path)
+
+    def record(self, game, result, attempts, seconds, error=None):
+        record = dict(game._asdict(), result=result, attempts=attempts, seconds=round(seconds, 1))
+        if error:
+            record['error'] = error
+        self.records[game.id] = record
+        if self.results_path:
+            with open(self.results_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        print('%-50s %-8s %6.0fs' % (game.id, result, seconds))
+
+    def run(self):
+        '''
+        :return: summarize() of every game in the matrix that has a record
+        '''
+        pending = [game for game in self.games if self.records.get(game.id, {}).get('result') not in RESULTS]
+        pending.reverse()
+        attempts = {}
+        running = {}
+        outbox = mp.Queue()
+        try:
+            while pending or running:
+                while pending and len(running) < self.concurrency:
+                    game = pending.pop()
+                    attempts[game.id] = attempts.get(game.id, 0) + 1
+                    process = mp.Process(target=play_game, args=(game, outbox, self.checkpoint), daemon=True)
+                    process.start()
+                    running[game.id] = (game, process, time.time())
+
+                try:
+                    kind, game_id, payload = outbox.get(timeout=1)
+                except queue.Empty:
+                    kind, game_id, payload = None, None, None
+                if game_id in running:
+                    game, process, start = running.pop(game_id)
+                    process.join(timeout=10)
+                    if kind == 'result':
+                        self.record(game, payload, attempts[game_id], time.time() - start)
+                    else:
+                        self.retry(game, 'Crash', attempts[game_id], time.time() - start, payload, pending)
+
+                # a process killed by a crashing game never reports, a hung one never ends
+                for game_id, (game, process, start) in list(running.items()):
+                    timed_out = time.time() - start > self.game_timeout
+                    if timed_out or not process.is_alive():
+                        # a crashed worker may still leave its SC2 instance behind
+                        stop_game(process, self.stop_grace)
+                        if not outbox.empty():
+                            # its report may still be in the queue, handled on the next turn
+                            continue
+                        del running[game_id]
+                        error = 'timed out' if timed_out else 'exited with code %s' % process.exitcode
+                        self.retry(game, 'Timeout' if timed_out else 'Crash', attempts[game_id], time.time() - start,
+                                   error, pending)
+        finally:
+            for game, process, _ in running.values():
+                stop_game(process, self.stop_grace)
+        return summarize(self.records[game.id] for game in self.games if game.id in self.records)
+
+    def retry(self, game, result, attempts, seconds, error, pending):
+        if attempts <= self.retries:
+            print('%-50s %s, playing it again: %s' % (game.id, result, error.strip().splitlines()[-1]))
+            pending.append(game)
+        else:
+            self.record(game, result, attempts, seconds, error)
+
+
+def format_summary(summary):
+    lines = ['%-50s %6s %8s %7s %5s %6s %8s' % ('bot/race/difficulty/map', 'games', 'victory', 'defeat', 'tie',
+                                                  'crash', 'win rate')]
+    for key, entry in sorted(summary.items()):
+        lines.append('%-50s %6d %8d %7d %5d %6d %7.1f%%' % (key, entry['games'], entry['Victory'], entry['Defeat'],
+                                                            entry['Tie'], entry['Crash'] + entry['Timeout'],
+                                                            100 * entry['win_rate']))
+    return '\n'.join(lines)
+
+
+def main(unused_argv):
+    games = game_matrix(FLAGS.bots, FLAGS.races, FLAGS.difficulties, FLAGS.maps, FLAGS.games, FLAGS.first_seed)
+    tournament = Tournament(games, FLAGS.concurrency, FLAGS.results, FLAGS.retries, FLAGS.game_timeout,
+                            FLAGS.checkpoint)
+    start = time.time()
+    summary = tournament.run()
+    print(format_summary(summary))
+    print("%d games in %.0fs" % (len(games), time.time() - start))
+
+
+if __name__ == "__main__":
+    app.run(main)
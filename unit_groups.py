@@ -0,0 +1,108 @@
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.units import Units
+from spatial_index import SpatialGrid
+
+
+class UnitGroupCache:
+    '''
+    Per-step memo of the unit groups and pending counts a python-sc2 bot's decision code asks for. Own structures
+    and units are bucketed by type in one pass, ready / idle subsets and already_pending counts are computed on
+    first use, and everything is dropped as soon as the bot's game loop advances, so callers never see a stale
+    group and never need to invalidate it themselves.
+    Returned Units are shared between callers for the rest of the step, so they must not be mutated.
+    '''
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.game_loop = None
+        self._cache = {}
+
+    def _memo(self, key, compute):
+        game_loop = self.bot.state.game_loop
+        if game_loop != self.game_loop:
+            self.game_loop = game_loop
+            self._cache = {}
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _buckets(self, name, collection):
+        def bucket():
+            buckets = {}
+            for unit in collection():
+                buckets.setdefault(unit.type_id, []).append(unit)
+            return buckets
+        return self._memo(name, bucket)
+
+    def structures(self, type_id):
+        '''
+        :return: all own structures of type_id, like bot.structures(type_id)
+        '''
+        return self._memo(('structures', type_id), lambda: Units(
+            self._buckets('structure_buckets', lambda: self.bot.structures).get(type_id, []), self.bot))
+
+    def ready(self, type_id):
+        return self._memo(('ready', type_id), lambda: self.structures(type_id).ready)
+
+    def idle(self, type_id):
+        '''
+        :return: ready structures of type_id without orders
+        '''
+        return self._memo(('idle', type_id), lambda: self.ready(type_id).idle)
+
+    def units(self, type_id):
+        '''
+        :return: all own non-structure units of type_id, like bot.units(type_id)
+        '''
+        return self._memo(('units', type_id), lambda: Units(
+            self._buckets('unit_buckets', lambda: self.bot.units).get(type_id, []), self.bot))
+
+    def army(self):
+        '''
+        :return: own units that are neither structures nor probes
+        '''
+        return self._memo('army', lambda: self.bot.units.not_structure.exclude_type(UnitTypeId.PROBE))
+
+    def pending(self, type_id):
+        return self._memo(('pending', type_id), lambda: self.bot.already_pending(type_id))
+
+    def pending_upgrade(self, upgrade_id):
+        return self._memo(('pending_upgrade', upgrade_id), lambda: self.bot.already_pending_upgrade(upgrade_id))
+
+    def spatial(self, name):
+        '''
+        :param name: a Units attribute of the bot, e.g. 'workers', 'vespene_geyser' or 'gas_buildings'
+        :return: a UnitGrid over that group, built once per step
+        '''
+        return self._memo(('spatial', name), lambda: UnitGrid(getattr(self.bot, name), self.bot))
+
+
+class UnitGrid:
+    '''
+    A group of python-sc2 units with a SpatialGrid over their positions, answering closer_than / closest_to /
+    nearest without measuring the distance to every unit of the group.
+    '''
+
+    def __init__(self, units, bot):
+        self.units = units
+        self.bot = bot
+        self.grid = SpatialGrid([unit.position for unit in units])
+
+    def __len__(self):
+        return len(self.units)
+
+    def closer_than(self, distance, point):
+        return Units([self.units[i] for i in self.grid.radius(point, distance).tolist()], self.bot)
+
+    def closest_to(self, point):
+        '''
+        :return: the unit closest to point, None for an empty group
+        '''
+        index = self.grid.closest(point)
+        return None if index is None else self.units[index]
+
+    def nearest(self, point, k):
+        '''
+        :return: up to k units, closest to point first
+        '''
+        return [self.units[i] for i in self.grid.nearest(point, k)]
@@ -0,0 +1,128 @@
+from pysc2.lib import features
+import numpy as np
+from spatial_index import SpatialGrid
+
+# one slot per PlayerRelative value, alliance values index into it
+ALLIANCE_SLOTS = len(features.PlayerRelative)
+
+
+class UnitIndex:
+    '''
+    Groups obs.observation.raw_units by (alliance, unit_type, completed) once per observation, so every unit query
+    of an agent step is a dict lookup instead of a scan over all raw units. Proximity queries go through a
+    SpatialGrid per group, built on first use from the positions of the group's rows.
+    Unit lists are built lazily, cached and shared between callers, so they must not be mutated.
+    '''
+
+    def __init__(self, raw_units):
+        self.raw_units = raw_units
+        self._groups = {}
+        self._units = {}
+        self._grids = {}
+
+        data = np.asarray(raw_units)
+        if len(data) == 0:
+            self.data = np.zeros((0, len(features.FeatureUnit)), dtype=np.int64)
+            self.positions = np.zeros((0, 2))
+            return
+        self.data = data
+        self.positions = data[:, [features.FeatureUnit.x, features.FeatureUnit.y]].astype(float)
+        unit_type = data[:, features.FeatureUnit.unit_type].astype(np.int64)
+        alliance = data[:, features.FeatureUnit.alliance].astype(np.int64)
+        completed = data[:, features.FeatureUnit.build_progress] == 100
+        keys = (unit_type * ALLIANCE_SLOTS + alliance) * 2 + completed
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(sorted_keys)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            self._groups[int(sorted_keys[start])] = order[start:end]
+
+    def _rows(self, alliance, unit_type, completed):
+        key = (int(unit_type) * ALLIANCE_SLOTS + int(alliance)) * 2
+        if completed is None:
+            done = self._groups.get(key + 1)
+            in_progress = self._groups.get(key)
+            if done is None or in_progress is None:
+                return in_progress if done is None else done
+            return np.sort(np.concatenate((done, in_progress)))
+        return self._groups.get(key + bool(completed))
+
+    def units(self, alliance, unit_type, completed=None):
+        '''
+        :param alliance: a features.PlayerRelative value
+        :param unit_type: a units.* unit type
+        :param completed: True for build_progress == 100 only, False for in-progress only, None for both
+        :return: the matching raw unit rows, in raw_units order
+        '''
+        cache_key = (alliance, unit_type, completed)
+        found = self._units.get(cache_key)
+        if found is None:
+            rows = self._rows(alliance, unit_type, completed)
+            found = [] if rows is None else [self.raw_units[i] for i in rows.tolist()]
+            self._units[cache_key] = found
+        return found
+
+    def units_of_types(self, alliance, unit_types, completed=None):
+        '''
+        :return: the matching raw unit rows of any of unit_types, in raw_units order
+        '''
+        rows = [self._rows(alliance, unit_type, completed) for unit_type in unit_types]
+        rows = [r for r in rows if r is not None]
+        if not rows:
+            return []
+        return [self.raw_units[i] for i in np.sort(np.concatenate(rows)).tolist()]
+
+    def column(self, alliance, unit_type, column, completed=None):
+        '''
+        :param column: a features.FeatureUnit field
+        :return: that field of the matching raw units as an array, in raw_units order, without building unit rows
+        '''
+        rows = self._rows(alliance, unit_type, completed)
+        return self.data[rows if rows is not None else [], column]
+
+    def count(self, alliance, unit_type, completed=None):
+        rows = self._rows(alliance, unit_type, completed)
+        return 0 if rows is None else len(rows)
+
+    def grid(self, alliance, unit_types, completed=None):
+        '''
+        :param unit_types: a units.* unit type or a list / tuple of them
+        :return: (rows, SpatialGrid) where grid index i is raw_units row rows[i], rows in raw_units order
+        '''
+        types = tuple(unit_types) if isinstance(unit_types, (tuple, list)) else (unit_types,)
+        cache_key = (alliance, types, completed)
+        found = self._grids.get(cache_key)
+        if found is None:
+            rows = [self._rows(alliance, unit_type, completed) for unit_type in types]
+            rows = [r for r in rows if r is not None]
+            rows = np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+            found = (rows, SpatialGrid(self.positions[rows]))
+            self._grids[cache_key] = found
+        return found
+
+    def closest(self, alliance, unit_types, xy, completed=None):
+        '''
+        :return: the matching raw unit row closest to xy (the first one in raw_units order on a tie), None if none
+        '''
+        rows, grid = self.grid(alliance, unit_types, completed)
+        index = grid.closest(xy)
+        return None if index is None else self.raw_units[int(rows[index])]
+
+    def within(self, alliance, unit_types, xy, distance, completed=None):
+        '''
+        :return: the matching raw unit rows within distance of xy, in raw_units order
+        '''
+        rows, grid = self.grid(alliance, unit_types, completed)
+        return [self.raw_units[i] for i in rows[grid.radius(xy, distance)].tolist()]
+
+    def farthest(self, alliance, unit_types, xy, completed=None):
+        '''
+        :return: the matching raw unit row farthest from xy, None if none
+        '''
+        rows, grid = self.grid(alliance, unit_types, completed)
+        if not len(rows):
+            return None
+        offsets = grid.positions - xy
+        return self.raw_units[int(rows[np.argmax(np.einsum('ij,ij->i', offsets, offsets))])]
@@ -0,0 +1,114 @@
+from sc2.ids.unit_typeid import UnitTypeId
+from sc2.position import Point2
+import numpy as np
+from placement_planner import POWER_RADIUS
+from spatial_index import SpatialGrid
+
+# warp-in points are at least this far apart, and this far from any unit standing in the field
+POINT_SPACING = 1.5
+UNIT_CLEARANCE = 1.0
+
+
+class WarpInPool:
+    '''
+    Warp-in bookkeeping for one step of a python-sc2 bot. The available abilities of all warpgates are fetched
+    with one batched query per step, and every completed pylon keeps a precomputed list of spaced warp-in points
+    inside its power field (rebuilt only when the placement planner's occupancy changes). A round of warp-ins
+    then needs a single engine round-trip and no placement queries; units blocking the points are looked up in a
+    per-step grid, so only those standing near a pylon are measured.
+    Warpgates and points handed out are remembered until the next step, so several calls in one step never reuse
+    either.
+    '''
+
+    def __init__(self, bot, placement):
+        self.bot = bot
+        self.placement = placement
+        self.points = {}
+        self.points_version = {}
+        self.game_loop = None
+        self.abilities = None
+        self.used_warpgates = set()
+        self.used_points = []
+        self.ground_units = None
+
+    def _new_step(self):
+        game_loop = self.bot.state.game_loop
+        if game_loop != self.game_loop:
+            self.game_loop = game_loop
+            self.abilities = None
+            self.used_warpgates = set()
+            self.used_points = []
+            self.ground_units = None
+
+    async def ready_warpgates(self, ability):
+        '''
+        :return: the ready warpgates that can use ability this step and haven't been used yet
+        '''
+        self._new_step()
+        warpgates = self.bot.groups.ready(UnitTypeId.WARPGATE)
+        if self.abilities is None:
+            self.abilities = {}
+            if warpgates:
+                abilities = await self.bot.get_available_abilities(warpgates)
+                self.abilities = {warpgate.tag: set(available) for warpgate, available in zip(warpgates, abilities)}
+        return [warpgate for warpgate in warpgates
+                if warpgate.tag not in self.used_warpgates and ability in self.abilities.get(warpgate.tag, ())]
+
+    def _pylon_points(self, anchor):
+        if self.points_version.get(anchor.tag) == self.placement.version:
+            return self.points[anchor.tag]
+        cx, cy = anchor.center
+        reach = int(POWER_RADIUS) + 1
+        xs, ys = np.meshgrid(np.arange(int(cx) - reach, int(cx) + reach + 1),
+                             np.arange(int(cy) - reach, int(cy) + reach + 1))
+        height, width = self.placement.placeable.shape
+        inside = (xs >= 0) & (ys >= 0) & (xs < width) & (ys < height)
+        xs, ys = xs[inside], ys[inside]
+        distance = np.hypot(xs + 0.5 - cx, ys + 0.5 - cy)
+        free = ((distance <= POWER_RADIUS - 0.5) & self.placement.placeable[ys, xs]
+                & (self.placement.occupied[ys, xs] == 0))
+        candidates = np.stack((xs[free] + 0.5, ys[free] + 0.5), axis=1)[np.argsort(distance[free])]
+
+        points = []
+        for point in candidates:
+            if all(np.hypot(*(point - kept)) >= POINT_SPACING for kept in points):
+                points.append(point)
+        self.points[anchor.tag] = np.array(points).reshape(-1, 2)
+        self.points_version[anchor.tag] = self.placement.version
+        return self.points[anchor.tag]
+
+    def take_points(self, count):
+        '''
+        :return: up to count free warp-in points, from pylons closest to the newest nexus first
+        '''
+        self._new_step()
+        if count <= 0:
+            return []
+        pylons = [anchor for anchor in self.placement.anchors.values() if anchor.powers]
+        if self.bot.townhalls:
+            last_nexus = self.bot.townhalls[-1].position
+            # walked closest first, pylons past the ones that fill the request are never measured
+            anchors = pylons
+            order = SpatialGrid([anchor.center for anchor in anchors]).ordered(last_nexus)
+            pylons = (anchors[i] for _, i in order)
+        if self.ground_units is None:
+            self.ground_units = SpatialGrid([unit.position for unit in self.bot.all_units.not_structure.not_flying])
+
+        taken = []
+        for anchor in pylons:
+            points = self._pylon_points(anchor)
+            nearby = self.ground_units.radius(anchor.center, POWER_RADIUS + UNIT_CLEARANCE)
+            blockers = np.concatenate((self.ground_units.positions[nearby],
+                                       np.array(self.used_points + taken, dtype=float).reshape(-1, 2)))
+            if len(points) and len(blockers):
+                gaps = np.hypot(points[:, None, 0] - blockers[None, :, 0], points[:, None, 1] - blockers[None, :, 1])
+                points = points[gaps.min(axis=1) >= UNIT_CLEARANCE]
+            points = points[:count - len(taken)]
+            taken.extend(Point2((x, y)) for x, y in points.tolist())
+            if len(taken) == count:
+                break
+        self.used_points.extend(taken)
+        return taken
+
+    def use(self, warpgate):
+        self.used_warpgates.add(warpgate.tag)